@@ -115,12 +115,35 @@ extern "C" int main(int argc, char **argv)
     PyObject *args = PyTuple_New(1);
     PyTuple_SetItem(args, 0, argsList);
 
-    py.functionCall(parser.value(functionOption).toUtf8().constData(), parser.value(scriptOption).toUtf8().constData(), args);
+    PyObject* result = py.functionCall(parser.value(functionOption).toUtf8().constData(), parser.value(scriptOption).toUtf8().constData(), args);
+
+    // A function that returns an integer sets the exit code, so scripts can report failure.
+    // Booleans are integers to Python too, but there True means success.
+    int exitCode = 0;
+    if (!result) {
+        exitCode = 1;
+    }
+    else {
+        if (PyBool_Check(result)) {
+            exitCode = (result == Py_True) ? 0 : 1;
+        }
+        else
+#if PY_MAJOR_VERSION < 3
+        if (PyInt_Check(result)) {
+            exitCode = (int) PyInt_AsLong(result);
+        }
+        else
+#endif
+        if (PyLong_Check(result)) {
+            exitCode = (int) PyLong_AsLong(result);
+        }
+        Py_DECREF(result);
+    }
 
     Py_DECREF(argsList);
     Py_DECREF(args);
 
     app.quit();
-    return 0;
+    return exitCode;
 }
 
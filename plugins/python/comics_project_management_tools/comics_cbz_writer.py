@@ -0,0 +1,118 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+The CBZ writer lets the exporter add pages to the cbz as soon as they are exported,
+instead of copying all of them over at the end.
+
+By default pages are stored as is, as png and jpeg are already compressed. For formats
+that aren't, the pages can be deflated. The pages are then written on a background thread
+(zlib doesn't hold the interpreter lock while compressing), so the compression happens
+while the next pages are exported, and the pages are still written to the archive in order.
+"""
+
+import os
+import zipfile
+import concurrent.futures
+from pathlib import Path
+
+
+class cbz_writer():
+    url = str()
+    compress = False
+    archive = None
+    pool = None
+    pending = []
+    names = set()
+
+    def __init__(self, url=str(), compress=False, level=6):
+        self.url = url
+        self.compress = compress
+        self.level = level
+        self.pending = []
+        self.names = set()
+        # Write to a temporary name, so a failed export doesn't replace the previous cbz.
+        self.archive = zipfile.ZipFile(url + ".part", mode="w", compression=zipfile.ZIP_STORED)
+        # A single thread, as a zip file can only have one entry written at a time.
+        if compress:
+            self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    """
+    Add a page to the archive. Pages end up in the archive in the order they are added.
+    A page that is already in the archive, like a shared duplicate, isn't added twice.
+    """
+
+    def add_page(self, location):
+        if Path(location).exists() is False or Path(location).name in self.names:
+            return
+        self.names.add(Path(location).name)
+        if self.pool is None:
+            self.write_page(location, Path(location).name)
+            return
+        self.pending.append(self.pool.submit(self.write_page, location, Path(location).name))
+        # Check the pages that are done, so errors don't wait until closing.
+        while len(self.pending) > 0 and self.pending[0].done():
+            self.pending.pop(0).result()
+
+    def write_page(self, location, name):
+        compression = zipfile.ZIP_STORED
+        if self.compress:
+            compression = zipfile.ZIP_DEFLATED
+        self.archive.write(location, name, compress_type=compression, compresslevel=self.level)
+
+    def write_pending(self):
+        while len(self.pending) > 0:
+            self.pending.pop(0).result()
+
+    """
+    Add a metadata file, these are always stored as they are small.
+    """
+
+    def add_file(self, location, name=None):
+        if name is None:
+            name = Path(location).name
+        self.write_pending()
+        self.archive.write(location, name, compress_type=zipfile.ZIP_STORED)
+
+    """
+    Write the remaining pages, close the archive and put it in place.
+    """
+
+    def close(self, comment=bytes()):
+        self.write_pending()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.archive.comment = comment
+        self.archive.close()
+        os.replace(self.url + ".part", self.url)
+
+    """
+    Throw away the archive, for when the export fails halfway.
+    """
+
+    def abort(self):
+        if self.pool is not None:
+            for future in self.pending:
+                future.cancel()
+            # The page being written has to finish before the archive can be closed.
+            self.pool.shutdown(wait=True)
+            self.pending = []
+        self.archive.close()
+        if os.path.exists(self.url + ".part"):
+            os.remove(self.url + ".part")
@@ -0,0 +1,358 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+A benchmark for the comic export. It generates a comic project with synthetic pages and
+then runs the full comicsExporter on it, for CBZ (with ACBF) and EPUB, reporting the pages
+per second, peak memory and the time spent per format.
+
+It is meant to be run through kritarunner, without a window:
+
+QT_QPA_PLATFORM=offscreen kritarunner -s comics_project_management_tools.comics_export_benchmark -f benchmark pages=20 width=2480 height=3508
+
+All arguments are key=value pairs, see benchmarkDefaults for the keys. The generated project
+is kept in "location" when that is given, and the results are written to benchmark-result.json
+in the project folder. Passing project=path skips the generation and benchmarks an existing project.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import tempfile
+from xml.etree import ElementTree as ET
+from pathlib import Path
+from PyQt5.QtCore import QByteArray
+from krita import *
+from . import comics_exporter, comics_export_profiler, comics_export_progress
+
+benchmarkDefaults = {
+    "pages": 10,
+    "width": 2480,
+    "height": 3508,
+    "dpi": 300,
+    "layers": 4,
+    "labelledLayers": 1,
+    "panels": 6,
+    "texts": 4,
+    "guides": True,
+    "formats": "CBZ,EPUB",
+    "fileType": "png",
+    "exportWorkers": 1,
+    "seed": 1,
+    "location": str(),
+    "project": str()
+}
+
+"""
+Parse the key=value arguments that kritarunner hands over, using the defaults for the types.
+"""
+
+
+def parse_arguments(args):
+    settings = dict(benchmarkDefaults)
+    for argument in args:
+        if "=" not in argument:
+            print("CPMT: Ignoring benchmark argument", argument)
+            continue
+        key, value = argument.split("=", 1)
+        if key not in settings.keys():
+            print("CPMT: Unknown benchmark argument", key)
+            continue
+        if isinstance(settings[key], bool):
+            settings[key] = value.lower() in ["1", "true", "yes"]
+        elif isinstance(settings[key], int):
+            settings[key] = int(value)
+        else:
+            settings[key] = value
+    return settings
+
+
+"""
+Make the svg for the panels and text vector layers. The shapes are laid out on a grid
+between the guides, panels as outlined rectangles and text as short lines of dialog.
+"""
+
+
+def make_vector_svg(settings, margins, text=False):
+    ptWidth = settings["width"] * 72 / settings["dpi"]
+    ptHeight = settings["height"] * 72 / settings["dpi"]
+    svg = ET.Element("svg")
+    svg.set("xmlns", "http://www.w3.org/2000/svg")
+    svg.set("xmlns:krita", "http://krita.org/namespaces/svg/krita")
+    svg.set("width", str(ptWidth) + "pt")
+    svg.set("height", str(ptHeight) + "pt")
+    svg.set("viewBox", "0 0 " + str(ptWidth) + " " + str(ptHeight))
+    amount = max(settings["panels"], 1)
+    if text:
+        amount = settings["texts"]
+    columns = 2
+    rows = max(int((amount + columns - 1) / columns), 1)
+    left = margins[0] * 72 / settings["dpi"]
+    top = margins[1] * 72 / settings["dpi"]
+    cellWidth = (ptWidth - 2 * left) / columns
+    cellHeight = (ptHeight - 2 * top) / rows
+    for i in range(amount):
+        x = left + (i % columns) * cellWidth
+        y = top + int(i / columns) * cellHeight
+        if text:
+            shape = ET.SubElement(svg, "text")
+            shape.set("krita:useRichText", "true")
+            shape.set("transform", "translate(" + str(x + 10) + ", " + str(y + 20) + ")")
+            shape.set("style", "font-family:sans-serif;font-size:12;fill:#000000")
+            for line in range(random.randint(1, 3)):
+                tspan = ET.SubElement(shape, "tspan")
+                tspan.set("x", "0")
+                tspan.set("dy", "14")
+                tspan.text = " ".join(random.choice(["Look", "out", "behind", "you", "what", "was", "that", "noise", "again", "!", "?"]) for w in range(random.randint(2, 6)))
+        else:
+            shape = ET.SubElement(svg, "rect")
+            shape.set("x", str(x + 4))
+            shape.set("y", str(y + 4))
+            shape.set("width", str(cellWidth - 8))
+            shape.set("height", str(cellHeight - 8))
+            shape.set("style", "fill:none;stroke:#000000;stroke-width:2")
+    return ET.tostring(svg, encoding="unicode")
+
+
+"""
+Put the svg content into the vector layers of a saved kra file. The scripting api
+can make vector layers, but not fill them, so we write the content.svg files ourselves.
+"""
+
+
+def fill_vector_layers(location, svgPerLayer):
+    page = zipfile.ZipFile(location, "r")
+    maindoc = ET.fromstring(page.read("maindoc.xml"))
+    replace = {}
+    for layer in maindoc.iter("{http://www.calligra.org/DTD/krita}layer"):
+        if layer.get("nodetype") == "shapelayer" and layer.get("name") in svgPerLayer.keys():
+            replace[str(layer.get("filename")) + ".shapelayer/content.svg"] = svgPerLayer[layer.get("name")]
+    newLocation = location + ".part"
+    newPage = zipfile.ZipFile(newLocation, "w", compression=zipfile.ZIP_STORED)
+    for info in page.infolist():
+        data = page.read(info.filename)
+        for ending in replace.keys():
+            if info.filename.endswith(ending):
+                data = replace[ending].encode("utf-8")
+        newPage.writestr(info, data)
+    newPage.close()
+    page.close()
+    os.replace(newLocation, location)
+
+
+"""
+Generate a single page with the requested amount of layers, a few of them color labelled,
+and a panels and text layer.
+"""
+
+
+def generate_page(settings, location, index):
+    width = settings["width"]
+    height = settings["height"]
+    page = Application.createDocument(width, height, "page_" + format(index, "03d"), "RGBA", "U8", "sRGB built-in", settings["dpi"])
+    page.setBatchmode(True)
+    root = page.rootNode()
+    # The noise comes from the seed too, so the same settings always make the same pages.
+    noise = random.Random(str(settings["seed"]) + ":" + str(index))
+
+    # Each layer gets a band of noise and a flat area, so the encoders have something to do.
+    bandHeight = max(int(height / max(settings["layers"], 1)), 1)
+    for l in range(settings["layers"]):
+        node = page.createNode("layer " + str(l), "paintlayer")
+        root.addChildNode(node, None)
+        top = min(l * bandHeight, height - 1)
+        bandSize = min(bandHeight, height - top)
+        pixels = bytearray(noise.getrandbits(width * bandSize * 32).to_bytes(width * bandSize * 4, "little"))
+        pixels[3::4] = b"\xff" * (width * bandSize)
+        node.setPixelData(QByteArray(bytes(pixels)), 0, top, width, bandSize)
+        if l < settings["labelledLayers"]:
+            node.setColorLabel(1)
+
+    margins = [int(width / 20), int(height / 20)]
+    svgPerLayer = {}
+    if settings["panels"] > 0:
+        root.addChildNode(page.createVectorLayer("panels"), None)
+        svgPerLayer["panels"] = make_vector_svg(settings, margins)
+    if settings["texts"] > 0:
+        root.addChildNode(page.createVectorLayer("text"), None)
+        svgPerLayer["text"] = make_vector_svg(settings, margins, True)
+    if settings["guides"]:
+        page.setVerticalGuides([margins[0], width - margins[0]])
+        page.setHorizontalGuides([margins[1], height - margins[1]])
+    page.refreshProjection()
+    page.saveAs(location)
+    page.waitForDone()
+    page.close()
+    fill_vector_layers(location, svgPerLayer)
+
+
+"""
+Generate a whole project, with the config the export needs.
+
+@returns the project folder.
+"""
+
+
+def generate_project(settings):
+    random.seed(settings["seed"])
+    projectPath = settings["location"]
+    if len(projectPath) == 0:
+        projectPath = tempfile.mkdtemp(prefix="cpmt-benchmark-")
+    Path(projectPath, "pages").mkdir(parents=True, exist_ok=True)
+    Path(projectPath, "export").mkdir(parents=True, exist_ok=True)
+
+    pagesList = []
+    for p in range(settings["pages"]):
+        relative = os.path.join("pages", "page_" + format(p, "03d") + ".kra")
+        generate_page(settings, os.path.join(projectPath, relative), p)
+        pagesList.append(relative)
+        print("CPMT: Generated benchmark page", p + 1, "of", settings["pages"])
+
+    config = {}
+    config["projectName"] = "benchmark"
+    config["title"] = "Benchmark"
+    config["summary"] = "A generated comic for benchmarking the export."
+    config["language"] = "en"
+    config["pagesLocation"] = "pages"
+    config["exportLocation"] = "export"
+    config["templateLocation"] = "templates"
+    config["translationLocation"] = "translations"
+    config["uuid"] = "{00000000-0000-0000-0000-000000000000}"
+    config["pages"] = pagesList
+    config["cover"] = pagesList[0] if len(pagesList) > 0 else str()
+    config["cropToGuides"] = settings["guides"]
+    config["cropLeft"] = 0
+    config["cropRight"] = 0
+    config["cropTop"] = 0
+    config["cropBottom"] = 0
+    config["labelsToRemove"] = [1]
+    config["textLayerNames"] = ["text"]
+    config["panelLayerNames"] = ["panels"]
+    write_config(projectPath, config)
+    return projectPath
+
+
+def write_config(projectPath, config):
+    configFile = open(os.path.join(projectPath, "comicConfig.json"), "w", newline="", encoding="utf-16")
+    json.dump(config, configFile, indent=4, sort_keys=True, ensure_ascii=False)
+    configFile.close()
+
+
+"""
+Set the formats to benchmark in the config, and turn off the incremental export, as
+reusing pages from a previous run would defeat the point.
+"""
+
+
+def configure_export(config, settings):
+    formats = [f.strip().upper() for f in settings["formats"].split(",")]
+    for key in ["CBZ", "EPUB", "TIFF"]:
+        config[key + "active"] = key in formats
+        fileType = settings["fileType"]
+        if key == "TIFF":
+            fileType = "tiff"
+        config[key] = {"Method": 3, "FileType": fileType, "Crop": settings["guides"], "DPI": 72, "Percentage": 100, "Width": 800, "Height": 1200 if key == "CBZ" else 900}
+    config["exportWorkers"] = settings["exportWorkers"]
+    config["incrementalExport"] = False
+    return config
+
+
+"""
+Sum up the profile per export format. Stages shared by several formats, like cropping
+once for CBZ and EPUB, are split evenly between them.
+"""
+
+
+def timings_per_format(records):
+    timings = {}
+    for record in records:
+        if len(record.get("key", str())) == 0:
+            timings["shared"] = timings.get("shared", 0.0) + record["seconds"]
+            continue
+        keys = record["key"].split("+")
+        for key in keys:
+            timings[key] = timings.get(key, 0.0) + record["seconds"] / len(keys)
+    return timings
+
+
+"""
+The kritarunner entry point.
+
+@returns 0 on success, 1 when the export failed.
+"""
+
+
+def benchmark(args):
+    settings = parse_arguments(args)
+    Application.setBatchmode(True)
+
+    projectPath = settings["project"]
+    generationTime = 0.0
+    if len(projectPath) == 0:
+        start = time.perf_counter()
+        projectPath = generate_project(settings)
+        generationTime = time.perf_counter() - start
+
+    configFile = open(os.path.join(projectPath, "comicConfig.json"), "r", newline="", encoding="utf-16")
+    config = json.load(configFile)
+    configFile.close()
+    config = configure_export(config, settings)
+
+    exportPath = Path(projectPath) / config["exportLocation"]
+    if exportPath.exists():
+        shutil.rmtree(str(exportPath))
+    exportPath.mkdir(parents=True)
+
+    exporter = comics_exporter.comicsExporter()
+    exporter.set_config(config, projectPath)
+    # Warnings shouldn't wait for someone to click a message box. The json lines go to
+    # stderr, so the benchmark report on stdout stays readable.
+    exporter.progress = comics_export_progress.stream_progress(sys.stderr)
+    start = time.perf_counter()
+    success = exporter.export()
+    exportTime = time.perf_counter() - start
+
+    pageCount = len(config.get("pages", []))
+    result = {}
+    result["settings"] = settings
+    result["success"] = bool(success)
+    result["pages"] = pageCount
+    result["generationSeconds"] = generationTime
+    result["exportSeconds"] = exportTime
+    result["pagesPerSecond"] = pageCount / exportTime if exportTime > 0 else 0.0
+    result["peakRSS"] = max(exporter.profiler.peakMemory, comics_export_profiler.peak_rss())
+    result["formatSeconds"] = timings_per_format(exporter.profiler.records)
+    result["stageSeconds"] = {s[0]: s[1] for s in exporter.profiler.stage_totals()}
+    result["warnings"] = exporter.progress.warnings
+    resultFile = open(os.path.join(projectPath, "benchmark-result.json"), "w", newline="", encoding="utf-8")
+    json.dump(result, resultFile, indent=1, ensure_ascii=False)
+    resultFile.close()
+
+    print("CPMT: Benchmark of", pageCount, "pages,", settings["width"], "x", settings["height"], "px, formats", settings["formats"])
+    print("CPMT: export took {:.2f} s, {:.2f} pages per second, peak memory {:.1f} MiB".format(exportTime, result["pagesPerSecond"], result["peakRSS"] / (1024 * 1024)))
+    for key in sorted(result["formatSeconds"].keys()):
+        print("CPMT: {:<10} {:>10.2f} s".format(key, result["formatSeconds"][key]))
+    print("CPMT: Results written to", os.path.join(projectPath, "benchmark-result.json"))
+    if success:
+        return 0
+    return 1
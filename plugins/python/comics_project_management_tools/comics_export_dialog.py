@@ -40,6 +40,7 @@ class comic_export_resize_widget(QGroupBox):
     def __init__(self, configName, batch=False, fileType=True):
         super().__init__()
         self.configName = configName
+        self.encoder = batch is False
         self.setTitle(i18n("Adjust Working File"))
         formLayout = QFormLayout()
         self.setLayout(formLayout)
@@ -78,7 +79,48 @@ class comic_export_resize_widget(QGroupBox):
         formLayout.addRow(i18n("Percentage:"), self.spn_PER)
         formLayout.addRow(i18n("Width:"), self.spn_width)
         formLayout.addRow(i18n("Height:"), self.spn_height)
+
+        # Encoder settings, these trade the time it takes to save a page against its size.
+        self.spn_pngCompression = QSpinBox()
+        self.spn_pngCompression.setRange(0, 9)
+        self.spn_pngCompression.setValue(3)
+        self.spn_pngCompression.setToolTip(i18n("Higher compression makes smaller png files, but takes longer to save."))
+        self.chk_pngInterlaced = QCheckBox(i18n("Interlace png"))
+        self.spn_jpgQuality = QSpinBox()
+        self.spn_jpgQuality.setRange(1, 100)
+        self.spn_jpgQuality.setValue(80)
+        self.chk_jpgProgressive = QCheckBox(i18n("Progressive jpeg"))
+        self.cmb_tiffCompression = QComboBox()
+        # In the same order as Krita's tiff export options.
+        self.cmb_tiffCompression.addItems([i18n("None"), i18n("JPEG DCT Compression"), i18n("Deflate (ZIP)"), i18n("Lempel-Ziv & Welch (LZW)"), i18n("Pixar Log")])
+        self.cmb_tiffCompression.currentIndexChanged.connect(self.slot_set_encoder_enabled)
+        self.spn_tiffDeflate = QSpinBox()
+        self.spn_tiffDeflate.setRange(1, 9)
+        self.spn_tiffDeflate.setValue(6)
+        self.chk_tiffPredictor = QCheckBox(i18n("Use horizontal differencing predictor"))
+        self.chk_tiffPredictor.setToolTip(i18n("Makes LZW and deflate compressed files smaller in most cases."))
+        self.cmbFile.currentIndexChanged.connect(self.slot_set_encoder_enabled)
+
+        if self.encoder is True:
+            if configName == "TIFF":
+                formLayout.addRow(i18n("Compression:"), self.cmb_tiffCompression)
+                formLayout.addRow(i18n("Deflate level:"), self.spn_tiffDeflate)
+                formLayout.addRow("", self.chk_tiffPredictor)
+            else:
+                formLayout.addRow(i18n("PNG compression:"), self.spn_pngCompression)
+                formLayout.addRow("", self.chk_pngInterlaced)
+                formLayout.addRow(i18n("JPEG quality:"), self.spn_jpgQuality)
+                formLayout.addRow("", self.chk_jpgProgressive)
         self.slot_set_enabled()
+        self.slot_set_encoder_enabled()
+
+    def slot_set_encoder_enabled(self):
+        fileType = self.cmbFile.currentText()
+        self.spn_pngCompression.setEnabled(fileType == "png")
+        self.chk_pngInterlaced.setEnabled(fileType == "png")
+        self.spn_jpgQuality.setEnabled(fileType == "jpg")
+        self.chk_jpgProgressive.setEnabled(fileType == "jpg")
+        self.spn_tiffDeflate.setEnabled(self.cmb_tiffCompression.currentIndex() == 2)
 
     def slot_set_enabled(self):
         method = self.resizeMethod.currentIndex()
@@ -113,7 +155,15 @@ class comic_export_resize_widget(QGroupBox):
                 self.spn_width.setValue(mConfig["Width"])
             if "Height" in mConfig.keys():
                 self.spn_height.setValue(mConfig["Height"])
+            self.spn_pngCompression.setValue(mConfig.get("PNGCompression", 3))
+            self.chk_pngInterlaced.setChecked(mConfig.get("PNGInterlaced", False))
+            self.spn_jpgQuality.setValue(mConfig.get("Quality", 80))
+            self.chk_jpgProgressive.setChecked(mConfig.get("Progressive", False))
+            self.cmb_tiffCompression.setCurrentIndex(mConfig.get("TIFFCompression", 0))
+            self.spn_tiffDeflate.setValue(mConfig.get("TIFFDeflate", 6))
+            self.chk_tiffPredictor.setChecked(mConfig.get("TIFFPredictor", False))
             self.slot_set_enabled()
+            self.slot_set_encoder_enabled()
 
     def get_config(self, config):
         mConfig = {}
@@ -127,6 +177,17 @@ class comic_export_resize_widget(QGroupBox):
         mConfig["Percentage"] = self.spn_PER.value()
         mConfig["Width"] = self.spn_width.value()
         mConfig["Height"] = self.spn_height.value()
+        if self.encoder is True:
+            if self.configName == "TIFF":
+                mConfig["TIFFCompression"] = self.cmb_tiffCompression.currentIndex()
+                mConfig["TIFFDeflate"] = self.spn_tiffDeflate.value()
+                mConfig["TIFFPredictor"] = self.chk_tiffPredictor.isChecked()
+            elif mConfig["FileType"] == "png":
+                mConfig["PNGCompression"] = self.spn_pngCompression.value()
+                mConfig["PNGInterlaced"] = self.chk_pngInterlaced.isChecked()
+            elif mConfig["FileType"] == "jpg":
+                mConfig["Quality"] = self.spn_jpgQuality.value()
+                mConfig["Progressive"] = self.chk_jpgProgressive.isChecked()
         config[self.configName] = mConfig
         return config
 
@@ -268,9 +329,46 @@ class comic_export_setting_dialog(QDialog):
         self.ln_panel_layer_name.setToolTip(i18n("These are keywords that can be used to identify panel layers. A layer only needs to contain the keyword to be recognized. Keywords should be comma separated."))
         formLayers.addRow(i18n("Text Layer Key:"), self.ln_text_layer_name)
         formLayers.addRow(i18n("Panel Layer Key:"), self.ln_panel_layer_name)
+        self.chk_archiveVectorExtraction = QCheckBox(i18n("Read panels and text from the kra files"))
+        self.chk_archiveVectorExtraction.setToolTip(i18n("Read the panels and text straight from the vector layers stored inside the kra files, for all pages at once, instead of going through each opened page. Krita's text layout isn't stored in the kra files, so the text outlines are estimated from the fonts and can differ a little from those of the opened pages. The text itself is written out from the stored svg, which can differ in markup from what Krita writes, so translations made from texts of opened pages may not match."))
+        formLayers.addRow("", self.chk_archiveVectorExtraction)
+
+        groupExportPerformance = QGroupBox(i18n("Performance"))
+        formPerformance = QFormLayout()
+        groupExportPerformance.setLayout(formPerformance)
+        self.spn_exportWorkers = QSpinBox()
+        self.spn_exportWorkers.setRange(1, 64)
+        self.spn_exportWorkers.setToolTip(i18n("The amount of kritarunner processes that export pages at the same time. With 1, all pages are exported inside Krita itself."))
+        formPerformance.addRow(i18n("Export processes:"), self.spn_exportWorkers)
+        self.chk_incrementalExport = QCheckBox(i18n("Only export changed pages"))
+        self.chk_incrementalExport.setToolTip(i18n("Reuse the files of the previous export for pages that haven't changed since, and for export settings that are still the same."))
+        formPerformance.addRow("", self.chk_incrementalExport)
+        self.chk_fastExport = QCheckBox(i18n("Use the merged image for simple pages"))
+        self.chk_fastExport.setToolTip(i18n("Pages without layers to remove and without text or panel layers are exported from the merged image stored in the kra file, instead of opening the whole file. This is not used when exporting to TIFF."))
+        formPerformance.addRow("", self.chk_fastExport)
+        self.chk_lowMemoryExport = QCheckBox(i18n("Low memory export"))
+        self.chk_lowMemoryExport.setToolTip(i18n("Keep only one copy of a page in memory at a time, and put the page on disk when getting close to the memory ceiling. This is slower, but helps with very large pages."))
+        formPerformance.addRow("", self.chk_lowMemoryExport)
+        self.spn_memoryCeiling = QSpinBox()
+        self.spn_memoryCeiling.setRange(256, 1048576)
+        self.spn_memoryCeiling.setSingleStep(256)
+        self.spn_memoryCeiling.setSuffix(" MiB")
+        self.spn_memoryCeiling.setToolTip(i18n("The amount of memory the export should stay under. When exporting with several processes, they share this amount."))
+        self.chk_lowMemoryExport.toggled.connect(self.spn_memoryCeiling.setEnabled)
+        formPerformance.addRow(i18n("Memory ceiling:"), self.spn_memoryCeiling)
+        self.spn_draftLongEdge = QSpinBox()
+        self.spn_draftLongEdge.setRange(256, 16384)
+        self.spn_draftLongEdge.setSuffix(" px")
+        self.spn_draftLongEdge.setToolTip(i18n("The longest side of the pages when exporting a draft."))
+        formPerformance.addRow(i18n("Draft page size:"), self.spn_draftLongEdge)
+        self.spn_draftQuality = QSpinBox()
+        self.spn_draftQuality.setRange(1, 100)
+        self.spn_draftQuality.setToolTip(i18n("The jpeg quality of the pages when exporting a draft."))
+        formPerformance.addRow(i18n("Draft quality:"), self.spn_draftQuality)
 
         mainExportSettings.layout().addWidget(groupExportCrop)
         mainExportSettings.layout().addWidget(groupExportLayers)
+        mainExportSettings.layout().addWidget(groupExportPerformance)
         mainWidget.addTab(mainExportSettings, i18n("General"))
 
         # CBZ, crop, resize, which metadata to add.
@@ -281,6 +379,14 @@ class comic_export_setting_dialog(QDialog):
         self.CBZgroupResize = comic_export_resize_widget("CBZ")
         CBZexportSettings.layout().addWidget(self.CBZgroupResize)
         self.CBZactive.clicked.connect(self.CBZgroupResize.setEnabled)
+        self.CBZcompress = QCheckBox(i18n("Compress pages in the CBZ"))
+        self.CBZcompress.setToolTip(i18n("Deflate the pages inside the CBZ archive. This only makes the file smaller for formats that aren't compressed already, like TIFF or uncompressed PNG, and takes longer for the rest."))
+        CBZexportSettings.layout().addWidget(self.CBZcompress)
+        self.CBZactive.clicked.connect(self.CBZcompress.setEnabled)
+        self.CBZdedupe = QCheckBox(i18n("Store identical pages only once"))
+        self.CBZdedupe.setToolTip(i18n("Pages that are exactly the same, like blank pages, are put in the CBZ once and shared in the ACBF and ComicInfo page lists. Readers that only look at the images in the archive will skip the repeated pages."))
+        CBZexportSettings.layout().addWidget(self.CBZdedupe)
+        self.CBZactive.clicked.connect(self.CBZdedupe.setEnabled)
         CBZgroupMeta = QGroupBox(i18n("Metadata to Add"))
         # CBZexportSettings.layout().addWidget(CBZgroupMeta)
         CBZgroupMeta.setLayout(QFormLayout())
@@ -408,6 +514,14 @@ class comic_export_setting_dialog(QDialog):
         self.EPUBgroupResize = comic_export_resize_widget("EPUB")
         EPUBexportSettings.layout().addWidget(self.EPUBgroupResize)
         self.EPUBactive.clicked.connect(self.EPUBgroupResize.setEnabled)
+        self.EPUBdedupe = QCheckBox(i18n("Store identical pages only once"))
+        self.EPUBdedupe.setToolTip(i18n("Pages that are exactly the same, like blank pages, share a single image in the EPUB."))
+        EPUBexportSettings.layout().addWidget(self.EPUBdedupe)
+        self.EPUBactive.clicked.connect(self.EPUBdedupe.setEnabled)
+        self.EPUBdirect = QCheckBox(i18n("Write straight into the EPUB file"))
+        self.EPUBdirect.setToolTip(i18n("Write the pages and documents straight into the EPUB, instead of into the EPUB-files folder first.\nThis writes a lot less to disk, which helps when the export folder is on a network drive."))
+        EPUBexportSettings.layout().addWidget(self.EPUBdirect)
+        self.EPUBactive.clicked.connect(self.EPUBdirect.setEnabled)
         mainWidget.addTab(EPUBexportSettings, i18n("EPUB"))
 
         # For Print. Crop, no resize.
@@ -595,9 +709,22 @@ class comic_export_setting_dialog(QDialog):
             self.ln_panel_layer_name.setText(", ".join(config["panelLayerNames"]))
         else:
             self.ln_panel_layer_name.setText("panels")
+        self.spn_exportWorkers.setValue(config.get("exportWorkers", 1))
+        self.chk_incrementalExport.setChecked(config.get("incrementalExport", True))
+        self.chk_fastExport.setChecked(config.get("fastExport", True))
+        self.chk_lowMemoryExport.setChecked(config.get("lowMemoryExport", False))
+        self.spn_memoryCeiling.setValue(config.get("memoryCeiling", 4096))
+        self.spn_memoryCeiling.setEnabled(self.chk_lowMemoryExport.isChecked())
+        self.spn_draftLongEdge.setValue(config.get("draftLongEdge", 1600))
+        self.spn_draftQuality.setValue(config.get("draftQuality", 60))
+        self.chk_archiveVectorExtraction.setChecked(config.get("archiveVectorExtraction", False))
         self.CBZgroupResize.set_config(config)
         if "CBZactive" in config.keys():
             self.CBZactive.setChecked(config["CBZactive"])
+        self.CBZcompress.setChecked(config.get("CBZcompress", False))
+        self.CBZdedupe.setChecked(config.get("CBZdedupe", False))
+        self.EPUBdedupe.setChecked(config.get("EPUBdedupe", True))
+        self.EPUBdirect.setChecked(config.get("EPUBdirect", False))
         self.EPUBgroupResize.set_config(config)
         if "EPUBactive" in config.keys():
             self.EPUBactive.setChecked(config["EPUBactive"])
@@ -686,6 +813,10 @@ class comic_export_setting_dialog(QDialog):
                 style.setData(False, role=styleEnum.ITALIC) #Italic
                 self.ACBFStylesModel.appendRow(style)
         self.CBZgroupResize.setEnabled(self.CBZactive.isChecked())
+        self.CBZcompress.setEnabled(self.CBZactive.isChecked())
+        self.CBZdedupe.setEnabled(self.CBZactive.isChecked())
+        self.EPUBdedupe.setEnabled(self.EPUBactive.isChecked())
+        self.EPUBdirect.setEnabled(self.EPUBactive.isChecked())
         self.lnTranslatorHeader.setText(config.get("translatorHeader", "Translator's Notes"))
         self.chkIncludeTranslatorComments.setChecked(config.get("includeTranslComment", False))
 
@@ -703,7 +834,19 @@ class comic_export_setting_dialog(QDialog):
         config["cropBottom"] = self.spn_marginRight.value()
         config["cropRight"] = self.spn_marginBottom.value()
         config["labelsToRemove"] = self.cmbLabelsRemove.getLabels()
+        config["exportWorkers"] = self.spn_exportWorkers.value()
+        config["incrementalExport"] = self.chk_incrementalExport.isChecked()
+        config["fastExport"] = self.chk_fastExport.isChecked()
+        config["lowMemoryExport"] = self.chk_lowMemoryExport.isChecked()
+        config["memoryCeiling"] = self.spn_memoryCeiling.value()
+        config["draftLongEdge"] = self.spn_draftLongEdge.value()
+        config["draftQuality"] = self.spn_draftQuality.value()
+        config["archiveVectorExtraction"] = self.chk_archiveVectorExtraction.isChecked()
         config["CBZactive"] = self.CBZactive.isChecked()
+        config["CBZcompress"] = self.CBZcompress.isChecked()
+        config["CBZdedupe"] = self.CBZdedupe.isChecked()
+        config["EPUBdedupe"] = self.EPUBdedupe.isChecked()
+        config["EPUBdirect"] = self.EPUBdirect.isChecked()
         config = self.CBZgroupResize.get_config(config)
         config["EPUBactive"] = self.EPUBactive.isChecked()
         config = self.EPUBgroupResize.get_config(config)
@@ -0,0 +1,172 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Export a comics project without the gui, for example on a build machine:
+
+kritarunner -s comics_project_management_tools.comics_export_headless -f export_project /path/to/comicConfig.json [CBZ] [EPUB] [TIFF] [--resume] [--draft] [--workers=4] [--result=/path/to/result.json]
+
+Without formats, the formats that are active in the export settings are exported.
+With --draft, a quick low quality cbz is made in the draft folder of the export instead.
+--workers overrides the amount of export processes from the export settings.
+The progress is written to stdout as json lines, and everything else the export prints goes
+to stderr, so stdout can be read line by line as json. A json summary of the result is written
+to export-result.json in the metadata folder of the export, or to the given result file.
+The exit code is 0 when the export succeeded, and 1 when it didn't.
+"""
+
+import os
+import sys
+import json
+import contextlib
+import time
+import traceback
+from pathlib import Path
+from PyQt5.QtCore import QUuid
+from krita import *
+from . import comics_exporter, comics_export_progress
+
+exportFormats = ["CBZ", "EPUB", "TIFF"]
+
+"""
+Read the comicConfig.json of a project.
+"""
+
+
+def read_config(location):
+    file = open(location, "r", newline="", encoding="utf-16")
+    config = json.load(file)
+    file.close()
+    return config
+
+
+"""
+Write the result summary in one go, so nobody reads a half written file.
+"""
+
+
+def write_result(location, result):
+    Path(location).parent.mkdir(parents=True, exist_ok=True)
+    file = open(location + ".part", "w", newline="", encoding="utf-8")
+    json.dump(result, file, indent=1, ensure_ascii=False)
+    file.close()
+    os.replace(location + ".part", location)
+
+
+def export_project(args):
+    configLocation = str()
+    formats = []
+    resume = False
+    draft = False
+    workers = 0
+    resultLocation = str()
+    for arg in args:
+        if arg == "--resume":
+            resume = True
+        elif arg == "--draft":
+            draft = True
+        elif arg.startswith("--workers="):
+            workers = int(arg[len("--workers="):])
+        elif arg.startswith("--result="):
+            resultLocation = arg[len("--result="):]
+        elif arg.upper() in exportFormats:
+            formats.append(arg.upper())
+        else:
+            configLocation = arg
+
+    progress = comics_export_progress.stream_progress(sys.stdout)
+    # The exporter prints what it's doing as plain text, keep that out of the json lines.
+    with contextlib.redirect_stdout(sys.stderr):
+        return export_with_progress(progress, configLocation, formats, resume, draft, workers, resultLocation)
+
+
+def export_with_progress(progress, configLocation, formats=[], resume=False, draft=False, workers=0, resultLocation=str()):
+    result = {}
+    result["config"] = configLocation
+    result["success"] = False
+    startTime = time.time()
+
+    if os.path.exists(configLocation) is False:
+        progress.warning("Export not Possible", str("No comicConfig.json at " + configLocation))
+        result["warnings"] = progress.warnings
+        if len(resultLocation) > 0:
+            write_result(resultLocation, result)
+        return 1
+
+    projectURL = os.path.dirname(os.path.abspath(configLocation))
+    try:
+        config = read_config(configLocation)
+    except (OSError, ValueError) as error:
+        progress.warning("Export not Possible", str("Could not read " + configLocation + ": " + str(error)))
+        result["warnings"] = progress.warnings
+        if len(resultLocation) > 0:
+            write_result(resultLocation, result)
+        return 1
+
+    # Only export the formats that were asked for.
+    if len(formats) > 0:
+        for key in exportFormats:
+            config[key + "active"] = key in formats and key in config.keys()
+            if key in formats and key not in config.keys():
+                progress.warning("Export not Possible", str("There are no export settings for " + key + "."))
+
+    if workers > 0:
+        config["exportWorkers"] = workers
+
+    # Ensure there is a unique identifier, like the docker does.
+    if "uuid" not in config.keys():
+        if "acbfID" in config.keys():
+            config["uuid"] = str(config["acbfID"])
+        else:
+            config["uuid"] = QUuid.createUuid().toString()
+
+    Application.setBatchmode(True)
+    exporter = comics_exporter.comicsExporter()
+    exporter.set_config(config, projectURL)
+    if draft:
+        exporter.set_draft()
+        config = exporter.configDictionary
+    exporter.progress = progress
+    result["formats"] = [key for key in exportFormats if key in config.keys() and config.get(key + "active", False)]
+
+    if len(resultLocation) == 0:
+        resultLocation = str(Path(projectURL) / config.get("exportLocation", str()) / "metadata" / "export-result.json")
+    try:
+        result["success"] = bool(exporter.export(resume))
+    except Exception:
+        result["error"] = traceback.format_exc()
+        progress.emit({"event": "error", "message": result["error"]})
+
+    result["seconds"] = time.time() - startTime
+    result["pages"] = len(config.get("pages", []))
+    result["files"] = exporter.pagesLocationList
+    exportPath = Path(projectURL) / config.get("exportLocation", str())
+    outputs = []
+    if "CBZ" in result["formats"]:
+        outputs.append(exporter.get_cbz_url(exportPath))
+    if "EPUB" in result["formats"]:
+        outputs.append(str(Path(exporter.get_cbz_url(exportPath)).with_suffix(".epub")))
+    result["outputs"] = [location for location in outputs if os.path.exists(location)]
+    result["warnings"] = progress.warnings
+    write_result(resultLocation, result)
+    progress.emit({"event": "finished", "success": result["success"], "result": resultLocation})
+
+    if result["success"]:
+        return 0
+    return 1
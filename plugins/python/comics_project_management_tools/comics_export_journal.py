@@ -0,0 +1,146 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+The export journal keeps track of the pages an export has finished, so that an export
+that was interrupted, by a crash or otherwise, can be resumed instead of started over.
+
+The journal is a file with one json object per line. The first line holds a fingerprint
+of the export settings, every line after that is a finished page with its page data and
+the files that were written for it. Lines are only ever appended, so a crash can at
+most leave a half written last line, which is ignored when reading the journal back.
+The journal is removed once the export has finished.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+
+# Bump this when what is stored for a page changes, so old journals aren't resumed from.
+journalVersion = 2
+
+"""
+Get a fingerprint of everything that influences the exported pages. The settings
+that only influence how fast the export goes are left out, so those can be changed
+before resuming.
+"""
+
+
+def make_fingerprint(config, sizesList):
+    settings = {}
+    for key in config.keys():
+        if key not in ["exportWorkers", "incrementalExport", "lowMemoryExport", "memoryCeiling", "kritarunnerPath", "EPUBdirect", "EPUBstreamingXML"]:
+            settings[key] = config[key]
+    settings["sizesList"] = sizesList
+    settings["journalVersion"] = journalVersion
+    return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class export_journal():
+    location = str()
+    fingerprint = str()
+    file = None
+
+    def __init__(self, location=str(), fingerprint=str()):
+        self.location = location
+        self.fingerprint = fingerprint
+        self.file = None
+
+    """
+    Read the pages the previous export finished. Pages whose files have gone missing
+    since are left out, so they get exported again.
+
+    @returns a dictionary of page index to (page data in json form, files per key). This is
+    empty when there's no journal or the journal was made with different settings.
+    """
+
+    def finished_pages(self, pagesList=[]):
+        pages = {}
+        if os.path.exists(self.location) is False:
+            return pages
+        file = open(self.location, "r", newline="", encoding="utf-8")
+        lines = file.read().split("\n")
+        file.close()
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return pages
+        if header.get("fingerprint", str()) != self.fingerprint:
+            print("CPMT: The export settings changed since the interrupted export, starting over.")
+            return pages
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            p = entry.get("index", -1)
+            if p < 0 or p >= len(pagesList) or entry.get("page", str()) != pagesList[p]:
+                continue
+            if all(os.path.exists(location) for location in entry.get("files", {}).values()):
+                pages[p] = (entry.get("pageData", {}), entry["files"])
+        return pages
+
+    """
+    Start a journal. When resuming, the pages that were finished are written to the
+    new journal again, so a journal always reflects what is on disk.
+    """
+
+    def start(self, pagesList=[], finishedPages={}):
+        Path(self.location).parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.location, "w", newline="", encoding="utf-8")
+        self.file.write(json.dumps({"fingerprint": self.fingerprint}) + "\n")
+        for p in sorted(finishedPages.keys()):
+            self.write_entry(p, pagesList[p], finishedPages[p][0], finishedPages[p][1])
+        self.flush()
+
+    """
+    Write down that a page is done.
+
+    @param pageData: the page data in json form.
+    """
+
+    def add_page(self, p, page, pageData, pageFiles):
+        if self.file is None:
+            return
+        self.write_entry(p, page, pageData, pageFiles)
+        self.flush()
+
+    def write_entry(self, p, page, pageData, pageFiles):
+        entry = {}
+        entry["index"] = p
+        entry["page"] = page
+        entry["pageData"] = pageData
+        entry["files"] = pageFiles
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    """
+    Close the journal. When the export finished, it isn't needed anymore.
+    """
+
+    def close(self, finished=False):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if finished and os.path.exists(self.location):
+            os.remove(self.location)
@@ -0,0 +1,178 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+The export manifest remembers what the last export did for each page, so that
+pages that haven't changed since don't need to be opened and rendered again.
+
+For every page it stores the size, modification time and hash of the kra file,
+and for every export key the settings that were used and the file that was written.
+A page is only reused for a key when all of those still match and the file still exists.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+
+"""
+Hash the contents of a file, in chunks so big pages don't need to be loaded at once.
+"""
+
+
+def file_hash(location):
+    fileHash = hashlib.sha1()
+    file = open(location, "rb")
+    chunk = file.read(1 << 20)
+    while chunk:
+        fileHash.update(chunk)
+        chunk = file.read(1 << 20)
+    file.close()
+    return fileHash.hexdigest()
+
+
+class export_manifest():
+    manifestVersion = 2
+    location = str()
+    pages = {}
+
+    def __init__(self, location=str()):
+        self.location = location
+        self.pages = {}
+        if os.path.exists(location):
+            try:
+                file = open(location, "r", newline="", encoding="utf-8")
+                manifest = json.load(file)
+                file.close()
+                if manifest.get("version", 0) == self.manifestVersion:
+                    self.pages = manifest.get("pages", {})
+            except (OSError, ValueError):
+                print("CPMT: The export manifest could not be read, all pages will be exported.")
+                self.pages = {}
+
+    """
+    The settings that influence the output for a given export key. This includes the
+    general settings that change the page data, like the layers to remove, and the ones that
+    change how the page is rendered or where the panels and text are read from.
+    """
+
+    def settings_for_key(self, config, key, sizes):
+        settings = {}
+        settings["key"] = key
+        settings["sizes"] = sizes
+        for setting in ["cropToGuides", "cropLeft", "cropRight", "cropTop", "cropBottom", "labelsToRemove", "textLayerNames", "panelLayerNames", "fastExport", "archiveVectorExtraction", "skipVectorExtraction"]:
+            settings[setting] = config.get(setting, None)
+        # Round trip through json so the comparison with stored settings is fair.
+        return json.loads(json.dumps(settings))
+
+    def file_hash(self, location):
+        return file_hash(location)
+
+    """
+    Check whether the kra file is still the one the entry was made from.
+    Size and modification time are checked first, the hash is only calculated
+    when those differ, as that requires reading the whole file.
+    """
+
+    def page_unchanged(self, entry, absoluteUrl):
+        if os.path.exists(absoluteUrl) is False:
+            return False
+        stat = os.stat(absoluteUrl)
+        if entry.get("size", -1) != stat.st_size:
+            return False
+        if entry.get("mtime", -1) == stat.st_mtime:
+            return True
+        if entry.get("hash", str()) == self.file_hash(absoluteUrl):
+            # Touched, but not changed. Remember the new time so we don't hash again.
+            entry["mtime"] = stat.st_mtime
+            return True
+        return False
+
+    """
+    Get the keys of the sizes list that need to be exported for this page.
+
+    @returns a list of keys, which is empty when the page can be reused completely.
+    """
+
+    def stale_keys(self, relativeUrl, absoluteUrl, index, sizesList, config):
+        entry = self.pages.get(relativeUrl, None)
+        if entry is None or entry.get("index", -1) != index or "pageData" not in entry.keys():
+            return list(sizesList.keys())
+        if self.page_unchanged(entry, absoluteUrl) is False:
+            return list(sizesList.keys())
+        staleKeys = []
+        for key in sizesList.keys():
+            keyEntry = entry.get("keys", {}).get(key, None)
+            if keyEntry is None:
+                staleKeys.append(key)
+            elif keyEntry.get("settings", {}) != self.settings_for_key(config, key, sizesList[key]):
+                staleKeys.append(key)
+            elif os.path.exists(keyEntry.get("file", str())) is False:
+                staleKeys.append(key)
+        return staleKeys
+
+    """
+    @returns the stored page data (json form) and a dictionary of stored files per key.
+    """
+
+    def cached_result(self, relativeUrl):
+        entry = self.pages.get(relativeUrl, {})
+        pageFiles = {}
+        for key in entry.get("keys", {}).keys():
+            pageFiles[key] = entry["keys"][key]["file"]
+        return entry.get("pageData", {}), pageFiles
+
+    """
+    Store the result of exporting a page.
+
+    @param pageData: the page data in json form.
+    @param pageFiles: the files written per key, this should include reused files as well.
+    """
+
+    def update_page(self, relativeUrl, absoluteUrl, index, sizesList, config, pageData, pageFiles):
+        entry = self.pages.get(relativeUrl, {})
+        stat = os.stat(absoluteUrl)
+        if entry.get("size", -1) != stat.st_size or entry.get("mtime", -1) != stat.st_mtime or "hash" not in entry.keys():
+            entry["hash"] = self.file_hash(absoluteUrl)
+        entry["size"] = stat.st_size
+        entry["mtime"] = stat.st_mtime
+        entry["index"] = index
+        entry["pageData"] = pageData
+        keys = {}
+        for key in pageFiles.keys():
+            keys[key] = {"settings": self.settings_for_key(config, key, sizesList[key]), "file": pageFiles[key]}
+        entry["keys"] = keys
+        self.pages[relativeUrl] = entry
+
+    """
+    Forget all pages that aren't in the pages list anymore and write the manifest.
+    """
+
+    def save(self, pagesList=[]):
+        for relativeUrl in list(self.pages.keys()):
+            if relativeUrl not in pagesList:
+                self.pages.pop(relativeUrl)
+        manifest = {}
+        manifest["version"] = self.manifestVersion
+        manifest["pages"] = self.pages
+        Path(self.location).parent.mkdir(parents=True, exist_ok=True)
+        file = open(self.location + ".part", "w", newline="", encoding="utf-8")
+        json.dump(manifest, file, indent=1, ensure_ascii=False)
+        file.close()
+        os.replace(self.location + ".part", self.location)
@@ -0,0 +1,229 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+The export profiler keeps track of how long each stage of the export takes, per page and
+per export key, and how much memory the export needed at most.
+
+The exporter calls start_page() when it starts on a page and lap() after every stage.
+The time since the previous lap is booked on the stage given. At the end, the results are
+written as json and csv to the metadata folder, and a summary is printed.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+
+"""
+Get the peak resident memory of this process in bytes, or 0 if we can't tell.
+"""
+
+
+def peak_rss():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes.
+        if sys.platform == "darwin":
+            return peak
+        return peak * 1024
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD), ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t), ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t), ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t), ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+        except (AttributeError, OSError):
+            pass
+    return 0
+
+
+"""
+Get the current resident memory of this process in bytes. On Linux this is read from /proc,
+elsewhere psutil is used if it's there, and otherwise we fall back to the peak.
+"""
+
+
+def current_rss():
+    try:
+        file = open("/proc/self/statm", "r")
+        resident = int(file.read().split()[1])
+        file.close()
+        return resident * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    return peak_rss()
+
+
+class export_profiler():
+    records = []
+    page = None
+    lastLap = 0.0
+    peakMemory = 0
+    memoryCeiling = 0
+    highestMemory = 0
+    notes = []
+
+    def __init__(self):
+        self.records = []
+        self.page = None
+        self.lastLap = time.perf_counter()
+        self.peakMemory = 0
+        self.memoryCeiling = 0
+        self.highestMemory = 0
+        self.notes = []
+
+    """
+    Start timing a new page. Anything that happens before the next lap is booked on this page.
+
+    @param page: the index of the page, or None for work that is for the whole book, like packaging.
+    """
+
+    def start_page(self, page=None):
+        self.page = page
+        self.lastLap = time.perf_counter()
+
+    """
+    Book the time since the previous lap on the given stage.
+    """
+
+    def lap(self, stage, key=str()):
+        now = time.perf_counter()
+        record = {}
+        record["page"] = self.page
+        record["key"] = key
+        record["stage"] = stage
+        record["seconds"] = now - self.lastLap
+        record["peakRSS"] = peak_rss()
+        record["RSS"] = current_rss()
+        self.peakMemory = max(self.peakMemory, record["peakRSS"])
+        self.highestMemory = max(self.highestMemory, record["RSS"])
+        self.records.append(record)
+        self.lastLap = now
+
+    """
+    Add the records another process made, like the export workers.
+    """
+
+    def add_records(self, records):
+        for record in records:
+            self.peakMemory = max(self.peakMemory, record.get("peakRSS", 0))
+            self.highestMemory = max(self.highestMemory, record.get("RSS", 0))
+            self.records.append(record)
+
+    """
+    Remember something noteworthy that happened during the export, like a spilled page.
+    """
+
+    def note(self, message):
+        print("CPMT:", message)
+        self.notes.append(message)
+
+    """
+    Total up the seconds per stage.
+
+    @returns a list of (stage, total, count, maximum) in the order the stages first appeared.
+    """
+
+    def stage_totals(self):
+        totals = {}
+        for record in self.records:
+            stage = totals.setdefault(record["stage"], [0.0, 0, 0.0])
+            stage[0] += record["seconds"]
+            stage[1] += 1
+            stage[2] = max(stage[2], record["seconds"])
+        return [(stage, totals[stage][0], totals[stage][1], totals[stage][2]) for stage in totals.keys()]
+
+    """
+    @returns the pages that took the longest, as a list of (page, seconds).
+    """
+
+    def slowest_pages(self, amount=5):
+        pages = {}
+        for record in self.records:
+            if record["page"] is not None:
+                pages[record["page"]] = pages.get(record["page"], 0.0) + record["seconds"]
+        return sorted(pages.items(), key=lambda page: page[1], reverse=True)[:amount]
+
+    """
+    Write the profile as json and csv into the given folder.
+
+    @param pagesList: used to put the page file names next to the indices.
+    """
+
+    def write_report(self, location, pagesList=[]):
+        for record in self.records:
+            if record["page"] is not None and record["page"] < len(pagesList):
+                record["pageName"] = pagesList[record["page"]]
+        report = {}
+        report["peakRSS"] = self.peakMemory
+        report["highestRSS"] = self.highestMemory
+        if self.memoryCeiling > 0:
+            report["memoryCeiling"] = self.memoryCeiling
+            report["ceilingUsed"] = self.highestMemory / self.memoryCeiling
+        report["notes"] = self.notes
+        report["stages"] = [{"stage": s[0], "seconds": s[1], "count": s[2], "maximum": s[3]} for s in self.stage_totals()]
+        report["records"] = self.records
+        file = open(os.path.join(location, "export-profile.json"), "w", newline="", encoding="utf-8")
+        json.dump(report, file, indent=1, ensure_ascii=False)
+        file.close()
+
+        file = open(os.path.join(location, "export-profile.csv"), "w", newline="", encoding="utf-8")
+        writer = csv.writer(file)
+        writer.writerow(["page", "pageName", "key", "stage", "seconds", "peakRSS", "RSS"])
+        for record in self.records:
+            writer.writerow([record["page"], record.get("pageName", str()), record["key"], record["stage"], format(record["seconds"], ".4f"), record["peakRSS"], record.get("RSS", 0)])
+        file.close()
+
+    """
+    Print a table with the totals per stage, the slowest pages and the memory peak.
+    """
+
+    def print_summary(self, pagesList=[]):
+        totals = self.stage_totals()
+        allSeconds = sum([stage[1] for stage in totals])
+        print("CPMT: Export profile")
+        print("CPMT: {:<20} {:>10} {:>7} {:>10} {:>10}".format("stage", "total (s)", "share", "count", "max (s)"))
+        for stage in totals:
+            share = 0
+            if allSeconds > 0:
+                share = stage[1] / allSeconds * 100
+            print("CPMT: {:<20} {:>10.2f} {:>6.1f}% {:>10} {:>10.2f}".format(stage[0], stage[1], share, stage[2], stage[3]))
+        for page, seconds in self.slowest_pages():
+            name = str(page)
+            if page < len(pagesList):
+                name = pagesList[page]
+            print("CPMT: slow page {:<40} {:>10.2f} s".format(name, seconds))
+        print("CPMT: peak memory {:.1f} MiB".format(self.peakMemory / (1024 * 1024)))
+        if self.memoryCeiling > 0:
+            print("CPMT: highest memory {:.1f} MiB of the {:.1f} MiB ceiling ({:.0f}%)".format(self.highestMemory / (1024 * 1024), self.memoryCeiling / (1024 * 1024), self.highestMemory / self.memoryCeiling * 100))
@@ -0,0 +1,118 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+The export progress classes are what the comicsExporter reports its progress and
+warnings to. Inside Krita that is a progress dialog with message boxes for the warnings,
+when exporting from the command line it's a stream of json lines on stdout.
+"""
+
+import sys
+import json
+from PyQt5.QtWidgets import QProgressDialog, QMessageBox, qApp
+from krita import *
+
+"""
+Shows the progress in a progress dialog, and warnings in message boxes.
+"""
+
+
+class dialog_progress():
+    dialog = None
+
+    def __init__(self, maximum=0):
+        self.dialog = QProgressDialog(i18n("Preparing export."), str(), 0, maximum)
+        self.dialog.setWindowTitle(i18n("Exporting Comic..."))
+        self.dialog.setCancelButton(None)
+
+    def show(self):
+        self.dialog.show()
+        qApp.processEvents()
+
+    def setMaximum(self, maximum):
+        self.dialog.setMaximum(maximum)
+
+    def value(self):
+        return self.dialog.value()
+
+    def setValue(self, value):
+        self.dialog.setValue(value)
+
+    def setLabelText(self, text):
+        self.dialog.setLabelText(text)
+        qApp.processEvents()
+
+    def warning(self, title, message):
+        QMessageBox.warning(None, title, message, QMessageBox.Ok)
+
+
+"""
+Writes the progress to a stream as json lines, for running the export without a gui.
+Every line is an object with an "event" key, which is "progress" or "warning".
+The warnings are also kept, so they can be put into the result summary.
+"""
+
+
+class stream_progress():
+    stream = None
+    maximum = 0
+    currentValue = 0
+    label = str()
+    warnings = []
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        if self.stream is None:
+            self.stream = sys.stdout
+        self.maximum = 0
+        self.currentValue = 0
+        self.label = str()
+        self.warnings = []
+
+    def emit(self, event):
+        self.stream.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+    def emit_progress(self):
+        self.emit({"event": "progress", "value": self.currentValue, "maximum": self.maximum, "label": self.label})
+
+    def show(self):
+        self.emit_progress()
+
+    def setMaximum(self, maximum):
+        self.maximum = maximum
+
+    def value(self):
+        return self.currentValue
+
+    def setValue(self, value):
+        if value != self.currentValue:
+            self.currentValue = value
+            self.emit_progress()
+
+    def setLabelText(self, text):
+        # The label is made for a dialog, so put it on one line.
+        text = " ".join(str(text).split())
+        if text != self.label:
+            self.label = text
+            self.emit_progress()
+
+    def warning(self, title, message):
+        self.warnings.append({"title": str(title), "message": str(message)})
+        self.emit({"event": "warning", "title": str(title), "message": str(message)})
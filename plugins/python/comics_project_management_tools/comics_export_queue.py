@@ -0,0 +1,231 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+The export queue exports several comics projects in one go:
+
+kritarunner -s comics_project_management_tools.comics_export_queue -f export_queue [--workers=8] [--projects=2] [--queue=queue.json] [--report=report.json] [--formats=CBZ,EPUB] [--draft] chapter1/comicConfig.json chapter2/comicConfig.json
+
+Every project is exported by its own headless export process, and the queue makes sure
+that all of them together don't use more export processes than the worker budget. As the
+projects overlap, the next project can already export pages while the previous one is
+busy packaging.
+
+The queue file is a json list of projects, each an object with "config" and optionally
+"deadline" (an ISO date and time), "priority" (higher goes first), "formats" and "draft".
+Projects are started by deadline, then by priority, and then the biggest first, so the
+small ones fill up the gaps at the end. A project that fails doesn't stop the queue.
+At the end, a report with the timings and errors of all projects is written.
+"""
+
+import os
+import json
+import time
+import subprocess
+from pathlib import Path
+from . import comics_exporter, comics_export_headless
+
+"""
+Parse the arguments into the options and the list of projects.
+"""
+
+
+def read_arguments(args):
+    options = {}
+    options["workers"] = os.cpu_count() or 1
+    options["projects"] = 2
+    options["report"] = str(Path(os.getcwd()) / "export-queue-report.json")
+    options["runner"] = str()
+    projects = []
+    defaults = {}
+    for arg in args:
+        if arg.startswith("--workers="):
+            options["workers"] = max(1, int(arg[len("--workers="):]))
+        elif arg.startswith("--projects="):
+            options["projects"] = max(1, int(arg[len("--projects="):]))
+        elif arg.startswith("--report="):
+            options["report"] = os.path.abspath(arg[len("--report="):])
+        elif arg.startswith("--runner="):
+            options["runner"] = arg[len("--runner="):]
+        elif arg.startswith("--formats="):
+            defaults["formats"] = [key.upper() for key in arg[len("--formats="):].split(",") if len(key) > 0]
+        elif arg == "--draft":
+            defaults["draft"] = True
+        elif arg.startswith("--queue="):
+            file = open(arg[len("--queue="):], "r", newline="", encoding="utf-8")
+            projects.extend(json.load(file))
+            file.close()
+        else:
+            projects.append({"config": arg})
+    for project in projects:
+        project["config"] = os.path.abspath(project["config"])
+        for key in defaults.keys():
+            project.setdefault(key, defaults[key])
+    return options, projects
+
+
+"""
+Estimate how much work a project is, from the size of its pages on disk.
+"""
+
+
+def project_size(project):
+    size = 0
+    try:
+        config = comics_export_headless.read_config(project["config"])
+    except (OSError, ValueError):
+        return size
+    projectURL = os.path.dirname(project["config"])
+    for page in config.get("pages", []):
+        location = os.path.join(projectURL, page)
+        if os.path.exists(location):
+            size += os.path.getsize(location)
+    project["pages"] = len(config.get("pages", []))
+    return size
+
+
+"""
+Sort the projects: deadlines first, earliest first, then higher priority, then bigger projects.
+"""
+
+
+def sort_projects(projects):
+    for project in projects:
+        project["size"] = project_size(project)
+    # ISO dates sort as text, projects without a deadline go last.
+    projects.sort(key=lambda project: (project.get("deadline") is None, str(project.get("deadline", str())), -project.get("priority", 0), -project["size"]))
+    return projects
+
+
+"""
+Start the headless export of a project with the given amount of workers.
+"""
+
+
+def start_project(runner, project, workers, logFolder, index):
+    name = str(format(index, "03d") + "_" + Path(project["config"]).parent.name)
+    project["result"] = str(Path(logFolder) / str(name + "-result.json"))
+    project["log"] = str(Path(logFolder) / str(name + ".log"))
+    project["workers"] = workers
+    command = [runner, "-s", __package__ + ".comics_export_headless", "-f", "export_project", project["config"], str("--workers=" + str(workers)), str("--result=" + project["result"])]
+    command.extend(project.get("formats", []))
+    if project.get("draft", False):
+        command.append("--draft")
+    if project.get("resume", False):
+        command.append("--resume")
+    log = open(project["log"], "w", newline="", encoding="utf-8")
+    project["started"] = time.time()
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    print("CPMT: Queue started", project["config"], "with", workers, "workers.")
+    return process, log
+
+
+"""
+Read back the result of a finished project.
+"""
+
+
+def finish_project(project, process):
+    project["seconds"] = time.time() - project["started"]
+    project["exitCode"] = process.returncode
+    result = {}
+    if os.path.exists(project.get("result", str())):
+        file = open(project["result"], "r", newline="", encoding="utf-8")
+        result = json.load(file)
+        file.close()
+    project["success"] = process.returncode == 0 and result.get("success", False)
+    project["warnings"] = result.get("warnings", [])
+    project["outputs"] = result.get("outputs", [])
+    project["exportSeconds"] = result.get("seconds", 0.0)
+    if "error" in result.keys():
+        project["error"] = result["error"]
+    elif project["success"] is False and len(result.keys()) == 0:
+        project["error"] = str("The export stopped without a result, see " + project["log"])
+    print("CPMT: Queue finished", project["config"], "success" if project["success"] else "failed", "in", format(project["seconds"], ".1f"), "s")
+
+
+def write_report(location, options, projects, seconds):
+    report = {}
+    report["workers"] = options["workers"]
+    report["seconds"] = seconds
+    report["succeeded"] = len([project for project in projects if project.get("success", False)])
+    report["failed"] = len(projects) - report["succeeded"]
+    report["projects"] = projects
+    file = open(location, "w", newline="", encoding="utf-8")
+    json.dump(report, file, indent=1, ensure_ascii=False)
+    file.close()
+
+    print("CPMT: Export queue report")
+    print("CPMT: {:<50} {:>8} {:>8} {:>10}".format("project", "workers", "result", "time (s)"))
+    for project in projects:
+        state = "ok"
+        if project.get("success", False) is False:
+            state = "failed"
+        print("CPMT: {:<50} {:>8} {:>8} {:>10.1f}".format(project["config"][-50:], project.get("workers", 0), state, project.get("seconds", 0.0)))
+        if "error" in project.keys():
+            print("CPMT:   " + str(project["error"]).strip().split("\n")[-1])
+    print("CPMT: {} of {} projects exported in {:.1f} s".format(report["succeeded"], len(projects), seconds))
+
+
+def export_queue(args):
+    options, projects = read_arguments(args)
+    if len(projects) == 0:
+        print("CPMT: The export queue needs at least one project.")
+        return 1
+    runner = comics_exporter.find_kritarunner(options["runner"])
+    if runner is None:
+        print("CPMT: Could not find kritarunner, which the export queue needs.")
+        return 1
+
+    logFolder = Path(options["report"]).parent / str(Path(options["report"]).stem + "-logs")
+    logFolder.mkdir(parents=True, exist_ok=True)
+    sort_projects(projects)
+
+    # Each project gets a fair share of the budget, and a project that is started when
+    # there's less left makes do with what remains.
+    share = max(1, options["workers"] // min(options["projects"], len(projects)))
+    startTime = time.time()
+    waiting = list(range(len(projects)))
+    running = []
+    freeWorkers = options["workers"]
+    while len(waiting) > 0 or len(running) > 0:
+        for entry in list(running):
+            index, process, log = entry
+            if process.poll() is not None:
+                log.close()
+                finish_project(projects[index], process)
+                freeWorkers += projects[index]["workers"]
+                running.remove(entry)
+        while len(waiting) > 0 and freeWorkers > 0 and len(running) < options["projects"]:
+            index = waiting.pop(0)
+            workers = min(share, freeWorkers, max(1, projects[index].get("pages", 1)))
+            try:
+                process, log = start_project(runner, projects[index], workers, str(logFolder), index)
+            except OSError as error:
+                projects[index]["success"] = False
+                projects[index]["error"] = str(error)
+                continue
+            freeWorkers -= workers
+            running.append((index, process, log))
+        time.sleep(0.5)
+
+    write_report(options["report"], options, projects, time.time() - startTime)
+    if all(project.get("success", False) for project in projects):
+        return 0
+    return 1
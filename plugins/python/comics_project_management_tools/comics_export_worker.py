@@ -0,0 +1,86 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+The export worker is what the comicsExporter starts in separate kritarunner processes
+when exporting with more than one process:
+
+kritarunner -s comics_project_management_tools.comics_export_worker -f export_pages job.json
+
+The job file holds the config, the sizes list and which pages this worker should do.
+For every page a json file with the page data and the written files is put in the result
+location, named after the page index, so the exporter can put them back in order.
+"""
+
+import os
+import json
+import traceback
+from pathlib import Path
+from krita import *
+from . import comics_exporter
+
+"""
+Write a result file in one go, so the exporter never reads a half written file.
+"""
+
+
+def write_result(location, p, result):
+    fileName = str(Path(location) / str("page_" + format(p, "04d") + ".json"))
+    file = open(fileName + ".part", "w", newline="", encoding="utf-8")
+    json.dump(result, file, ensure_ascii=False)
+    file.close()
+    os.replace(fileName + ".part", fileName)
+
+
+def export_pages(args):
+    if len(args) < 1:
+        print("CPMT: The export worker needs a job file.")
+        return 1
+    file = open(args[0], "r", newline="", encoding="utf-8")
+    job = json.load(file)
+    file.close()
+
+    exporter = comics_exporter.comicsExporter()
+    exporter.set_config(job["config"], job["projectURL"])
+    if "cropToGuides" not in exporter.configDictionary.keys():
+        exporter.configDictionary["cropToGuides"] = False
+
+    Application.setBatchmode(True)
+    exporter.prefetch_vector_shapes(job["pages"])
+    failed = 0
+    for p in job["pages"]:
+        result = {}
+        result["index"] = p
+        try:
+            sizesList = job["sizesList"]
+            if str(p) in job.get("pageKeys", {}).keys():
+                sizesList = exporter.get_sizes_for_keys(sizesList, job["pageKeys"][str(p)])
+            pageData, pageFiles = exporter.export_page(p, sizesList)
+            result["pageData"] = comics_exporter.page_data_to_json(pageData)
+            result["files"] = pageFiles
+            result["profile"] = exporter.profiler.records
+            result["notes"] = exporter.profiler.notes
+        except Exception:
+            result["error"] = traceback.format_exc()
+            failed += 1
+        exporter.profiler.records = []
+        exporter.profiler.notes = []
+        write_result(job["resultLocation"], p, result)
+    exporter.stop_prefetch()
+    return failed
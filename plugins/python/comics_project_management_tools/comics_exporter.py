@@ -21,17 +21,25 @@ along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
 An exporter that take the comicsConfig and uses it to generate several files.
 """
 import sys
+import os
+import gc
+import json
+import base64
+import shutil
+import subprocess
+import time
+import concurrent.futures
 from pathlib import Path
-import zipfile
 from xml.dom import minidom
 from xml.etree import ElementTree as ET
 import types
+import zipfile
 import re
-from PyQt5.QtWidgets import QLabel, QProgressDialog, QMessageBox, qApp  # For the progress dialog.
-from PyQt5.QtCore import QElapsedTimer, QLocale, Qt, QRectF, QPointF
-from PyQt5.QtGui import QImage, QTransform, QPainterPath, QFontMetrics, QFont
+from PyQt5.QtWidgets import QLabel, QMessageBox, qApp
+from PyQt5.QtCore import QByteArray, QCoreApplication, QElapsedTimer, QLocale, Qt, QRectF, QPointF
+from PyQt5.QtGui import QImage, QTransform, QPainterPath
 from krita import *
-from . import exporters
+from . import exporters, comics_export_manifest, comics_cbz_writer, comics_export_profiler, comics_kra_archive, comics_export_journal, comics_export_progress, comics_font_metrics, comics_page_index
 
 """
 The sizesCalculator is a convenience class for interpretting the resize configuration
@@ -74,9 +82,66 @@ class sizesCalculator():
                 height = config["Height"]
                 listScaleTo[1] = height
                 listScaleTo[0] = round((oldWidth / oldHeight) * height)
+            if method == 4:
+                # maximum long edge, smaller pages are left as they are.
+                longEdge = config["LongEdge"]
+                if max(oldWidth, oldHeight) > longEdge:
+                    scale = longEdge / max(oldWidth, oldHeight)
+                    listScaleTo[0] = round(oldWidth * scale)
+                    listScaleTo[1] = round(oldHeight * scale)
         return listScaleTo
 
 
+"""
+The page data holds QPointF bounding boxes, which json doesn't know about.
+These two functions convert the page data to something json can store and back, so
+it can be passed between export processes.
+"""
+
+
+def page_data_to_json(pageData):
+    data = dict(pageData)
+    vectorList = []
+    for v in pageData.get("vector", []):
+        shapeDesc = dict(v)
+        shapeDesc["boundingBox"] = [[point.x(), point.y()] for point in v["boundingBox"]]
+        vectorList.append(shapeDesc)
+    data["vector"] = vectorList
+    return data
+
+
+def page_data_from_json(data):
+    pageData = dict(data)
+    vectorList = []
+    for v in data.get("vector", []):
+        shapeDesc = dict(v)
+        shapeDesc["boundingBox"] = [QPointF(point[0], point[1]) for point in v["boundingBox"]]
+        vectorList.append(shapeDesc)
+    pageData["vector"] = vectorList
+    return pageData
+
+
+"""
+Find the kritarunner executable. It's installed next to krita, but can also
+be configured with "kritarunnerPath" in the config.
+
+@param runner: the configured location of kritarunner, used when it exists.
+@returns the location of kritarunner, or None when it can't be found.
+"""
+
+
+def find_kritarunner(runner=str()):
+    if len(runner) > 0 and os.path.exists(runner):
+        return runner
+    runnerName = "kritarunner"
+    if sys.platform == "win32":
+        runnerName += ".exe"
+    runner = os.path.join(QCoreApplication.applicationDirPath(), runnerName)
+    if os.path.exists(runner):
+        return runner
+    return shutil.which(runnerName)
+
+
 """
 The comicsExporter is a class that batch exports to all the requested formats.
 Make it, set_config with the right data, and then call up "export".
@@ -91,6 +156,13 @@ class comicsExporter():
     cometLocation = str()
     comicRackInfo = str()
     pagesLocationList = {}
+    progress = None
+    manifest = None
+    cbzWriter = None
+    profiler = None
+    vectorShapes = {}
+    vectorPool = None
+    pageHashes = {}
 
     # set of keys used to define specific export behaviour for this page.
     pageKeys = ["acbf_title", "acbf_none", "acbf_fade", "acbf_blend", "acbf_horizontal", "acbf_vertical", "epub_spread"]
@@ -114,13 +186,55 @@ class comicsExporter():
         self.acbfPageData = []
         self.cometLocation = str()
         self.comicRackInfo = str()
+        self.manifest = None
+        self.cbzWriter = None
+        self.profiler = comics_export_profiler.export_profiler()
+        if config.get("lowMemoryExport", False):
+            self.profiler.memoryCeiling = int(config.get("memoryCeiling", 4096)) * 1024 * 1024
+        self.vectorShapes = {}
+        self.vectorPool = None
+        self.fontMetrics = comics_font_metrics.font_metrics_cache()
+        self.pageIndex = comics_page_index.page_index(projectURL, str(Path(projectURL) / config.get("exportLocation", str()) / "metadata" / "page-index.json"))
+        self.journal = None
+        self.journalPages = {}
+        self.pageHashes = {}
+
+    """
+    Turn the export into a draft, a quick cbz for proofreading. The pages are made from
+    the merged image where possible, scaled down to a maximum long edge with a cheap filter,
+    and saved as low quality jpeg, without looking for panels and text.
+    Drafts go into a "draft" folder in the export folder, so they don't mix with the real export.
+    Call this after set_config.
+    """
+
+    def set_draft(self):
+        config = dict(self.configDictionary)
+        config["exportLocation"] = str(Path(config.get("exportLocation", str())) / "draft")
+        draft = {}
+        draft["Method"] = 4
+        draft["LongEdge"] = config.get("draftLongEdge", 1600)
+        draft["FileType"] = "jpg"
+        draft["Crop"] = config.get("CBZ", {}).get("Crop", False)
+        draft["Quality"] = config.get("draftQuality", 60)
+        draft["Filter"] = "Bilinear"
+        config["CBZ"] = draft
+        config["CBZactive"] = True
+        config["CBZcompress"] = False
+        config["EPUBactive"] = False
+        config["TIFFactive"] = False
+        config["fastExport"] = True
+        config["archiveVectorExtraction"] = False
+        config["skipVectorExtraction"] = True
+        self.configDictionary = config
 
     """
     Export everything according to config and get yourself a coffee.
     This won't work if the config hasn't been set.
+
+    @param resume: pick up an export that was interrupted, reusing the pages it finished.
     """
 
-    def export(self):
+    def export(self, resume=False):
         export_success = False
 
         path = Path(self.projectURL)
@@ -128,7 +242,7 @@ class comicsExporter():
             # Make a meta-data folder so we keep the export folder nice and clean.
             exportPath = path / self.configDictionary["exportLocation"]
             if Path(exportPath / "metadata").exists() is False:
-                Path(exportPath / "metadata").mkdir()
+                Path(exportPath / "metadata").mkdir(parents=True)
 
             # Get to which formats to export, and set the sizeslist.
             lengthProcess = len(self.configDictionary["pages"])
@@ -145,17 +259,17 @@ class comicsExporter():
                 if self.configDictionary["TIFFactive"]:
                     sizesList["TIFF"] = self.configDictionary["TIFF"]
             # Export the pngs according to the sizeslist.
-            # Create a progress dialog.
-            self.progress = QProgressDialog(i18n("Preparing export."), str(), 0, lengthProcess)
-            self.progress.setWindowTitle(i18n("Exporting Comic..."))
-            self.progress.setCancelButton(None)
+            # Create a progress dialog, unless something else was set up to show the progress.
+            if self.progress is None:
+                self.progress = comics_export_progress.dialog_progress()
+            self.progress.setMaximum(lengthProcess)
             self.timer = QElapsedTimer()
             self.timer.start()
             self.progress.show()
-            qApp.processEvents()
-            export_success = self.save_out_pngs(sizesList)
+            export_success = self.save_out_pngs(sizesList, resume)
 
             # Export acbf metadata.
+            self.profiler.start_page(None)
             if export_success:
                 if "CBZ" in sizesList.keys():
                     title = self.configDictionary["projectName"]
@@ -169,19 +283,39 @@ class comicsExporter():
                     self.progress.setValue(self.progress.value()+2)
                     export_success = exporters.ACBF.write_xml(self.configDictionary, self.acbfPageData, self.pagesLocationList["CBZ"], self.acbfLocation, locationStandAlone, self.projectURL)
                     print("CPMT: Exported to ACBF", export_success)
+                    self.profiler.lap("ACBF", "CBZ")
 
             # Export and package CBZ and Epub.
             if export_success:
                 if "CBZ" in sizesList.keys():
                     export_success = self.export_to_cbz(exportPath)
                     print("CPMT: Exported to CBZ", export_success)
+                    self.profiler.lap("packaging", "CBZ")
                 if "EPUB" in sizesList.keys():
                     self.progress.setLabelText(i18n("Saving out EPUB"))
                     self.progress.setValue(self.progress.value()+1)
                     export_success = exporters.EPUB.export(self.configDictionary, self.projectURL, self.pagesLocationList["EPUB"], self.acbfPageData)
                     print("CPMT: Exported to EPUB", export_success)
+                    self.profiler.lap("packaging", "EPUB")
+
+            # A cbz that was started but never finished shouldn't be left behind.
+            if self.cbzWriter is not None:
+                self.cbzWriter.abort()
+                self.cbzWriter = None
+
+            self.pageIndex.save()
+
+            # The journal is only kept around when the export didn't finish.
+            if self.journal is not None:
+                self.journal.close(export_success)
+                self.journal = None
+
+            # Write out where the time went.
+            if len(self.profiler.records) > 0:
+                self.profiler.write_report(str(exportPath / "metadata"), self.configDictionary.get("pages", []))
+                self.profiler.print_summary(self.configDictionary.get("pages", []))
         else:
-            QMessageBox.warning(None, i18n("Export not Possible"), i18n("Nothing to export, URL not set."), QMessageBox.Ok)
+            self.warning(i18n("Export not Possible"), i18n("Nothing to export, URL not set."))
             print("CPMT: Nothing to export, url not set.")
 
         return export_success
@@ -205,7 +339,7 @@ class comicsExporter():
         self.package_cbz(exportPath)
         return export_success
 
-    def save_out_pngs(self, sizesList):
+    def save_out_pngs(self, sizesList, resume=False):
         # A small fix to ensure crop to guides is set.
         if "cropToGuides" not in self.configDictionary.keys():
             self.configDictionary["cropToGuides"] = False
@@ -215,168 +349,735 @@ class comicsExporter():
 
             # Check if there's export methods, and if so make sure the appropriate dictionaries are initialised.
             if len(sizesList.keys()) < 1:
-                QMessageBox.warning(None, i18n("Export not Possible"), i18n("Export failed because there's no export settings configured."), QMessageBox.Ok)
+                self.warning(i18n("Export not Possible"), i18n("Export failed because there's no export settings configured."))
                 print("CPMT: Export failed because there's no export methods set.")
                 return False
             else:
                 for key in sizesList.keys():
                     self.pagesLocationList[key] = []
+                self.pageHashes = {}
 
-            # Get the appropriate paths.
-            path = Path(self.projectURL)
-            exportPath = path / self.configDictionary["exportLocation"]
             pagesList = self.configDictionary["pages"]
-            fileName = str(exportPath)
+            exportPath = Path(self.projectURL) / self.configDictionary["exportLocation"]
+
+            # Pages go into the cbz as soon as they're done.
+            if "CBZ" in sizesList.keys():
+                self.cbzWriter = comics_cbz_writer.cbz_writer(self.get_cbz_url(exportPath), self.configDictionary.get("CBZcompress", False))
 
-            """
-            Mini function to handle the setup of this string.
-            """
-            def timeString(timePassed, timeEstimated):
-                return str(i18n("Time passed: {passedString}\n Estimated: {estimated}")).format(passedString=timePassed, estimated=timeEstimated)
+            # Pages that haven't changed since the last export can reuse the files from then.
+            if self.configDictionary.get("incrementalExport", True):
+                self.manifest = comics_export_manifest.export_manifest(str(exportPath / "metadata" / "export-manifest.json"))
 
+            # Write down every finished page, so an interrupted export can be resumed.
+            self.journal = comics_export_journal.export_journal(str(exportPath / "metadata" / "export-journal.jsonl"), comics_export_journal.make_fingerprint(self.configDictionary, sizesList))
+            self.journalPages = {}
+            if resume:
+                self.journalPages = self.journal.finished_pages(pagesList)
+                print("CPMT: Resuming the export,", len(self.journalPages), "pages were already done.")
+            self.journal.start(pagesList, self.journalPages)
+
+            # Hand the pages to a pool of kritarunner processes if the user asked for that.
+            workers = min(int(self.configDictionary.get("exportWorkers", 1)), len(pagesList))
+            if workers > 1:
+                runner = find_kritarunner(self.configDictionary.get("kritarunnerPath", str()))
+                if runner is not None:
+                    return self.save_out_pngs_parallel(sizesList, runner, workers)
+                print("CPMT: Could not find kritarunner, exporting all pages in this process instead.")
+
+            batchsave = Application.batchmode()
+            Application.setBatchmode(True)
+            staleKeysList = [self.get_stale_keys(p, sizesList) for p in range(len(pagesList))]
+            self.prefetch_vector_shapes([p for p in range(len(pagesList)) if len(staleKeysList[p]) > 0])
             for p in range(0, len(pagesList)):
-                pagesDone = str(i18n("{pages} of {pagesTotal} done.")).format(pages=p, pagesTotal=len(pagesList))
-
-                # Update the label in the progress dialog.
-                self.progress.setValue(p)
-                timePassed = self.timer.elapsed()
-                if p > 0:
-                    timeEstimated = (len(pagesList) - p) * (timePassed / p)
-                    estimatedString = self.parseTime(timeEstimated)
+                self.set_page_progress(p, len(pagesList))
+                self.profiler.start_page(p)
+                staleKeys = staleKeysList[p]
+                pageData = None
+                pageFiles = {}
+                if len(staleKeys) > 0:
+                    pageData, pageFiles = self.export_page(p, self.get_sizes_for_keys(sizesList, staleKeys))
+                elif p in self.journalPages.keys():
+                    self.set_page_status(i18n("Page was done before the export was interrupted"))
                 else:
-                    estimatedString = str(u"\u221E")
-                passedString = self.parseTime(timePassed)
-                self.progress.setLabelText("\n".join([pagesDone, timeString(passedString, estimatedString), i18n("Opening next page")]))
-                qApp.processEvents()
-                # Get the appropriate url and open the page.
-                url = str(Path(self.projectURL) / pagesList[p])
-                page = Application.openDocument(url)
-                page.waitForDone()
-                
-                # Update the progress bar a little
-                self.progress.setLabelText("\n".join([pagesDone, timeString(self.parseTime(self.timer.elapsed()), estimatedString), i18n("Cleaning up page")]))
-
-                # remove layers and flatten.
-                labelList = self.configDictionary["labelsToRemove"]
-                panelsAndText = []
-
-                # These three lines are what is causing the page not to close.
-                root = page.rootNode()
-                self.getPanelsAndText(root, panelsAndText)
-                self.removeLayers(labelList, root)
-                page.refreshProjection()
-                # We'll need the offset and scale for aligning the panels and text correctly. We're getting this from the CBZ
-                
-                pageData = {}
-                pageData["vector"] = panelsAndText
-                tree = ET.fromstring(page.documentInfo())
-                pageData["title"] = page.name()
-                calligra = "{http://www.calligra.org/DTD/document-info}"
-                about = tree.find(calligra + "about")
-                keywords = about.find(calligra + "keyword")
-                keys = str(keywords.text).split(",")
-                pKeys = []
-                for key in keys:
-                    if key in self.pageKeys:
-                        pKeys.append(key)
-                pageData["keys"] = pKeys
-                page.flatten()
-                page.waitForDone()
-                batchsave = Application.batchmode()
-                Application.setBatchmode(True)
-                # Start making the format specific copy.
-                for key in sizesList.keys():
-                    
-                    # Update the progress bar a little
-                    self.progress.setLabelText("\n".join([pagesDone, timeString(self.parseTime(self.timer.elapsed()), estimatedString), str(i18n("Exporting for {key}")).format(key=key)]))
-                    
-                    w = sizesList[key]
-                    # copy over data
-                    projection = page.clone()
-                    projection.setBatchmode(True)
-                    # Crop. Cropping per guide only happens if said guides have been found.
-                    if w["Crop"] is True:
-                        listHGuides = []
-                        listHGuides = page.horizontalGuides()
-                        listHGuides.sort()
-                        for i in range(len(listHGuides) - 1, 0, -1):
-                            if listHGuides[i] < 0 or listHGuides[i] > page.height():
-                                listHGuides.pop(i)
-                        listVGuides = page.verticalGuides()
-                        listVGuides.sort()
-                        for i in range(len(listVGuides) - 1, 0, -1):
-                            if listVGuides[i] < 0 or listVGuides[i] > page.width():
-                                listVGuides.pop(i)
-                        if self.configDictionary["cropToGuides"] and len(listVGuides) > 1:
-                            cropx = listVGuides[0]
-                            cropw = listVGuides[-1] - cropx
-                        else:
-                            cropx = self.configDictionary["cropLeft"]
-                            cropw = page.width() - self.configDictionary["cropRight"] - cropx
-                        if self.configDictionary["cropToGuides"] and len(listHGuides) > 1:
-                            cropy = listHGuides[0]
-                            croph = listHGuides[-1] - cropy
-                        else:
-                            cropy = self.configDictionary["cropTop"]
-                            croph = page.height() - self.configDictionary["cropBottom"] - cropy
-                        projection.crop(cropx, cropy, cropw, croph)
-                        projection.waitForDone()
-                        qApp.processEvents()
-                        # resize appropriately
-                    else:
-                        cropx = 0
-                        cropy = 0
-                    res = page.resolution()
-                    listScales = [projection.width(), projection.height(), res, res]
-                    projectionOldSize = [projection.width(), projection.height()]
-                    sizesCalc = sizesCalculator()
-                    listScales = sizesCalc.get_scale_from_resize_config(config=w, listSizes=listScales)
-                    projection.scaleImage(listScales[0], listScales[1], listScales[2], listScales[3], "bicubic")
-                    projection.waitForDone()
-                    qApp.processEvents()
-                    # png, gif and other webformats should probably be in 8bit srgb at maximum.
-                    if key != "TIFF":
-                        if (projection.colorModel() != "RGBA" and projection.colorModel() != "GRAYA") or projection.colorDepth() != "U8":
-                            projection.setColorSpace("RGBA", "U8", "sRGB built-in")
-                    else:
-                        # Tiff on the other hand can handle all the colormodels, but can only handle integer bit depths.
-                        # Tiff is intended for print output, and 16 bit integer will be sufficient.
-                        if projection.colorDepth() != "U8" or projection.colorDepth() != "U16":
-                            projection.setColorSpace(page.colorModel(), "U16", page.colorProfile())
-                    # save
-                    # Make sure the folder name for this export exists. It'll allow us to keep the
-                    # export folders nice and clean.
-                    folderName = str(key + "-" + w["FileType"])
-                    if Path(exportPath / folderName).exists() is False:
-                        Path.mkdir(exportPath / folderName)
-                    # Get a nice and descriptive fle name.
-                    fn = str(Path(exportPath / folderName) / str("page_" + format(p, "03d") + "_" + str(listScales[0]) + "x" + str(listScales[1]) + "." + w["FileType"]))
-                    # Finally save and add the page to a list of pages. This will make it easy for the packaging function to
-                    # find the pages and store them.
-                    projection.exportImage(fn, InfoObject())
-                    projection.waitForDone()
-                    qApp.processEvents()
-                    if key == "CBZ" or key == "EPUB":
-                        transform = {}
-                        transform["offsetX"] = cropx
-                        transform["offsetY"] = cropy
-                        transform["resDiff"] = page.resolution() / 72
-                        transform["scaleWidth"] = projection.width() / projectionOldSize[0]
-                        transform["scaleHeight"] = projection.height() / projectionOldSize[1]
-                        pageData["transform"] = transform
-                    self.pagesLocationList[key].append(fn)
-                    projection.close()
-                self.acbfPageData.append(pageData)
-                page.close()
+                    self.set_page_status(i18n("Page is unchanged, reusing the previous export"))
+                self.finish_page_result(p, sizesList, staleKeys, pageData, pageFiles)
             self.progress.setValue(len(pagesList))
             Application.setBatchmode(batchsave)
+            self.stop_prefetch()
+            if self.manifest is not None:
+                self.manifest.save(pagesList)
             # TODO: Check what or whether memory leaks are still caused and otherwise remove the entry below.
             print("CPMT: Export has finished. If there are memory leaks, they are caused by file layers.")
             return True
         print("CPMT: Export not happening because there aren't any pages.")
-        QMessageBox.warning(None, i18n("Export not Possible"), i18n("Export not happening because there are no pages."), QMessageBox.Ok)
+        self.warning(i18n("Export not Possible"), i18n("Export not happening because there are no pages."))
+        return False
+
+    """
+    Update the progress dialog for the page that is about to be exported.
+    The lines written here are kept so that export_page can add what it's currently doing.
+    """
+
+    def set_page_progress(self, p, pagesTotal):
+        pagesDone = str(i18n("{pages} of {pagesTotal} done.")).format(pages=p, pagesTotal=pagesTotal)
+
+        # Update the label in the progress dialog.
+        self.progress.setValue(p)
+        timePassed = self.timer.elapsed()
+        if p > 0:
+            timeEstimated = (pagesTotal - p) * (timePassed / p)
+            self.estimatedString = self.parseTime(timeEstimated)
+        else:
+            self.estimatedString = str(u"\u221E")
+        self.pagesDoneString = pagesDone
+        self.set_page_status(i18n("Opening next page"))
+
+    """
+    Set the last line of the progress label, if there's a progress dialog at all.
+    """
+
+    def set_page_status(self, status):
+        if self.progress is None:
+            return
+        timeString = str(i18n("Time passed: {passedString}\n Estimated: {estimated}")).format(passedString=self.parseTime(self.timer.elapsed()), estimated=self.estimatedString)
+        self.progress.setLabelText("\n".join([self.pagesDoneString, timeString, status]))
+
+    """
+    Tell the user something went wrong, through the progress if there is one.
+    """
+
+    def warning(self, title, message):
+        if self.progress is not None:
+            self.progress.warning(title, message)
+        else:
+            QMessageBox.warning(None, title, message, QMessageBox.Ok)
+
+    """
+    Get the keys of the sizes list that still need to be exported for the given page.
+    Without a manifest, that's all of them, and the same goes for pages with file layers.
+    """
+
+    def get_stale_keys(self, p, sizesList):
+        if p in self.journalPages.keys():
+            return []
+        if self.manifest is None:
+            return list(sizesList.keys())
+        relativeUrl = self.configDictionary["pages"][p]
+        absoluteUrl = str(Path(self.projectURL) / relativeUrl)
+        # A file layer can change without the kra file changing, so those pages are always exported.
+        info = self.pageIndex.page(absoluteUrl)
+        if info is None or any(layer["nodetype"] == "filelayer" for layer in info["layers"]):
+            return list(sizesList.keys())
+        return self.manifest.stale_keys(relativeUrl, absoluteUrl, p, sizesList, self.configDictionary)
+
+    def get_sizes_for_keys(self, sizesList, keys):
+        sizes = {}
+        for key in sizesList.keys():
+            if key in keys:
+                sizes[key] = sizesList[key]
+        return sizes
+
+    """
+    Combine the freshly exported files of a page with the ones that could be reused,
+    remember the result in the manifest and add it to the page lists.
+
+    @param pageData: the page data of the export, or None when the page wasn't opened at all.
+    """
+
+    def finish_page_result(self, p, sizesList, staleKeys, pageData, pageFiles):
+        # Pages from the journal are complete, they don't need anything from the manifest.
+        resumed = p in self.journalPages.keys()
+        if resumed:
+            pageData = page_data_from_json(self.journalPages[p][0])
+            pageFiles = dict(self.journalPages[p][1])
+            staleKeys = list(sizesList.keys())
+        if self.manifest is not None:
+            relativeUrl = self.configDictionary["pages"][p]
+            cachedData, cachedFiles = self.manifest.cached_result(relativeUrl)
+            for key in sizesList.keys():
+                if key not in staleKeys:
+                    pageFiles[key] = cachedFiles[key]
+            if pageData is None:
+                pageData = page_data_from_json(cachedData)
+            else:
+                for field in ["transforms", "hashes", "images"]:
+                    for key in cachedData.get(field, {}).keys():
+                        if key not in staleKeys:
+                            pageData.setdefault(field, {})[key] = cachedData[field][key]
+            self.manifest.update_page(relativeUrl, str(Path(self.projectURL) / relativeUrl), p, sizesList, self.configDictionary, page_data_to_json(pageData), pageFiles)
+        pageFiles = self.get_sizes_for_keys(pageFiles, sizesList.keys())
+        self.add_page_result(pageData, pageFiles)
+        if self.journal is not None and resumed is False:
+            self.journal.add_page(p, self.configDictionary["pages"][p], page_data_to_json(pageData), pageFiles)
+
+    """
+    Add the result of a single exported page to the page data and locations lists.
+    This needs to happen in page order.
+
+    With CBZdedupe, a CBZ page that is identical to an earlier one isn't added to the
+    archive again, and the page list points at the earlier file instead. Only readers
+    that use the ACBF or ComicInfo page list show such pages, which is why it's optional.
+    """
+
+    def add_page_result(self, pageData, pageFiles):
+        pageFiles = dict(pageFiles)
+        if self.configDictionary.get("CBZdedupe", False) and "CBZ" in pageFiles.keys():
+            pageHash = pageData.get("hashes", {}).get("CBZ", None)
+            # Pages reused from an export without dedupe weren't hashed yet.
+            if pageHash is None and os.path.exists(pageFiles["CBZ"]):
+                pageHash = comics_export_manifest.file_hash(pageFiles["CBZ"])
+                pageData.setdefault("hashes", {})["CBZ"] = pageHash
+            if pageHash is not None:
+                pageFiles["CBZ"] = self.pageHashes.setdefault(pageHash, pageFiles["CBZ"])
+        for key in pageFiles.keys():
+            self.pagesLocationList[key].append(pageFiles[key])
+        self.acbfPageData.append(pageData)
+        if self.cbzWriter is not None and "CBZ" in pageFiles.keys():
+            self.cbzWriter.add_page(pageFiles["CBZ"])
+            self.profiler.lap("packaging", "CBZ")
+
+    """
+    Export a single page to all the sizes in the sizes list.
+
+    @param p: the index of the page in the pages list.
+
+    @returns the page data for acbf/epub, and a dictionary of the written file per size key.
+    """
+
+    def export_page(self, p, sizesList):
+        pagesList = self.configDictionary["pages"]
+
+        # Get the appropriate url and open the page. Pages without anything to remove or
+        # extract can be made from the merged image, which is a lot quicker than opening them.
+        url = str(Path(self.projectURL) / pagesList[p])
+        self.profiler.start_page(p)
+        page, pageData = self.open_page_merged(url, sizesList, p)
+        if page is None:
+            page, pageData = self.open_page(url, p)
+        pageFiles = {}
+        page = self.crop_scale_and_save(p, page, pageData, pageFiles, sizesList)
+        # In low memory mode the page may already have been put away on disk.
+        if page is not None:
+            page.close()
+            self.profiler.lap("close")
+        return pageData, pageFiles
+
+    """
+    Open the page in Krita, extract the panels and text, remove the layers with the
+    color labels to remove and flatten it.
+
+    @returns the flattened document and the page data.
+    """
+
+    def open_page(self, url, p):
+        page = Application.openDocument(url)
+        page.waitForDone()
+        self.profiler.lap("open")
+
+        # Update the progress bar a little
+        self.set_page_status(i18n("Cleaning up page"))
+
+        # remove layers and flatten.
+        labelList = self.configDictionary["labelsToRemove"]
+        panelsAndText = []
+
+        # These three lines are what is causing the page not to close.
+        root = page.rootNode()
+        archiveVector = self.get_vector_from_archive(p)
+        if archiveVector is not None:
+            panelsAndText = archiveVector
+        elif self.configDictionary.get("skipVectorExtraction", False) is False:
+            self.getPanelsAndText(root, panelsAndText)
+        self.profiler.lap("getPanelsAndText")
+        self.removeLayers(labelList, root)
+        page.refreshProjection()
+        self.profiler.lap("removeLayers")
+        # We'll need the offset and scale for aligning the panels and text correctly. We're getting this from the CBZ
+
+        pageData = {}
+        pageData["vector"] = panelsAndText
+        pageData["title"] = page.name()
+        pageData["keys"] = [key for key in self.pageIndex.keywords(url) if key in self.pageKeys]
+        self.profiler.lap("documentInfo")
+        page.flatten()
+        page.waitForDone()
+        self.profiler.lap("flatten")
+        return page, pageData
+
+    """
+    Check from the page info in the archive whether the page needs to be opened in Krita,
+    because it has layers to remove, panels or text to extract, file layers that may have
+    changed since saving, or a color space that the merged image doesn't keep.
+    """
+
+    def page_needs_document(self, info):
+        if info["hasMergedImage"] is False:
+            return True
+        if info["colorSpace"] == "RGBA" and "sRGB" not in info["profile"]:
+            return True
+        textLayersToSearch = self.configDictionary.get("textLayerNames", ["text"])
+        panelLayersToSearch = self.configDictionary.get("panelLayerNames", ["panels"])
+        for layer in info["layers"]:
+            if layer["colorlabel"] in self.configDictionary["labelsToRemove"]:
+                return True
+            if layer["nodetype"] == "filelayer":
+                return True
+            if self.configDictionary.get("skipVectorExtraction", False) or self.configDictionary.get("archiveVectorExtraction", False):
+                continue
+            if layer["nodetype"] == "shapelayer":
+                for name in textLayersToSearch + panelLayersToSearch:
+                    if str(name).lower() in layer["name"].lower():
+                        return True
         return False
 
+    """
+    Make a document from the merged image stored in the kra file, with the guides of the page.
+    The merged image is always 8 bit rgba, so this is only done when the page isn't exported to TIFF.
+
+    @returns the document and the page data, or None, None if the page needs to be opened after all.
+    """
+
+    def open_page_merged(self, url, sizesList, p):
+        if self.configDictionary.get("fastExport", True) is False or "TIFF" in sizesList.keys():
+            return None, None
+        info = self.pageIndex.page(url)
+        if info is None or self.page_needs_document(info):
+            return None, None
+        image = QImage.fromData(comics_kra_archive.read_merged_image(url), "PNG")
+        if image.isNull() or image.width() != info["width"] or image.height() != info["height"]:
+            return None, None
+        # ARGB32 has the same byte order as Krita's 8 bit RGBA.
+        image = image.convertToFormat(QImage.Format_ARGB32)
+
+        page = Application.createDocument(image.width(), image.height(), info["title"], "RGBA", "U8", "sRGB built-in", info["resolution"])
+        page.setBatchmode(True)
+        if len(page.topLevelNodes()) > 0:
+            node = page.topLevelNodes()[0]
+        else:
+            node = page.createNode("merged", "paintlayer")
+            page.rootNode().addChildNode(node, None)
+        bits = image.constBits()
+        bits.setsize(image.byteCount())
+        node.setPixelData(QByteArray(bytes(bits)), 0, 0, image.width(), image.height())
+        page.setHorizontalGuides(info["horizontalGuides"])
+        page.setVerticalGuides(info["verticalGuides"])
+        page.refreshProjection()
+        page.waitForDone()
+        self.profiler.lap("openMerged")
+
+        pageData = {}
+        pageData["vector"] = self.get_vector_from_archive(p)
+        if pageData["vector"] is None:
+            pageData["vector"] = []
+            if self.configDictionary.get("archiveVectorExtraction", False):
+                pageData["vector"] = self.read_vector_from_archive(url)
+        pageData["title"] = info["title"]
+        pageData["keys"] = [key for key in self.pageIndex.keywords(url) if key in self.pageKeys]
+        return page, pageData
+
+    """
+    Start reading the panels and text of the given pages from their kra files on a thread pool,
+    when reading them from the archive is enabled. Each page is read in one go, so this can
+    run ahead of the pages being opened and rendered.
+    """
+
+    def prefetch_vector_shapes(self, pages):
+        if self.configDictionary.get("archiveVectorExtraction", False) is False:
+            return
+        pagesList = self.configDictionary["pages"]
+        textLayerNames = self.configDictionary.get("textLayerNames", ["text"])
+        panelLayerNames = self.configDictionary.get("panelLayerNames", ["panels"])
+        self.vectorPool = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        for p in pages:
+            url = str(Path(self.projectURL) / pagesList[p])
+            self.vectorShapes[p] = self.vectorPool.submit(comics_kra_archive.read_vector_shapes, url, textLayerNames, panelLayerNames)
+
+    def stop_prefetch(self):
+        if self.vectorPool is not None:
+            self.vectorPool.shutdown(wait=False)
+            self.vectorPool = None
+        self.vectorShapes = {}
+
+    """
+    Get the vector data of a page that was read from its archive.
+
+    @returns the vector list for the page data, or None if it wasn't read, so the page needs
+    to be searched the usual way.
+    """
+
+    def get_vector_from_archive(self, p):
+        if p not in self.vectorShapes.keys():
+            return None
+        future = self.vectorShapes.pop(p)
+        try:
+            return comics_kra_archive.vector_from_shapes(future.result(), self.fontMetrics)
+        except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as error:
+            print("CPMT: Could not read the panels and text from the archive, opening the page instead:", error)
+            return None
+
+    def read_vector_from_archive(self, url):
+        shapes = comics_kra_archive.read_vector_shapes(url, self.configDictionary.get("textLayerNames", ["text"]), self.configDictionary.get("panelLayerNames", ["panels"]))
+        return comics_kra_archive.vector_from_shapes(shapes, self.fontMetrics)
+
+    """
+    Whether the memory use is getting close to the ceiling of the low memory export.
+    """
+
+    def memory_near_ceiling(self):
+        if self.profiler.memoryCeiling <= 0:
+            return False
+        return comics_export_profiler.current_rss() > self.profiler.memoryCeiling * 0.8
+
+    """
+    Check that closing documents actually gave them back. Krita only lets go of closed
+    documents once the events are processed, so do that first.
+
+    @param documentCount: the amount of open documents there should be.
+    """
+
+    def check_released(self, documentCount, what):
+        qApp.processEvents()
+        gc.collect()
+        if len(Application.documents()) > documentCount:
+            self.profiler.note(str(what + " was closed, but is still held in memory."))
+
+    """
+    Save the flattened page to the metadata folder and close it, so that it doesn't
+    take up memory while exporting. The copies are then opened from that file instead.
+
+    @returns the location of the saved page.
+    """
+
+    def spill_page(self, p, page):
+        spillPath = Path(self.projectURL) / self.configDictionary["exportLocation"] / "metadata" / "spill"
+        spillPath.mkdir(parents=True, exist_ok=True)
+        spillFile = str(spillPath / str("page_" + format(p, "03d") + ".kra"))
+        documentCount = len(Application.documents())
+        page.saveAs(spillFile)
+        page.waitForDone()
+        page.close()
+        self.check_released(documentCount - 1, str("Page " + str(p)))
+        self.profiler.note(str("Page " + str(p) + " was put on disk at " + format(comics_export_profiler.current_rss() / (1024 * 1024), ".0f") + " MiB."))
+        self.profiler.lap("spill")
+        return spillFile
+
+    """
+    Crop, scale and save the flattened page for every key in the sizes list.
+
+    @returns the page, or None if it was closed to save memory.
+    """
+
+    def crop_scale_and_save(self, p, page, pageData, pageFiles, sizesList):
+        exportPath = Path(self.projectURL) / self.configDictionary["exportLocation"]
+        # In low memory mode only one copy of the page exists at a time, and
+        # the page itself goes to disk when we get close to the memory ceiling.
+        lowMemory = self.configDictionary.get("lowMemoryExport", False)
+        spillFile = None
+        res = page.resolution()
+        colorModel = page.colorModel()
+        colorProfile = page.colorProfile()
+        cropRect = self.get_crop_rect(page)
+        # Keys that share the crop and color space share a single copy of the page, which
+        # is cropped and converted once, and then scaled down from the largest size to the smallest.
+        groups = {}
+        for key in sizesList.keys():
+            groupKey = (sizesList[key]["Crop"] is True, key == "TIFF")
+            if lowMemory:
+                groupKey = (sizesList[key]["Crop"] is True, key == "TIFF", key)
+            if groupKey not in groups.keys():
+                groups[groupKey] = []
+            groups[groupKey].append(key)
+        for groupKey in groups.keys():
+            keys = groups[groupKey]
+            groupName = "+".join(keys)
+
+            # Update the progress bar a little
+            self.set_page_status(str(i18n("Preparing page for {keys}")).format(keys=", ".join(keys)))
+
+            if lowMemory and spillFile is None and self.memory_near_ceiling():
+                spillFile = self.spill_page(p, page)
+                page = None
+            documentCount = len(Application.documents())
+
+            # copy over data
+            if spillFile is None:
+                projection = page.clone()
+            else:
+                projection = Application.openDocument(spillFile)
+            projection.setBatchmode(True)
+            self.profiler.lap("clone", groupName)
+            # Crop. Cropping per guide only happens if said guides have been found.
+            if groupKey[0] is True:
+                cropx, cropy, cropw, croph = cropRect
+                projection.crop(cropx, cropy, cropw, croph)
+                projection.waitForDone()
+                qApp.processEvents()
+                self.profiler.lap("crop", groupName)
+            else:
+                cropx = 0
+                cropy = 0
+            # png, gif and other webformats should probably be in 8bit srgb at maximum.
+            if groupKey[1] is False:
+                if (projection.colorModel() != "RGBA" and projection.colorModel() != "GRAYA") or projection.colorDepth() != "U8":
+                    projection.setColorSpace("RGBA", "U8", "sRGB built-in")
+            else:
+                # Tiff on the other hand can handle all the colormodels, but can only handle integer bit depths.
+                # Tiff is intended for print output, and 16 bit integer will be sufficient.
+                if projection.colorDepth() != "U8" or projection.colorDepth() != "U16":
+                    projection.setColorSpace(colorModel, "U16", colorProfile)
+            projection.waitForDone()
+            self.profiler.lap("setColorSpace", groupName)
+
+            # Every size is calculated from the cropped page, and then sorted from large to small.
+            projectionOldSize = [projection.width(), projection.height()]
+            sizesCalc = sizesCalculator()
+            scalesList = {}
+            for key in keys:
+                scalesList[key] = sizesCalc.get_scale_from_resize_config(config=sizesList[key], listSizes=[projectionOldSize[0], projectionOldSize[1], res, res])
+            keys.sort(key=lambda k: scalesList[k][0] * scalesList[k][1], reverse=True)
+
+            for key in keys:
+
+                # Update the progress bar a little
+                self.set_page_status(str(i18n("Exporting for {key}")).format(key=key))
+
+                w = sizesList[key]
+                listScales = scalesList[key]
+                # resize appropriately, starting from the previous, larger size.
+                if listScales[0] != projection.width() or listScales[1] != projection.height() or listScales[2] != projection.xRes() or listScales[3] != projection.yRes():
+                    projection.scaleImage(listScales[0], listScales[1], listScales[2], listScales[3], w.get("Filter", "bicubic"))
+                    projection.waitForDone()
+                    qApp.processEvents()
+                    self.profiler.lap("scaleImage", key)
+                # save
+                # Make sure the folder name for this export exists. It'll allow us to keep the
+                # export folders nice and clean.
+                folderName = str(key + "-" + w["FileType"])
+                if Path(exportPath / folderName).exists() is False:
+                    Path(exportPath / folderName).mkdir(exist_ok=True)
+                # Get a nice and descriptive fle name.
+                fn = str(Path(exportPath / folderName) / str("page_" + format(p, "03d") + "_" + str(listScales[0]) + "x" + str(listScales[1]) + "." + w["FileType"]))
+                # Finally save and add the page to a list of pages. This will make it easy for the packaging function to
+                # find the pages and store them.
+                projection.exportImage(fn, self.encoder_config(w))
+                projection.waitForDone()
+                qApp.processEvents()
+                self.profiler.lap("exportImage", key)
+                if key == "CBZ" or key == "EPUB":
+                    transform = {}
+                    transform["offsetX"] = cropx
+                    transform["offsetY"] = cropy
+                    transform["resDiff"] = res / 72
+                    transform["scaleWidth"] = projection.width() / projectionOldSize[0]
+                    transform["scaleHeight"] = projection.height() / projectionOldSize[1]
+                    # Each size has its own scale, so the ACBF and EPUB each get the transform of their own images.
+                    pageData.setdefault("transforms", {})[key] = transform
+                    # The size and colors of the page, so the ebook exporters don't need to load it again.
+                    pageData.setdefault("images", {})[key] = self.image_proxy(projection)
+                pageFiles[key] = fn
+                # Remember what the file holds, so identical pages can be stored only once. Hashing
+                # means reading the whole file again, so only do it when it's going to be used.
+                if self.configDictionary.get(key + "dedupe", key == "EPUB"):
+                    pageData.setdefault("hashes", {})[key] = comics_export_manifest.file_hash(fn)
+            projection.close()
+            if lowMemory:
+                self.check_released(documentCount, str("The copy for " + groupName + " of page " + str(p)))
+            self.profiler.lap("close", groupName)
+        if spillFile is not None:
+            os.remove(spillFile)
+        return page
+
+    """
+    Make a tiny version of the page to sample colors from.
+
+    @returns a dictionary with the size of the page, and the size and pixels of the proxy,
+    as base64 encoded 8 bit rgb.
+    """
+
+    def image_proxy(self, document, longEdge=32):
+        scale = longEdge / max(document.width(), document.height(), 1)
+        image = document.thumbnail(max(1, round(document.width() * scale)), max(1, round(document.height() * scale)))
+        image = image.convertToFormat(QImage.Format_RGB888)
+        bits = image.constBits()
+        bits.setsize(image.byteCount())
+        data = bytes(bits)
+        # Leave out the padding at the end of each line.
+        rows = [data[y * image.bytesPerLine():y * image.bytesPerLine() + image.width() * 3] for y in range(image.height())]
+        proxy = {}
+        proxy["width"] = document.width()
+        proxy["height"] = document.height()
+        proxy["proxyWidth"] = image.width()
+        proxy["proxyHeight"] = image.height()
+        proxy["proxy"] = base64.b64encode(bytes().join(rows)).decode("ascii")
+        return proxy
+
+    """
+    Make the export configuration for Krita's file filters from the encoder settings
+    of a size config. Settings that aren't there are left to Krita's defaults.
+    """
+
+    def encoder_config(self, sizes):
+        exportConfig = InfoObject()
+        fileType = sizes.get("FileType", "png")
+        if fileType == "png":
+            if "PNGCompression" in sizes.keys():
+                exportConfig.setProperty("compression", sizes["PNGCompression"])
+            if "PNGInterlaced" in sizes.keys():
+                exportConfig.setProperty("interlaced", sizes["PNGInterlaced"])
+        elif fileType == "jpg":
+            if "Quality" in sizes.keys():
+                exportConfig.setProperty("quality", sizes["Quality"])
+            if "Progressive" in sizes.keys():
+                exportConfig.setProperty("progressive", sizes["Progressive"])
+        elif fileType == "tiff":
+            if "TIFFCompression" in sizes.keys():
+                exportConfig.setProperty("compressiontype", sizes["TIFFCompression"])
+            if "TIFFDeflate" in sizes.keys():
+                exportConfig.setProperty("deflate", sizes["TIFFDeflate"])
+            if "TIFFPredictor" in sizes.keys():
+                # 0 is no predictor, 1 is horizontal differencing.
+                exportConfig.setProperty("predictor", int(sizes["TIFFPredictor"]))
+        return exportConfig
+
+    """
+    Get the rectangle to crop the page to, either from the outmost guides
+    or from the crop margins in the config.
+
+    @returns x, y, width and height in pixels.
+    """
+
+    def get_crop_rect(self, page):
+        listHGuides = []
+        listHGuides = page.horizontalGuides()
+        listHGuides.sort()
+        for i in range(len(listHGuides) - 1, 0, -1):
+            if listHGuides[i] < 0 or listHGuides[i] > page.height():
+                listHGuides.pop(i)
+        listVGuides = page.verticalGuides()
+        listVGuides.sort()
+        for i in range(len(listVGuides) - 1, 0, -1):
+            if listVGuides[i] < 0 or listVGuides[i] > page.width():
+                listVGuides.pop(i)
+        if self.configDictionary["cropToGuides"] and len(listVGuides) > 1:
+            cropx = listVGuides[0]
+            cropw = listVGuides[-1] - cropx
+        else:
+            cropx = self.configDictionary["cropLeft"]
+            cropw = page.width() - self.configDictionary["cropRight"] - cropx
+        if self.configDictionary["cropToGuides"] and len(listHGuides) > 1:
+            cropy = listHGuides[0]
+            croph = listHGuides[-1] - cropy
+        else:
+            cropy = self.configDictionary["cropTop"]
+            croph = page.height() - self.configDictionary["cropBottom"] - cropy
+        return cropx, cropy, cropw, croph
+
+    """
+    Export the pages with several kritarunner processes at once.
+
+    Each worker gets every n-th page of the book, so heavy and light pages get spread
+    out evenly. The workers write a small json file per finished page into the jobs folder,
+    which we read back in page order once everyone is done.
+    """
+
+    def save_out_pngs_parallel(self, sizesList, runner, workers):
+        pagesList = self.configDictionary["pages"]
+        jobsPath = Path(self.projectURL) / self.configDictionary["exportLocation"] / "metadata" / "export-jobs"
+        if jobsPath.exists():
+            shutil.rmtree(str(jobsPath))
+        jobsPath.mkdir(parents=True)
+
+        # Figure out which pages actually need work.
+        staleKeysList = []
+        pagesToExport = []
+        for p in range(len(pagesList)):
+            staleKeysList.append(self.get_stale_keys(p, sizesList))
+            if len(staleKeysList[p]) > 0:
+                pagesToExport.append(p)
+        pagesReused = len(pagesList) - len(pagesToExport)
+        workers = min(workers, len(pagesToExport))
+
+        processes = []
+        for w in range(workers):
+            job = {}
+            job["config"] = dict(self.configDictionary)
+            # The workers share the memory ceiling.
+            if self.configDictionary.get("lowMemoryExport", False):
+                job["config"]["memoryCeiling"] = int(self.configDictionary.get("memoryCeiling", 4096)) // workers
+            job["projectURL"] = self.projectURL
+            job["sizesList"] = sizesList
+            job["pages"] = pagesToExport[w::workers]
+            job["pageKeys"] = {}
+            for p in job["pages"]:
+                job["pageKeys"][str(p)] = staleKeysList[p]
+            job["resultLocation"] = str(jobsPath)
+            jobFile = str(jobsPath / str("job_" + format(w, "02d") + ".json"))
+            file = open(jobFile, "w", newline="", encoding="utf-8")
+            json.dump(job, file, ensure_ascii=False)
+            file.close()
+            command = [runner, "-s", __package__ + ".comics_export_worker", "-f", "export_pages", jobFile]
+            processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        print("CPMT: Started", workers, "export workers.")
+
+        # Results are taken in as soon as all pages before them are done, so the
+        # cbz can be written while the workers are still busy.
+        nextPage = 0
+        self.estimatedString = str(u"\u221E")
+        while any(process.poll() is None for process in processes):
+            while nextPage < len(pagesList) and self.gather_page_result(nextPage, sizesList, staleKeysList[nextPage], jobsPath, False):
+                nextPage += 1
+            pagesDone = pagesReused + len(list(jobsPath.glob("page_*.json")))
+            self.progress.setValue(pagesDone)
+            timePassed = self.timer.elapsed()
+            if pagesDone > pagesReused:
+                self.estimatedString = self.parseTime((len(pagesList) - pagesDone) * (timePassed / (pagesDone - pagesReused)))
+            self.pagesDoneString = str(i18n("{pages} of {pagesTotal} done.")).format(pages=pagesDone, pagesTotal=len(pagesList))
+            self.set_page_status(str(i18n("Exporting with {workers} processes")).format(workers=workers))
+            time.sleep(0.1)
+
+        # Gather the remaining results in page order.
+        for p in range(nextPage, len(pagesList)):
+            if self.gather_page_result(p, sizesList, staleKeysList[p], jobsPath, True) is False:
+                return False
+        shutil.rmtree(str(jobsPath))
+        if self.manifest is not None:
+            self.manifest.save(pagesList)
+        self.progress.setValue(len(pagesList))
+        print("CPMT: Export has finished with", workers, "processes.")
+        return True
+
+    """
+    Take in the result a worker wrote for a page.
+
+    @param finished: whether the workers are done. If not, a missing or failed result
+    just means we need to wait, otherwise it means the export failed.
+    @returns whether the page was added.
+    """
+
+    def gather_page_result(self, p, sizesList, staleKeys, jobsPath, finished):
+        pagesList = self.configDictionary["pages"]
+        self.profiler.start_page(p)
+        if len(staleKeys) == 0:
+            self.finish_page_result(p, sizesList, staleKeys, None, {})
+            return True
+        resultFile = jobsPath / str("page_" + format(p, "04d") + ".json")
+        result = {}
+        if resultFile.exists():
+            file = open(str(resultFile), "r", newline="", encoding="utf-8")
+            result = json.load(file)
+            file.close()
+        if "pageData" not in result.keys():
+            if finished:
+                error = result.get("error", i18n("The export process stopped before finishing this page."))
+                print("CPMT: Page", pagesList[p], "failed to export:", error)
+                self.warning(i18n("Export not Possible"), str(i18n("Page {page} could not be exported:\n{error}")).format(page=pagesList[p], error=error))
+            return False
+        self.profiler.add_records(result.get("profile", []))
+        for note in result.get("notes", []):
+            self.profiler.note(note)
+        self.finish_page_result(p, sizesList, staleKeys, page_data_from_json(result["pageData"]), result["files"])
+        return True
+
     """
     Function to get the panel and text data.
     """
@@ -538,22 +1239,22 @@ class comicsExporter():
                 listOfPoints = []
                 listOfRects = []
 
-                # First we collect all the possible line-rects.
+                # All lines use the font of the text, so they're measured together.
+                strings = []
                 for el in docElem.childNodes:
-                    if docElem.hasAttribute("font-family"):
-                        family = docElem.getAttribute("font-family")
-                    if docElem.hasAttribute("font-size"):
-                        size = docElem.getAttribute("font-size")
-                    fontsize = int(size)
-                    font = QFont(family, fontsize)
                     string = el.toxml()
                     string = re.sub("\<.*?\>", " ", string)
                     string = string.replace("  ", " ")
-                    width = min(QFontMetrics(font).width(string.strip()), rect.width())
-                    height = QFontMetrics(font).height()
-                    anchor = "start"
-                    if docElem.hasAttribute("text-anchor"):
-                        anchor = docElem.getAttribute("text-anchor")
+                    strings.append(string.strip())
+                widths = self.fontMetrics.line_widths(family, size, strings)
+                height = self.fontMetrics.height(family, size)
+                anchor = "start"
+                if docElem.hasAttribute("text-anchor"):
+                    anchor = docElem.getAttribute("text-anchor")
+
+                # First we collect all the possible line-rects.
+                for width in widths:
+                    width = min(width, rect.width())
                     top = rect.top()
                     if len(listOfRects)>0:
                         top = listOfRects[-1].bottom()
@@ -619,33 +1320,36 @@ class comicsExporter():
 
     def package_cbz(self, exportPath):
 
-        # Use the project name if there's no title to avoid sillyness with unnamed zipfiles.
-        title = self.configDictionary["projectName"]
-        if "title" in self.configDictionary.keys():
-            title = str(self.configDictionary["title"]).replace(" ", "_")
-
-        # Get the appropriate path.
-        url = str(exportPath / str(title + ".cbz"))
-
-        # Create a zip file.
-        cbzArchive = zipfile.ZipFile(url, mode="w", compression=zipfile.ZIP_STORED)
+        # The pages have already been added while exporting, if not, make a new archive.
+        cbzArchive = self.cbzWriter
+        if cbzArchive is None:
+            cbzArchive = comics_cbz_writer.cbz_writer(self.get_cbz_url(exportPath), self.configDictionary.get("CBZcompress", False))
+            if "CBZ" in self.pagesLocationList.keys():
+                for page in self.pagesLocationList["CBZ"]:
+                    cbzArchive.add_page(page)
 
         # Add all the meta data files.
-        cbzArchive.write(self.acbfLocation, Path(self.acbfLocation).name)
-        cbzArchive.write(self.cometLocation, Path(self.cometLocation).name)
-        cbzArchive.write(self.comicRackInfo, Path(self.comicRackInfo).name)
+        cbzArchive.add_file(self.acbfLocation)
+        cbzArchive.add_file(self.cometLocation)
+        cbzArchive.add_file(self.comicRackInfo)
         comic_book_info_json_dump = str()
         self.progress.setLabelText(i18n("Saving out Comicbook\ninfo metadata file"))
         self.progress.setValue(self.progress.value()+1)
         comic_book_info_json_dump = exporters.comic_book_info.writeJson(self.configDictionary)
-        cbzArchive.comment = comic_book_info_json_dump.encode("utf-8")
 
-        # Add the pages.
-        if "CBZ" in self.pagesLocationList.keys():
-            for page in self.pagesLocationList["CBZ"]:
-                if (Path(page).exists()):
-                    cbzArchive.write(page, Path(page).name)
         self.progress.setLabelText(i18n("Packaging CBZ"))
         self.progress.setValue(self.progress.value()+1)
-        # Close the zip file when done.
-        cbzArchive.close()
+        # Close the zip file when done, this writes out the pages that are still being compressed.
+        cbzArchive.close(comic_book_info_json_dump.encode("utf-8"))
+        self.cbzWriter = None
+
+    """
+    Get the location of the cbz file.
+    Use the project name if there's no title to avoid sillyness with unnamed zipfiles.
+    """
+
+    def get_cbz_url(self, exportPath):
+        title = self.configDictionary["projectName"]
+        if "title" in self.configDictionary.keys():
+            title = str(self.configDictionary["title"]).replace(" ", "_")
+        return str(exportPath / str(title + ".cbz"))
@@ -0,0 +1,96 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+A cache of font metrics and line widths, for estimating the outlines of text.
+
+Making a QFont and its metrics for every line of text is slow, and comics tend to use
+only a handful of fonts, so the metrics are made once per family and size. The widths
+of the lines are kept too, as short lines like "What?!" come back a lot.
+The metrics are made like handleShapeDescription always made them, with the size rounded
+down to whole points, so the outlines stay the same as without the cache.
+Fonts can only be used on the main thread, and the same goes for this cache.
+"""
+
+from PyQt5.QtGui import QFont, QFontMetrics
+
+
+class font_metrics_cache():
+    metrics = {}
+    widths = {}
+
+    def __init__(self):
+        self.metrics = {}
+        self.widths = {}
+
+    def key(self, family, size):
+        return (str(family), int(float(size)))
+
+    def font_metrics(self, family, size):
+        key = self.key(family, size)
+        if key not in self.metrics.keys():
+            self.metrics[key] = QFontMetrics(QFont(key[0], key[1]))
+        return self.metrics[key]
+
+    def height(self, family, size):
+        return self.font_metrics(family, size).height()
+
+    def ascent(self, family, size):
+        return self.font_metrics(family, size).ascent()
+
+    def width(self, family, size, text):
+        return self.line_widths(family, size, [text])[0]
+
+    """
+    Measure several lines in the same font. Lines that were measured before aren't measured again.
+
+    @returns a list with the width of each line.
+    """
+
+    def line_widths(self, family, size, lines=[]):
+        key = self.key(family, size)
+        widths = self.widths.setdefault(key, {})
+        metrics = None
+        result = []
+        for line in lines:
+            if line not in widths.keys():
+                if metrics is None:
+                    metrics = self.font_metrics(family, size)
+                widths[line] = metrics.width(line)
+            result.append(widths[line])
+        return result
+
+    """
+    Measure lines in different fonts, each line a (family, size, text) tuple. The lines
+    are measured per font, so this is as fast as measuring each font's lines together.
+
+    @returns a list with the width of each line, in the same order.
+    """
+
+    def measure(self, lines=[]):
+        fonts = {}
+        for i in range(len(lines)):
+            family, size, text = lines[i]
+            fonts.setdefault(self.key(family, size), []).append(i)
+        result = [0] * len(lines)
+        for key in fonts.keys():
+            widths = self.line_widths(key[0], key[1], [lines[i][2] for i in fonts[key]])
+            for i, width in zip(fonts[key], widths):
+                result[i] = width
+        return result
@@ -0,0 +1,592 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Functions for reading what we need straight from a kra file, without asking Krita to open it.
+
+A kra file is a zip with maindoc.xml describing the image and its layers, documentinfo.xml
+with the title, keywords and such, and a mergedimage.png with the flattened image.
+Vector layers are stored as layerN.shapelayer/content.svg.
+
+The panels and text can be read from those svg files as well, giving the same vector
+list that comicsExporter.getPanelsAndText makes from an opened document. Reading the
+shapes doesn't touch any fonts, so read_vector_shapes() can run on a thread pool for many
+pages at once, while vector_from_shapes(), which measures the text, runs on the main thread.
+"""
+
+import io
+import re
+import math
+import zipfile
+from xml.etree import ElementTree as ET
+from PyQt5.QtCore import Qt, QPointF, QRectF
+from PyQt5.QtGui import QTransform, QPainterPath
+from . import comics_font_metrics
+
+kritaNamespace = "{http://www.calligra.org/DTD/krita}"
+calligraNamespace = "{http://www.calligra.org/DTD/document-info}"
+svgNamespace = "{http://www.w3.org/2000/svg}"
+kritaSvgNamespace = "{http://krita.org/namespaces/svg/krita}"
+pathTokenRegExp = re.compile(r"([MmLlHhVvCcSsQqTtAaZz])|(-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+transformRegExp = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+numberRegExp = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+# Elements whose shapes aren't drawn by themselves.
+skippedElements = ["defs", "clipPath", "mask", "pattern", "marker", "linearGradient", "radialGradient", "symbol"]
+
+"""
+Read a KisDomUtils array, like the guides, into a list of floats.
+"""
+
+
+def read_array(element):
+    values = []
+    if element is None:
+        return values
+    for item in element:
+        if item.tag.startswith(kritaNamespace + "item_") or item.tag.startswith("item_"):
+            values.append(float(item.get("value", 0)))
+    return values
+
+
+"""
+Get the image size, resolution, color space, guides and layers from maindoc.xml.
+
+@returns a dictionary, guides are converted to pixels.
+"""
+
+
+def read_maindoc(data):
+    root = ET.fromstring(data)
+    image = root.find(kritaNamespace + "IMAGE")
+    info = {}
+    info["width"] = int(image.get("width", 0))
+    info["height"] = int(image.get("height", 0))
+    info["resolution"] = float(image.get("x-res", 72))
+    info["colorSpace"] = image.get("colorspacename", str())
+    info["profile"] = image.get("profile", str())
+    layers = []
+    for layer in image.iter(kritaNamespace + "layer"):
+        layerInfo = {}
+        layerInfo["name"] = layer.get("name", str())
+        layerInfo["nodetype"] = layer.get("nodetype", str())
+        layerInfo["filename"] = layer.get("filename", str())
+        layerInfo["colorlabel"] = int(layer.get("colorlabel", 0))
+        layers.append(layerInfo)
+    info["layers"] = layers
+    # Guides are stored in points, and Krita gives them to us in pixels using the horizontal resolution.
+    toPixels = info["resolution"] / 72
+    guides = image.find(kritaNamespace + "guides")
+    if guides is None:
+        guides = root.find(".//" + kritaNamespace + "guides")
+    info["horizontalGuides"] = []
+    info["verticalGuides"] = []
+    if guides is not None:
+        info["horizontalGuides"] = [g * toPixels for g in read_array(guides.find(kritaNamespace + "horizontalGuides"))]
+        info["verticalGuides"] = [g * toPixels for g in read_array(guides.find(kritaNamespace + "verticalGuides"))]
+    return info
+
+
+"""
+Get what's in documentinfo.xml: the title, subject, abstract, keywords and date of the last
+edit, and the author info of whoever edited it last. The "author" is a dictionary like the
+ones in the author list of the project, or None when there is no author info.
+
+@param data: the documentinfo.xml, or None to get an empty info.
+"""
+
+
+def read_document_info(data=None):
+    info = {"title": str(), "subject": str(), "abstract": str(), "keywords": [], "date": str(), "author": None, "editor": str()}
+    if data is None:
+        return info
+    root = ET.fromstring(data)
+    about = root.find(calligraNamespace + "about")
+    if about is not None:
+        for key, tag in [("title", "title"), ("subject", "subject"), ("abstract", "abstract"), ("date", "date")]:
+            element = about.find(calligraNamespace + tag)
+            if element is not None and element.text is not None:
+                info[key] = element.text
+        keywords = about.find(calligraNamespace + "keyword")
+        if keywords is not None and keywords.text is not None:
+            info["keywords"] = str(keywords.text).split(",")
+    authorElement = root.find(calligraNamespace + "author")
+    if authorElement is None:
+        return info
+    author = {}
+    for key, tag in [("nickname", "full-name"), ("first-name", "creator-first-name"), ("initials", "initial"), ("last-name", "creator-last-name"), ("email", "email"), ("role", "position")]:
+        element = authorElement.find(calligraNamespace + tag)
+        if element is not None:
+            author[key] = str(element.text or str())
+    contact = authorElement.find(calligraNamespace + "contact")
+    if contact is not None and contact.get("type") in ["email", "homepage"]:
+        author[contact.get("type")] = str(contact.text or str())
+    info["author"] = author
+    editor = [author[key] for key in ["first-name", "last-name", "nickname"] if len(author.get(key, str())) > 0]
+    info["editor"] = " ".join(editor)
+    return info
+
+
+"""
+Read everything the exporter needs to know about a page before deciding how to export it.
+
+@returns the maindoc info with the document info added, and "hasMergedImage" for whether
+the archive has a merged image.
+"""
+
+
+def read_page_info(location):
+    page = zipfile.ZipFile(location, "r")
+    names = page.namelist()
+    info = read_maindoc(page.read("maindoc.xml"))
+    if "documentinfo.xml" in names:
+        info.update(read_document_info(page.read("documentinfo.xml")))
+    else:
+        info.update(read_document_info())
+    info["hasMergedImage"] = "mergedimage.png" in names
+    page.close()
+    return info
+
+
+"""
+@returns the bytes of the flattened image stored in the kra file.
+"""
+
+
+def read_merged_image(location):
+    page = zipfile.ZipFile(location, "r")
+    data = page.read("mergedimage.png")
+    page.close()
+    return data
+
+
+"""
+Parse an svg transform attribute into a QTransform.
+"""
+
+
+def parse_transform(string):
+    transform = QTransform()
+    for name, arguments in transformRegExp.findall(string or str()):
+        values = [float(v) for v in numberRegExp.findall(arguments)]
+        step = QTransform()
+        if name == "matrix" and len(values) == 6:
+            step = QTransform(values[0], values[1], values[2], values[3], values[4], values[5])
+        elif name == "translate" and len(values) > 0:
+            step.translate(values[0], values[1] if len(values) > 1 else 0)
+        elif name == "scale" and len(values) > 0:
+            step.scale(values[0], values[1] if len(values) > 1 else values[0])
+        elif name == "rotate" and len(values) > 0:
+            if len(values) == 3:
+                step.translate(values[1], values[2])
+                step.rotate(values[0])
+                step.translate(-values[1], -values[2])
+            else:
+                step.rotate(values[0])
+        elif name == "skewX" and len(values) > 0:
+            step.shear(math.tan(math.radians(values[0])), 0)
+        elif name == "skewY" and len(values) > 0:
+            step.shear(0, math.tan(math.radians(values[0])))
+        # The transforms in the list are applied from right to left.
+        transform = step * transform
+    return transform
+
+
+"""
+Parse svg path data into a QPainterPath. Arcs are approximated with a line to their end point.
+"""
+
+
+def parse_path(data):
+    path = QPainterPath()
+    tokens = [(c if c else float(n)) for c, n in pathTokenRegExp.findall(data or str())]
+    current = QPointF()
+    start = QPointF()
+    lastControl = None
+    command = None
+    i = 0
+
+    def numbers(amount):
+        values = tokens[i:i + amount]
+        if len(values) < amount or any(isinstance(v, str) for v in values):
+            return None
+        return values
+
+    while i < len(tokens):
+        if isinstance(tokens[i], str):
+            command = tokens[i]
+            i += 1
+            if command in "Zz":
+                path.closeSubpath()
+                current = QPointF(start)
+                lastControl = None
+                continue
+        if command is None:
+            break
+        relative = command.islower()
+        origin = current if relative else QPointF()
+        c = command.upper()
+        amount = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7}.get(c, 0)
+        values = numbers(amount)
+        if values is None:
+            break
+        i += amount
+        if c == "M":
+            current = QPointF(values[0], values[1]) + origin
+            start = QPointF(current)
+            path.moveTo(current)
+            # Following pairs are line-to's.
+            command = "l" if relative else "L"
+            lastControl = None
+        elif c == "L" or c == "T":
+            current = QPointF(values[0], values[1]) + origin
+            path.lineTo(current)
+            lastControl = None
+        elif c == "H":
+            current = QPointF(values[0] + (current.x() if relative else 0), current.y())
+            path.lineTo(current)
+            lastControl = None
+        elif c == "V":
+            current = QPointF(current.x(), values[0] + (current.y() if relative else 0))
+            path.lineTo(current)
+            lastControl = None
+        elif c == "C":
+            control1 = QPointF(values[0], values[1]) + origin
+            control2 = QPointF(values[2], values[3]) + origin
+            current = QPointF(values[4], values[5]) + origin
+            path.cubicTo(control1, control2, current)
+            lastControl = control2
+        elif c == "S":
+            control1 = QPointF(current)
+            if lastControl is not None:
+                control1 = current * 2 - lastControl
+            control2 = QPointF(values[0], values[1]) + origin
+            current = QPointF(values[2], values[3]) + origin
+            path.cubicTo(control1, control2, current)
+            lastControl = control2
+        elif c == "Q":
+            control = QPointF(values[0], values[1]) + origin
+            current = QPointF(values[2], values[3]) + origin
+            path.quadTo(control, current)
+            lastControl = None
+        elif c == "A":
+            current = QPointF(values[5], values[6]) + origin
+            path.lineTo(current)
+            lastControl = None
+    return path
+
+
+def local_name(tag):
+    return tag.split("}")[-1]
+
+
+"""
+Get a presentation attribute, which Krita writes as attribute, but may also be in the style.
+"""
+
+
+def style_value(element, name, default=None):
+    if element.get(name) is not None:
+        return element.get(name)
+    for declaration in str(element.get("style", str())).split(";"):
+        if ":" in declaration:
+            key, value = declaration.split(":", 1)
+            if key.strip() == name:
+                return value.strip()
+    return default
+
+
+def to_number(value, default=0.0):
+    numbers = numberRegExp.findall(str(value))
+    if len(numbers) > 0:
+        return float(numbers[0])
+    return default
+
+
+"""
+Write a text element as svg, without namespace prefixes on svg tags. This is close to what
+Shape.toSvg() gives, but Krita writes the text out of its own text layout, so attributes and
+their order can differ, and the text may not match the translation keys of opened pages.
+"""
+
+
+def element_to_string(element):
+    def strip(el):
+        copy = ET.Element(local_name(el.tag))
+        for key in el.keys():
+            name = key
+            if key.startswith(kritaSvgNamespace):
+                name = "krita:" + local_name(key)
+            elif key.startswith("{"):
+                name = local_name(key)
+            copy.set(name, el.get(key))
+        copy.text = el.text
+        copy.tail = el.tail
+        for child in el:
+            copy.append(strip(child))
+        return copy
+    copy = strip(element)
+    # The tail of the text element itself isn't part of it.
+    copy.tail = None
+    return ET.tostring(copy, encoding="unicode")
+
+
+"""
+Collect the lines of a text element, with their baseline positions and font.
+"""
+
+
+def text_lines(element):
+    family = style_value(element, "font-family", "sans-serif")
+    size = to_number(style_value(element, "font-size", "11"), 11.0)
+    anchor = style_value(element, "text-anchor", "start")
+    x = to_number(element.get("x", 0))
+    y = to_number(element.get("y", 0))
+    lines = []
+    if element.text is not None and len(element.text.strip()) > 0:
+        lines.append({"text": element.text.strip(), "x": x, "y": y, "family": family, "size": size, "anchor": anchor})
+    for child in element:
+        if local_name(child.tag) != "tspan":
+            continue
+        lineFamily = style_value(child, "font-family", family)
+        lineSize = to_number(style_value(child, "font-size", size), size)
+        if child.get("x") is not None:
+            x = to_number(child.get("x"))
+        if child.get("y") is not None:
+            y = to_number(child.get("y"))
+        elif child.get("dy") is not None:
+            y += to_number(child.get("dy"))
+        text = " ".join("".join(child.itertext()).split())
+        if len(lines) > 0 and child.get("x") is None and child.get("y") is None and child.get("dy") is None:
+            # Not a new line, just a differently styled part of the previous one.
+            lines[-1]["text"] += " " + text
+            continue
+        lines.append({"text": text, "x": x, "y": y, "family": lineFamily, "size": lineSize, "anchor": style_value(child, "text-anchor", anchor)})
+    return lines
+
+
+"""
+Read the shapes from a content.svg.
+
+@param textOnly: whether this is a text layer, where only text counts.
+@returns a list of shapes as plain python data.
+"""
+
+
+def read_svg_shapes(data, textOnly=False):
+    shapes = []
+    transforms = [QTransform()]
+    skipDepth = 0
+    textDepth = 0
+    for event, element in ET.iterparse(io.BytesIO(data), events=("start", "end")):
+        name = local_name(element.tag)
+        if event == "start":
+            transforms.append(parse_transform(element.get("transform")) * transforms[-1])
+            if name in skippedElements:
+                skipDepth += 1
+            if name == "text":
+                textDepth += 1
+            continue
+        transform = transforms.pop()
+        if name in skippedElements:
+            skipDepth -= 1
+            continue
+        if name == "text":
+            textDepth -= 1
+        if skipDepth > 0 or textDepth > 0:
+            continue
+        shape = {"name": element.get("id", str())}
+        path = QPainterPath()
+        if name == "text":
+            shape["lines"] = text_lines(element)
+            # handleShapeDescription measures all lines in the font of the text element.
+            shape["family"] = style_value(element, "font-family", "sans-serif")
+            shape["size"] = to_number(style_value(element, "font-size", "11"), 11.0)
+            shape["anchor"] = style_value(element, "text-anchor", "start")
+            shape["transform"] = [transform.m11(), transform.m12(), transform.m21(), transform.m22(), transform.dx(), transform.dy()]
+            if textOnly:
+                shape["text"] = element_to_string(element)
+            shapes.append(shape)
+            element.clear()
+            continue
+        if textOnly:
+            continue
+        if name == "path":
+            path = parse_path(element.get("d"))
+            path.setFillRule(Qt.WindingFill)
+            points = []
+            for polygon in path.simplified().toSubpathPolygons(transform):
+                for point in polygon:
+                    points.append((point.x(), point.y()))
+            shape["points"] = points
+        elif name == "rect":
+            path.addRect(QRectF(to_number(element.get("x", 0)), to_number(element.get("y", 0)), to_number(element.get("width", 0)), to_number(element.get("height", 0))))
+            shape["points"] = [(point.x(), point.y()) for point in path.toFillPolygon(transform)]
+        elif name == "ellipse" or name == "circle":
+            rx = to_number(element.get("rx", element.get("r", 0)))
+            ry = to_number(element.get("ry", element.get("r", 0)))
+            path.addEllipse(QPointF(to_number(element.get("cx", 0)), to_number(element.get("cy", 0))), rx, ry)
+            shape["points"] = [(point.x(), point.y()) for point in path.toFillPolygon(transform)]
+        elif name == "polygon" or name == "polyline":
+            values = [float(v) for v in numberRegExp.findall(element.get("points", str()))]
+            shape["points"] = [(transform.map(QPointF(values[v], values[v + 1])).x(), transform.map(QPointF(values[v], values[v + 1])).y()) for v in range(0, len(values) - 1, 2)]
+        else:
+            continue
+        shapes.append(shape)
+    return shapes
+
+
+"""
+Read the panels and text of a kra file, in the same order getPanelsAndText finds them:
+layers from bottom to top, and shapes in their z-order.
+
+@param textLayerNames: the keywords that mark text layers.
+@param panelLayerNames: the keywords that mark panel layers.
+@returns a list of shapes as plain python data, see vector_from_shapes.
+"""
+
+
+def read_vector_shapes(location, textLayerNames=["text"], panelLayerNames=["panels"]):
+    page = zipfile.ZipFile(location, "r")
+    names = page.namelist()
+    root = ET.fromstring(page.read("maindoc.xml"))
+    image = root.find(kritaNamespace + "IMAGE")
+    shapes = []
+
+    def content(layer):
+        ending = str(layer.get("filename")) + ".shapelayer/content.svg"
+        for name in names:
+            if name.endswith(ending):
+                return page.read(name)
+        return None
+
+    def parse_layers(layers):
+        if layers is None:
+            return
+        # maindoc.xml lists the top layer first.
+        for layer in reversed(list(layers.findall(kritaNamespace + "layer"))):
+            if layer.get("nodetype") == "shapelayer":
+                layerName = str(layer.get("name")).lower()
+                for name in panelLayerNames:
+                    if str(name).lower() in layerName:
+                        data = content(layer)
+                        if data is not None:
+                            shapes.extend(read_svg_shapes(data))
+                for name in textLayerNames:
+                    if str(name).lower() in layerName:
+                        data = content(layer)
+                        if data is not None:
+                            shapes.extend(read_svg_shapes(data, True))
+            else:
+                parse_layers(layer.find(kritaNamespace + "layers"))
+
+    parse_layers(image.find(kritaNamespace + "layers"))
+    page.close()
+    return shapes
+
+
+"""
+Turn the shapes from read_vector_shapes into the vector list of the page data, with the
+same "name", "boundingBox" and "text" entries as comicsExporter.handleShapeDescription makes.
+Text is measured here, so this needs to run on the main thread.
+"""
+
+
+def vector_from_shapes(shapes, fontMetrics=None):
+    if fontMetrics is None:
+        fontMetrics = comics_font_metrics.font_metrics_cache()
+    vector = []
+    for shape in shapes:
+        shapeDesc = {}
+        shapeDesc["name"] = shape["name"]
+        if "lines" in shape.keys():
+            shapeDesc["boundingBox"] = text_outline(shape, fontMetrics)
+            if "text" in shape.keys():
+                shapeDesc["text"] = shape["text"]
+        else:
+            shapeDesc["boundingBox"] = [QPointF(point[0], point[1]) for point in shape["points"]]
+        vector.append(shapeDesc)
+    return vector
+
+
+"""
+Make an outline around the lines of a text, the same way handleShapeDescription does for
+multiline text. That starts from the bounding box Krita laid the text out in, which isn't
+stored in the kra file, so the box is estimated from the positions and fonts of the lines.
+The outlines can therefore be a little off from the ones of an opened page.
+"""
+
+
+def text_outline(shape, fontMetrics):
+    lines = shape["lines"]
+    if len(lines) == 0:
+        return []
+    transform = QTransform(*shape["transform"])
+    rect = QRectF()
+    widths = fontMetrics.measure([(line["family"], line["size"], line["text"]) for line in lines])
+    for line, width in zip(lines, widths):
+        left = line["x"]
+        if line["anchor"] == "end":
+            left = line["x"] - width
+        elif line["anchor"] == "middle":
+            left = line["x"] - width * 0.5
+        rect = rect.united(QRectF(left, line["y"] - fontMetrics.ascent(line["family"], line["size"]), width, fontMetrics.height(line["family"], line["size"])))
+
+    family = shape.get("family", lines[0]["family"])
+    size = shape.get("size", lines[0]["size"])
+    anchor = shape.get("anchor", lines[0]["anchor"])
+    widths = fontMetrics.line_widths(family, size, [line["text"] for line in lines])
+    height = fontMetrics.height(family, size)
+    # First we collect all the possible line-rects.
+    listOfRects = []
+    for width in widths:
+        width = min(width, rect.width())
+        top = rect.top()
+        if len(listOfRects) > 0:
+            top = listOfRects[-1].bottom()
+        if anchor == "start":
+            listOfRects.append(QRectF(rect.left(), top, width, height))
+        elif anchor == "end":
+            listOfRects.append(QRectF(rect.right() - width, top, width, height))
+        else:
+            listOfRects.append(QRectF(rect.center().x() - (width * 0.5), top, width, height))
+    # Then spread the room left in the box over the lines, and step around them.
+    heightAdjust = (rect.height() - (listOfRects[-1].bottom() - rect.top())) / len(listOfRects)
+    listOfPoints = []
+    for i in range(len(listOfRects)):
+        span = listOfRects[i]
+        additionalHeight = i * heightAdjust
+        if i == 0:
+            listOfPoints.append(span.topLeft())
+            listOfPoints.append(span.topRight())
+        elif listOfRects[i - 1].width() < span.width():
+            listOfPoints.append(QPointF(span.right(), span.top() + additionalHeight))
+            listOfPoints.insert(0, QPointF(span.left(), span.top() + additionalHeight))
+        else:
+            bottom = listOfRects[i - 1].bottom() + additionalHeight - heightAdjust
+            listOfPoints.append(QPointF(listOfRects[i - 1].right(), bottom))
+            listOfPoints.insert(0, QPointF(listOfRects[i - 1].left(), bottom))
+    span = listOfRects[-1]
+    listOfPoints.append(QPointF(span.right(), rect.bottom()))
+    listOfPoints.insert(0, QPointF(span.left(), rect.bottom()))
+    path = QPainterPath()
+    path.moveTo(listOfPoints[0])
+    for point in listOfPoints[1:]:
+        path.lineTo(point)
+    path.closeSubpath()
+    return [point for point in path.toFillPolygon(transform)]
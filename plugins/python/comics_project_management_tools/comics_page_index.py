@@ -0,0 +1,211 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+An index of what's in the pages of a project, so the pages list, the author scraping, the
+exporter and the translation scraper don't each have to open every kra file to find out.
+
+For every page the index keeps what comics_kra_archive.read_page_info() reads: the size,
+resolution, color space, guides and layers from maindoc.xml, and the title, description,
+keywords, date and last editor from documentinfo.xml. Each page is stamped with its
+modification time and size, and read again when those changed, so asking the index is
+never out of date. The index is kept as json in the metadata folder of the export
+location, and can be used from any thread.
+"""
+
+import os
+import json
+import zipfile
+import threading
+import concurrent.futures
+from xml.etree import ElementTree as ET
+from . import comics_kra_archive
+
+# Bump this when what is stored for a page changes, so old indexes are ignored.
+indexVersion = 1
+
+
+class page_index():
+    projectURL = str()
+    location = None
+    pages = {}
+    changed = False
+
+    """
+    @param projectURL: the folder of the project, pages are indexed relative to it.
+    @param location: where the index is stored, or None to not store it.
+    """
+
+    def __init__(self, projectURL=str(), location=None):
+        self.lock = threading.Lock()
+        self.open(projectURL, location)
+
+    """
+    Switch to the index of a project, reading it from the given location.
+    """
+
+    def open(self, projectURL, location=None):
+        pages = self.read(location)
+        with self.lock:
+            self.projectURL = projectURL
+            self.location = location
+            self.pages = pages
+            self.changed = False
+
+    def read(self, location):
+        if location is None or os.path.exists(location) is False:
+            return {}
+        try:
+            file = open(location, "r", newline="", encoding="utf-8")
+            index = json.load(file)
+            file.close()
+        except (OSError, ValueError):
+            return {}
+        if index.get("version", 0) != indexVersion:
+            return {}
+        return index.get("pages", {})
+
+    """
+    Write the index, if anything changed since it was read.
+    """
+
+    def save(self):
+        with self.lock:
+            if self.location is None or self.changed is False:
+                return
+            location = self.location
+            index = {"version": indexVersion, "pages": dict(self.pages)}
+            self.changed = False
+        try:
+            os.makedirs(os.path.dirname(location), exist_ok=True)
+            file = open(location + ".part", "w", newline="", encoding="utf-8")
+            json.dump(index, file, ensure_ascii=False)
+            file.close()
+            os.replace(location + ".part", location)
+        except OSError as error:
+            print("CPMT: Could not write the page index", error)
+
+    def key(self, location):
+        return os.path.relpath(os.path.abspath(location), os.path.abspath(self.projectURL))
+
+    """
+    Get the info of a page, reading it from the page when it isn't indexed or changed since.
+
+    @returns the dictionary of comics_kra_archive.read_page_info(), or None when the page can't be
+    read. It's shared with the index, so don't change it.
+    """
+
+    def page(self, location):
+        try:
+            stat = os.stat(location)
+        except OSError:
+            return None
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        key = self.key(location)
+        with self.lock:
+            entry = self.pages.get(key, None)
+        if entry is not None and entry["stamp"] == stamp:
+            return entry["info"]
+        try:
+            info = comics_kra_archive.read_page_info(location)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile, ET.ParseError) as error:
+            print("CPMT: Could not index the page", location, error)
+            return None
+        with self.lock:
+            self.pages[key] = {"stamp": stamp, "info": info}
+            self.changed = True
+        return info
+
+    """
+    Get the info of several pages, reading the ones that aren't indexed on a thread pool.
+
+    @returns a list with the info of each page, in the same order.
+    """
+
+    def page_list(self, locations=[]):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            return list(pool.map(self.page, locations))
+
+    """
+    Forget a page, for when it was removed.
+    """
+
+    def remove(self, location):
+        with self.lock:
+            if self.pages.pop(self.key(location), None) is not None:
+                self.changed = True
+
+    """
+    Forget all pages but the given ones, so pages that were removed from the project don't stay around.
+    """
+
+    def keep(self, locations=[]):
+        keys = set([self.key(location) for location in locations])
+        with self.lock:
+            for key in [key for key in self.pages.keys() if key not in keys]:
+                self.pages.pop(key)
+                self.changed = True
+
+    def title(self, location):
+        info = self.page(location)
+        if info is None:
+            return str()
+        return info["title"]
+
+    def keywords(self, location):
+        info = self.page(location)
+        if info is None:
+            return []
+        return [str(key).strip() for key in info["keywords"]]
+
+    def layer_names(self, location):
+        info = self.page(location)
+        if info is None:
+            return []
+        return [layer["name"] for layer in info["layers"]]
+
+    def color_labels(self, location):
+        info = self.page(location)
+        if info is None:
+            return []
+        return sorted(set([layer["colorlabel"] for layer in info["layers"]]))
+
+    """
+    Get the author info of the last editor of each of the given pages, for the author list.
+
+    @returns a list of author dictionaries, in the order of the pages.
+    """
+
+    def authors(self, locations=[]):
+        authors = []
+        for info in self.page_list(locations):
+            if info is not None and info["author"] is not None:
+                authors.append(dict(info["author"]))
+        return authors
+
+    """
+    @returns the locations of the pages that have the given keyword.
+    """
+
+    def pages_with_keyword(self, locations=[], keyword=str()):
+        pages = []
+        for location, info in zip(locations, self.page_list(locations)):
+            if info is not None and keyword in [str(key).strip() for key in info["keywords"]]:
+                pages.append(location)
+        return pages
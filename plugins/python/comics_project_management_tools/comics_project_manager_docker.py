@@ -29,11 +29,11 @@ import enum
 from math import floor
 import xml.etree.ElementTree as ET
 from PyQt5.QtCore import QElapsedTimer, QSize, Qt, QRect, QFileSystemWatcher, QTimer
-from PyQt5.QtGui import QStandardItem, QStandardItemModel, QImage, QIcon, QPixmap, QFontMetrics, QPainter, QPalette, QFont
+from PyQt5.QtGui import QStandardItem, QStandardItemModel, QIcon, QPixmap, QFontMetrics, QPainter, QPalette, QFont
 from PyQt5.QtWidgets import QHBoxLayout, QVBoxLayout, QListView, QToolButton, QMenu, QAction, QPushButton, QSpacerItem, QSizePolicy, QWidget, QAbstractItemView, QProgressDialog, QDialog, QFileDialog, QDialogButtonBox, qApp, QSplitter, QSlider, QLabel, QStyledItemDelegate, QStyle, QMessageBox
 import math
 from krita import *
-from . import comics_metadata_dialog, comics_exporter, comics_export_dialog, comics_project_setup_wizard, comics_template_dialog, comics_project_settings_dialog, comics_project_page_viewer, comics_project_translation_scraper
+from . import comics_metadata_dialog, comics_exporter, comics_export_dialog, comics_project_setup_wizard, comics_template_dialog, comics_project_settings_dialog, comics_project_page_viewer, comics_project_translation_scraper, comics_project_page_loader, comics_thumbnail_cache, comics_page_index
 
 """
 A very simple class so we can have a label that is single line, but doesn't force the
@@ -233,6 +233,11 @@ class comics_project_manager_docker(DockWidget):
         self.pagesModel.rowsRemoved.connect(self.slot_write_config)
         self.pagesModel.rowsMoved.connect(self.slot_write_config)
         self.comicPageList.setModel(self.pagesModel)
+        self.thumbnailCache = comics_thumbnail_cache.thumbnail_cache()
+        self.pageIndex = comics_page_index.page_index()
+        self.pageLoader = comics_project_page_loader.page_loader(self.comicPageList, CPE.URL, self.get_description_and_title, self.thumbnailCache, self.pageIndex, self)
+        self.pageLoader.pageLoaded.connect(self.slot_page_loaded)
+        self.pageLoader.finished.connect(self.pageIndex.save)
         pageBox = QWidget()
         pageBox.setLayout(QVBoxLayout())
         zoomSlider = QSlider(Qt.Horizontal, None)
@@ -322,8 +327,23 @@ class comics_project_manager_docker(DockWidget):
         self.comicPageList.addActions(actionList)
 
         # Export button that... exports.
-        self.btn_export = QPushButton(i18n("Export Comic"))
-        self.btn_export.clicked.connect(self.slot_export)
+        self.btn_export = QToolButton()
+        self.btn_export.setPopupMode(QToolButton.MenuButtonPopup)
+        self.btn_export.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum)
+        self.action_export = QAction(i18n("Export Comic"), self)
+        self.action_export.triggered.connect(self.slot_export)
+        self.action_resume_export = QAction(i18n("Resume Export"), self)
+        self.action_resume_export.setToolTip(i18n("Continue an export that was interrupted, only exporting the pages it didn't finish."))
+        self.action_resume_export.triggered.connect(self.slot_resume_export)
+        self.action_export_draft = QAction(i18n("Export Draft"), self)
+        self.action_export_draft.setToolTip(i18n("Quickly export a low quality CBZ of the whole comic for proofreading. It's put in the draft folder inside the export folder."))
+        self.action_export_draft.triggered.connect(self.slot_export_draft)
+        menu_export = QMenu()
+        menu_export.addAction(self.action_export)
+        menu_export.addAction(self.action_resume_export)
+        menu_export.addAction(self.action_export_draft)
+        self.btn_export.setDefaultAction(self.action_export)
+        self.btn_export.setMenu(menu_export)
         buttonLayout.addWidget(self.btn_export)
         self.btn_export.setDisabled(True)
 
@@ -379,38 +399,53 @@ class comics_project_manager_docker(DockWidget):
         pagesList = []
         if "pages" in self.setupDictionary.keys():
             pagesList = self.setupDictionary["pages"]
-        progress = QProgressDialog()
-        progress.setMinimum(0)
-        progress.setMaximum(len(pagesList))
-        progress.setWindowTitle(i18n("Loading Pages..."))
+        self.pageIndex.open(self.projecturl, self.page_index_location())
+        # The pages are shown right away with their file name, the thumbnails
+        # and descriptions are filled in by the page loader as they come in.
+        pageItems = []
+        watchList = []
         for url in pagesList:
             absurl = os.path.join(self.projecturl, url)
             relative = os.path.relpath(absurl, self.projecturl)
             if (os.path.exists(absurl)):
-                #page = Application.openDocument(absurl)
-                page = zipfile.ZipFile(absurl, "r")
-                thumbnail = QImage.fromData(page.read("preview.png"))
                 pageItem = QStandardItem()
-                dataList = self.get_description_and_title(page.read("documentinfo.xml"))
-                if (dataList[0].isspace() or len(dataList[0]) < 1):
-                    dataList[0] = os.path.basename(url)
-                pageItem.setText(dataList[0].replace("_", " "))
+                pageItem.setText(os.path.basename(url).replace("_", " "))
                 pageItem.setDragEnabled(True)
                 pageItem.setDropEnabled(False)
                 pageItem.setEditable(False)
-                pageItem.setIcon(QIcon(QPixmap.fromImage(thumbnail)))
-                pageItem.setData(dataList[1], role = CPE.DESCRIPTION)
+                pageItem.setData("", role = CPE.DESCRIPTION)
                 pageItem.setData(relative, role = CPE.URL)
-                self.pagesWatcher.addPath(absurl)
-                pageItem.setData(dataList[2], role = CPE.KEYWORDS)
-                pageItem.setData(dataList[3], role = CPE.LASTEDIT)
-                pageItem.setData(dataList[4], role = CPE.EDITOR)
+                pageItem.setData("", role = CPE.KEYWORDS)
+                pageItem.setData("", role = CPE.LASTEDIT)
+                pageItem.setData("", role = CPE.EDITOR)
                 pageItem.setToolTip(relative)
-                page.close()
-                self.pagesModel.appendRow(pageItem)
-                progress.setValue(progress.value() + 1)
-        progress.setValue(len(pagesList))
+                pageItems.append(pageItem)
+                watchList.append(absurl)
+        if len(watchList)>0:
+            self.pagesWatcher.addPaths(watchList)
+        self.pageIndex.keep(watchList)
+        self.pagesModel.invisibleRootItem().appendRows(pageItems)
         self.loadingPages = False
+        self.pageLoader.load(self.projecturl, [pageItem.index() for pageItem in pageItems])
+
+    """
+    Fill in the thumbnail and description of a page once the page loader has read it.
+    """
+
+    def slot_page_loaded(self, index, thumbnails, dataList):
+        pageItem = self.pagesModel.itemFromIndex(index)
+        if pageItem is None:
+            return
+        if thumbnails is not None and len(thumbnails) > 0:
+            pageItem.setIcon(self.thumbnailCache.icon(thumbnails))
+        if dataList is not None:
+            if (dataList[0].isspace() is False and len(dataList[0]) > 0):
+                pageItem.setText(dataList[0].replace("_", " "))
+            pageItem.setData(dataList[1], role = CPE.DESCRIPTION)
+            pageItem.setData(dataList[2], role = CPE.KEYWORDS)
+            pageItem.setData(dataList[3], role = CPE.LASTEDIT)
+            pageItem.setData(dataList[4], role = CPE.EDITOR)
+
     """
     Function that is triggered by the zoomSlider
     Resizes the thumbnails.
@@ -420,52 +455,31 @@ class comics_project_manager_docker(DockWidget):
         self.comicPageList.setIconSize(QSize(multiplier * 32, multiplier * 32))
 
     """
-    Function that takes the documentinfo.xml and parses it for the title, subject and abstract tags,
-    to get the title and description.
-    
-    @returns a stringlist with the name on 0 and the description on 1.
-    """
-
-    def get_description_and_title(self, string):
-        xmlDoc = ET.fromstring(string)
-        calligra = str("{http://www.calligra.org/DTD/document-info}")
-        name = ""
-        if ET.iselement(xmlDoc[0].find(calligra + 'title')):
-            name = xmlDoc[0].find(calligra + 'title').text
-            if name is None:
-                name = " "
-        desc = ""
-        if ET.iselement(xmlDoc[0].find(calligra + 'subject')):
-            desc = xmlDoc[0].find(calligra + 'subject').text
-        if desc is None or desc.isspace() or len(desc) < 1:
-            if ET.iselement(xmlDoc[0].find(calligra + 'abstract')):
-                desc = xmlDoc[0].find(calligra + 'abstract').text
-                if desc is not None:
-                    if desc.startswith("<![CDATA["):
-                        desc = desc[len("<![CDATA["):]
-                    if desc.startswith("]]>"):
-                        desc = desc[:-len("]]>")]
-        keywords = ""
-        if ET.iselement(xmlDoc[0].find(calligra + 'keyword')):
-            keywords = xmlDoc[0].find(calligra + 'keyword').text
-        date = ""
-        if ET.iselement(xmlDoc[0].find(calligra + 'date')):
-            date = xmlDoc[0].find(calligra + 'date').text
-        author = []
-        if ET.iselement(xmlDoc[1].find(calligra + 'creator-first-name')):
-            string = xmlDoc[1].find(calligra + 'creator-first-name').text
-            if string is not None:
-                author.append(string)
-        if ET.iselement(xmlDoc[1].find(calligra + 'creator-last-name')):
-            string = xmlDoc[1].find(calligra + 'creator-last-name').text
-            if string is not None:
-                author.append(string)
-        if ET.iselement(xmlDoc[1].find(calligra + 'full-name')):
-            string = xmlDoc[1].find(calligra + 'full-name').text
-            if string is not None:
-                author.append(string)
-            
-        return [name, desc, keywords, date, " ".join(author)]
+    Function that takes the page info from the page index and gets the title and description
+    out of it, taking the abstract when there's no subject.
+
+    @returns a stringlist with the name on 0, the description on 1, the keywords on 2, the date
+    of the last edit on 3 and the last editor on 4.
+    """
+
+    def get_description_and_title(self, info):
+        if info is None:
+            return ["", "", "", "", ""]
+        desc = info["subject"]
+        if desc.isspace() or len(desc) < 1:
+            desc = info["abstract"]
+            if desc.startswith("<![CDATA["):
+                desc = desc[len("<![CDATA["):]
+            if desc.endswith("]]>"):
+                desc = desc[:-len("]]>")]
+        return [info["title"], desc, ",".join(info["keywords"]), info["date"], info["editor"]]
+
+    """
+    Where the page index of the project is kept.
+    """
+
+    def page_index_location(self):
+        return os.path.join(self.projecturl, self.setupDictionary.get("exportLocation", str()), "metadata", "page-index.json")
 
     """
     Scrapes authors from the author data in the document info and puts them into the author list.
@@ -477,40 +491,9 @@ class comics_project_manager_docker(DockWidget):
         if "authorList" in self.setupDictionary.keys():
             listOfAuthors = self.setupDictionary["authorList"]
         if "pages" in self.setupDictionary.keys():
-            for relurl in self.setupDictionary["pages"]:
-                absurl = os.path.join(self.projecturl, relurl)
-                page = zipfile.ZipFile(absurl, "r")
-                xmlDoc = ET.fromstring(page.read("documentinfo.xml"))
-                calligra = str("{http://www.calligra.org/DTD/document-info}")
-                authorelem = xmlDoc.find(calligra + 'author')
-                author = {}
-                if ET.iselement(authorelem.find(calligra + 'full-name')):
-                    author["nickname"] = str(authorelem.find(calligra + 'full-name').text)
-
-                if ET.iselement(authorelem.find(calligra + 'creator-first-name')):
-                    author["first-name"] = str(authorelem.find(calligra + 'creator-first-name').text)
-
-                if ET.iselement(authorelem.find(calligra + 'initial')):
-                    author["initials"] = str(authorelem.find(calligra + 'initial').text)
-
-                if ET.iselement(authorelem.find(calligra + 'creator-last-name')):
-                    author["last-name"] = str(authorelem.find(calligra + 'creator-last-name').text)
-
-                if ET.iselement(authorelem.find(calligra + 'email')):
-                    author["email"] = str(authorelem.find(calligra + 'email').text)
-
-                if ET.iselement(authorelem.find(calligra + 'contact')):
-                    contact = authorelem.find(calligra + 'contact')
-                    contactMode = contact.get("type")
-                    if contactMode == "email":
-                        author["email"] = str(contact.text)
-                    if contactMode == "homepage":
-                        author["homepage"] = str(contact.text)
-
-                if ET.iselement(authorelem.find(calligra + 'position')):
-                    author["role"] = str(authorelem.find(calligra + 'position').text)
-                listOfAuthors.append(author)
-                page.close()
+            pages = [os.path.join(self.projecturl, relurl) for relurl in self.setupDictionary["pages"]]
+            listOfAuthors.extend(self.pageIndex.authors(pages))
+            self.pageIndex.save()
         self.setupDictionary["authorList"] = listOfAuthors
 
     """
@@ -547,13 +530,12 @@ class comics_project_manager_docker(DockWidget):
                 url = newUrl
             relative = os.path.relpath(url, self.projecturl)
             if url not in pagesList:
-                page = zipfile.ZipFile(url, "r")
-                thumbnail = QImage.fromData(page.read("preview.png"))
-                dataList = self.get_description_and_title(page.read("documentinfo.xml"))
+                thumbnails = self.thumbnailCache.thumbnails(url)
+                dataList = self.get_description_and_title(self.pageIndex.page(url))
                 if (dataList[0].isspace() or len(dataList[0]) < 1):
                     dataList[0] = os.path.basename(url)
                 newPageItem = QStandardItem()
-                newPageItem.setIcon(QIcon(QPixmap.fromImage(thumbnail)))
+                newPageItem.setIcon(self.thumbnailCache.icon(thumbnails))
                 newPageItem.setDragEnabled(True)
                 newPageItem.setDropEnabled(False)
                 newPageItem.setEditable(False)
@@ -565,8 +547,8 @@ class comics_project_manager_docker(DockWidget):
                 newPageItem.setData(dataList[3], role = CPE.LASTEDIT)
                 newPageItem.setData(dataList[4], role = CPE.EDITOR)
                 newPageItem.setToolTip(relative)
-                page.close()
                 self.pagesModel.appendRow(newPageItem)
+        self.pageIndex.save()
 
     """
     Remove the selected page from the list of pages. This does not remove it from disk(far too dangerous).
@@ -791,7 +773,7 @@ class comics_project_manager_docker(DockWidget):
     Export the comic. Won't work without export settings set.
     """
 
-    def slot_export(self):
+    def slot_export(self, resume=False, draft=False):
         
         #ensure there is a unique identifier
         if "uuid" not in self.setupDictionary.keys():
@@ -804,11 +786,27 @@ class comics_project_manager_docker(DockWidget):
         
         exporter = comics_exporter.comicsExporter()
         exporter.set_config(self.setupDictionary, self.projecturl)
-        exportSuccess = exporter.export()
+        if draft:
+            exporter.set_draft()
+        exportSuccess = exporter.export(resume)
         if exportSuccess:
             print("CPMT: Export success! The files have been written to the export folder!")
             QMessageBox.information(self, i18n("Export success"), i18n("The files have been written to the export folder."), QMessageBox.Ok)
 
+    """
+    Export the comic, but skip the pages an interrupted export already finished.
+    """
+
+    def slot_resume_export(self):
+        self.slot_export(True)
+
+    """
+    Export a quick, low quality cbz for proofreading.
+    """
+
+    def slot_export_draft(self):
+        self.slot_export(False, True)
+
     """
     Calls up the comics project setup wizard so users can create a new json file with the basic information.
     """
@@ -848,6 +846,7 @@ class comics_project_manager_docker(DockWidget):
                 if index.isValid():
                     if os.path.exists(url) is False:
                         # we cannot check from here whether the file in question has been renamed or deleted.
+                        self.pageIndex.remove(url)
                         self.pagesModel.removeRow(index.row())
                         return
                     else:
@@ -855,12 +854,14 @@ class comics_project_manager_docker(DockWidget):
                         # so ensure the file is still watched if it exists.
                         self.pagesWatcher.addPath(url)
                     pageItem = self.pagesModel.itemFromIndex(index)
-                    page = zipfile.ZipFile(url, "r")
-                    dataList = self.get_description_and_title(page.read("documentinfo.xml"))
+                    # The page changed, so its cached thumbnails are out of date.
+                    self.thumbnailCache.invalidate(url)
+                    # The page index notices the page changed by itself.
+                    dataList = self.get_description_and_title(self.pageIndex.page(url))
+                    self.pageIndex.save()
                     if (dataList[0].isspace() or len(dataList[0]) < 1):
                         dataList[0] = os.path.basename(url)
-                    thumbnail = QImage.fromData(page.read("preview.png"))
-                    pageItem.setIcon(QIcon(QPixmap.fromImage(thumbnail)))
+                    pageItem.setIcon(self.thumbnailCache.icon(self.thumbnailCache.thumbnails(url)))
                     pageItem.setText(dataList[0])
                     pageItem.setData(dataList[1], role = CPE.DESCRIPTION)
                     pageItem.setData(relUrl, role = CPE.URL)
@@ -944,7 +945,9 @@ class comics_project_manager_docker(DockWidget):
         os.makedirs(fullTranslationPath, exist_ok=True)
         textLayersToSearch = self.setupDictionary.get("textLayerNames", ["text"])
 
-        scraper = comics_project_translation_scraper.translation_scraper(self.projecturl, translationFolder, textLayersToSearch, self.setupDictionary["projectName"])
+        # Pages that didn't change since the last time are taken from the cache in the export metadata.
+        scrapeCache = os.path.join(self.projecturl, self.setupDictionary.get("exportLocation", str()), "metadata", "translation-scrape-cache.json")
+        scraper = comics_project_translation_scraper.translation_scraper(self.projecturl, translationFolder, textLayersToSearch, self.setupDictionary["projectName"], scrapeCache, self.pageIndex)
         # Run text scraper.
         language = self.setupDictionary.get("language", "en")
         metadata = {}
@@ -953,6 +956,7 @@ class comics_project_manager_docker(DockWidget):
         metadata["keywords"] = ", ".join(self.setupDictionary.get("otherKeywords", [""]))
         metadata["transnotes"] = self.setupDictionary.get("translatorHeader", "Translator's Notes")
         scraper.start(self.setupDictionary["pages"], language, metadata)
+        self.pageIndex.save()
         QMessageBox.information(self, i18n("Scraping success"), str(i18n("POT file has been written to: {file}")).format(file=fullTranslationPath), QMessageBox.Ok)
     """
     This is required by the dockwidget class, otherwise unused.
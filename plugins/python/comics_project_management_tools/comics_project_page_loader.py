@@ -0,0 +1,167 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Loads the thumbnails and descriptions of the pages in the pages list in the background.
+
+The pages list is filled right away with the file names of the pages, and a few threads
+get the thumbnails from the thumbnail cache and the page info from the page index, which
+only read the kra files when the page isn't cached or changed since. Pages that are
+scrolled into view are loaded first. Whenever a page is done, pageLoaded is emitted on
+the gui thread for every row that has that page, with the index of the row in the model,
+the list of thumbnails and the description list.
+"""
+
+import os
+import zipfile
+from PyQt5.QtCore import QObject, QRunnable, QThread, QThreadPool, QModelIndex, QPersistentModelIndex, pyqtSignal
+
+"""
+Carries the results of the page jobs from the thread pool to the gui thread.
+"""
+
+
+class page_loader_signals(QObject):
+    loaded = pyqtSignal(int, str, object, object)
+
+
+"""
+Reads one page. QImage can be used outside of the gui thread, QPixmap can't, so the
+thumbnails are turned into an icon once they're back on the gui thread.
+"""
+
+
+class page_load_job(QRunnable):
+
+    def __init__(self, signals, generation, url, absoluteUrl, describe, thumbnailCache, pageIndex):
+        super().__init__()
+        self.signals = signals
+        self.generation = generation
+        self.url = url
+        self.absoluteUrl = absoluteUrl
+        self.describe = describe
+        self.thumbnailCache = thumbnailCache
+        self.pageIndex = pageIndex
+
+    def run(self):
+        thumbnails = None
+        dataList = None
+        info = self.pageIndex.page(self.absoluteUrl)
+        if info is not None:
+            dataList = self.describe(info)
+        try:
+            thumbnails = self.thumbnailCache.thumbnails(self.absoluteUrl)
+        except (OSError, KeyError, zipfile.BadZipFile) as error:
+            print("CPMT: Could not read the thumbnail of the page", self.absoluteUrl, error)
+        self.signals.loaded.emit(self.generation, self.url, thumbnails, dataList)
+
+
+class page_loader(QObject):
+    pageLoaded = pyqtSignal(QModelIndex, object, object)
+    finished = pyqtSignal()
+
+    """
+    @param view: the view of the pages, used to find out which pages are visible.
+    @param urlRole: the role of the model that has the url of the page, relative to the project.
+    @param describe: function that makes the description list from the page info of the page
+    index. It's called on the threads, so it may not touch the gui.
+    @param thumbnailCache: the thumbnail_cache to get the thumbnails from.
+    @param pageIndex: the page_index to get the page info from.
+    """
+
+    def __init__(self, view, urlRole, describe, thumbnailCache, pageIndex, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.urlRole = urlRole
+        self.describe = describe
+        self.thumbnailCache = thumbnailCache
+        self.pageIndex = pageIndex
+        self.projectURL = str()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, min(4, QThread.idealThreadCount())))
+        self.signals = page_loader_signals(self)
+        self.signals.loaded.connect(self.slot_loaded)
+        # Results of an earlier load are ignored.
+        self.generation = 0
+        self.pending = {}
+        self.loading = {}
+        self.running = 0
+
+    """
+    Start loading the given pages, forgetting about any that were still waiting.
+
+    @param indexes: the indexes of the pages in the model.
+    """
+
+    def load(self, projectURL, indexes=[]):
+        self.generation += 1
+        self.projectURL = projectURL
+        self.pending = {}
+        self.loading = {}
+        self.running = 0
+        # A page can be in the list more than once, it's only read once for all its rows.
+        for index in indexes:
+            self.pending.setdefault(str(index.data(self.urlRole)), []).append(QPersistentModelIndex(index))
+        if len(self.pending) == 0:
+            self.finished.emit()
+        self.start_jobs()
+
+    def start_jobs(self):
+        while self.running < self.pool.maxThreadCount() and len(self.pending) > 0:
+            url = self.next_url()
+            self.loading[url] = self.pending.pop(url)
+            self.running += 1
+            self.pool.start(page_load_job(self.signals, self.generation, url, os.path.join(self.projectURL, url), self.describe, self.thumbnailCache, self.pageIndex))
+
+    """
+    The first page that is visible and not loaded yet, or otherwise the first page not loaded yet.
+    """
+
+    def next_url(self):
+        model = self.view.model()
+        for row in self.visible_rows():
+            url = str(model.data(model.index(row, 0), self.urlRole))
+            if url in self.pending.keys():
+                return url
+        return next(iter(self.pending.keys()))
+
+    def visible_rows(self):
+        rect = self.view.viewport().rect()
+        first = self.view.indexAt(rect.topLeft())
+        if first.isValid() is False:
+            return range(0)
+        last = max(self.view.indexAt(rect.bottomLeft()).row(), self.view.indexAt(rect.bottomRight()).row())
+        if last < first.row():
+            last = self.view.model().rowCount() - 1
+        return range(first.row(), last + 1)
+
+    def slot_loaded(self, generation, url, thumbnails, dataList):
+        if generation != self.generation:
+            return
+        self.running -= 1
+        indexes = [QModelIndex(index) for index in self.loading.pop(url, [])]
+        model = self.view.model()
+        # The rows may have been replaced in the meantime, then look for the page again.
+        if any(index.isValid() is False or str(model.data(index, self.urlRole)) != url for index in indexes):
+            indexes = [model.index(row, 0) for row in range(model.rowCount()) if str(model.data(model.index(row, 0), self.urlRole)) == url]
+        for index in indexes:
+            self.pageLoaded.emit(index, thumbnails, dataList)
+        self.start_jobs()
+        if self.running == 0 and len(self.pending) == 0:
+            self.finished.emit()
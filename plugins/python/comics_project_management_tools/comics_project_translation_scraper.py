@@ -25,15 +25,101 @@ This class does several things:
 2) It can parse a preexisting POT file to ensure it isn't making duplicates.
 3) It can write a POT file.
 4) Writing to a csv file was considered until the realisation hit that comic dialog itself contains commas.
+
+The pages are read on a thread pool, and only maindoc.xml and the svgs of the text layers
+are read from them, the titles come from the page index. When given a cache location, the strings found on
+each page are kept there, so pages that didn't change since the last scrape aren't read again.
 """
 
 import sys
 import os
 import csv
+import json
 import zipfile
 import types
+import concurrent.futures
 from xml.dom import minidom
+from xml.etree import ElementTree as ET
 from PyQt5.QtCore import QDateTime, Qt
+from . import comics_kra_archive
+
+# Bump this when what is scraped from a page changes, so old caches are ignored.
+cacheVersion = 1
+
+"""
+Get the strings of a page.
+
+This only reads the page, so it can run on any thread.
+
+@param pageIndex: the page_index to get the title and keywords from, otherwise they're read
+from documentinfo.xml.
+@returns a dictionary with the "texts" of the text layers, in order, and the "title" of the
+page when it has the acbf_title keyword, otherwise None.
+"""
+
+
+def scrape_page(location, textLayerNameList=[], pageIndex=None):
+    page = zipfile.ZipFile(location, "r")
+    # The layer with filename "layer3" has its shapes in .../layer3.shapelayer/content.svg.
+    names = page.namelist()
+    svgFiles = {}
+    for name in names:
+        if name.endswith(".shapelayer/content.svg"):
+            svgFiles.setdefault(name.split("/")[-2][:-len(".shapelayer")], name)
+
+    texts = []
+    maindoc = page.open("maindoc.xml")
+    for event, element in ET.iterparse(maindoc, events=("start", "end")):
+        if comics_kra_archive.local_name(element.tag) != "layer":
+            continue
+        if event == "end":
+            # Done with this layer, so don't keep it around.
+            element.clear()
+        elif element.get("nodetype") == "shapelayer":
+            layerName = element.get("name", str())
+            if any(t in layerName for t in textLayerNameList):
+                svg = svgFiles.get(element.get("filename", str()), None)
+                if svg is not None:
+                    texts.extend(get_txt(page.read(svg)))
+    maindoc.close()
+
+    # Get page title if the keywords contain acbf_title
+    title = None
+    if pageIndex is not None:
+        info = pageIndex.page(location)
+    elif "documentinfo.xml" in names:
+        info = comics_kra_archive.read_document_info(page.read("documentinfo.xml"))
+    else:
+        info = None
+    if info is not None and "acbf_title" in [str(k).strip() for k in info["keywords"]]:
+        title = info["title"]
+    page.close()
+    return {"texts": texts, "title": title}
+
+
+"""
+Get the text of every text element in an svg, as the xml of what's inside the text element.
+"""
+
+
+def get_txt(string):
+    svg = minidom.parseString(string)
+    texts = []
+    # parse through string as if svg.
+
+    def parseThroughChildNodes(node):
+        for childNode in node.childNodes:
+            if childNode.nodeType != minidom.Node.TEXT_NODE:
+                if childNode.tagName == "text":
+                    text = ""
+                    for c in childNode.childNodes:
+                        text += c.toxml()
+                    texts.append(text)
+                elif childNode.childNodes:
+                    parseThroughChildNodes(childNode)
+
+    parseThroughChildNodes(svg.documentElement)
+    return texts
 
 
 class translation_scraper():
@@ -45,13 +131,19 @@ class translation_scraper():
     pageTitleKeys= []
     projectName = str()
     languageKey = "AA_language"
+    cacheLocation = None
+    pageIndex = None
 
-    def __init__(self, projectURL=str(), translation_folder=str(), textLayerNameList=[], projectName=str()):
+    def __init__(self, projectURL=str(), translation_folder=str(), textLayerNameList=[], projectName=str(), cacheLocation=None, pageIndex=None):
         self.projectURL = projectURL
         self.projectName = projectName
         self.translation_folder = translation_folder
         self.textLayerNameList = textLayerNameList
+        self.cacheLocation = cacheLocation
+        self.pageIndex = pageIndex
         self.translationDict = {}
+        self.translationKeys = []
+        self.knownKeys = set()
         self.pageTitleKeys = []
 
         # Check for a preexisting translation file and parse that.
@@ -63,10 +155,79 @@ class translation_scraper():
     def start(self, pagesList, language, metaData={}):
         if self.languageKey not in self.translationDict.keys():
             self.translationDict[self.languageKey] = language
+        cache = self.read_cache()
+        newCache = {}
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        results = {}
+        for p in pagesList:
+            location = os.path.join(self.projectURL, p)
+            if os.path.exists(location) is False:
+                continue
+            stat = os.stat(location)
+            pageCache = cache.get(p, {})
+            if pageCache.get("mtime", None) == stat.st_mtime_ns and pageCache.get("size", None) == stat.st_size:
+                results[p] = pageCache
+            else:
+                results[p] = pool.submit(scrape_page, location, self.textLayerNameList, self.pageIndex)
+                newCache[p] = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+        # Add the strings in the order of the pages, so the keys are in order of appearance.
         for p in pagesList:
-            self.get_svg_layers(os.path.join(self.projectURL, p))
+            if p not in results.keys():
+                continue
+            result = results[p]
+            if isinstance(result, concurrent.futures.Future):
+                try:
+                    result = dict(newCache[p], **result.result())
+                except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as error:
+                    print("CPMT: Could not scrape the text of", p, error)
+                    newCache.pop(p)
+                    continue
+            newCache[p] = result
+            self.add_page_strings(result)
+        pool.shutdown()
+        if newCache != cache:
+            self.write_cache(newCache)
         self.write_pot(metaData)
 
+    def add_page_strings(self, result):
+        for text in result["texts"]:
+            if text not in self.translationDict.keys():
+                entry = {}
+                entry["text"] = text
+                self.translationDict[text] = entry
+            if text not in self.knownKeys:
+                self.knownKeys.add(text)
+                self.translationKeys.append(text)
+        if result["title"] is not None:
+            self.pageTitleKeys.append(result["title"])
+
+    def read_cache(self):
+        if self.cacheLocation is None or os.path.exists(self.cacheLocation) is False:
+            return {}
+        try:
+            file = open(self.cacheLocation, "r", newline="", encoding="utf-8")
+            cache = json.load(file)
+            file.close()
+        except (OSError, ValueError):
+            return {}
+        if cache.get("version", 0) != cacheVersion or cache.get("textLayerNames", None) != list(self.textLayerNameList):
+            return {}
+        return cache.get("pages", {})
+
+    def write_cache(self, pages):
+        if self.cacheLocation is None:
+            return
+        cache = {"version": cacheVersion, "textLayerNames": list(self.textLayerNameList), "pages": pages}
+        try:
+            os.makedirs(os.path.dirname(self.cacheLocation), exist_ok=True)
+            file = open(self.cacheLocation + ".part", "w", newline="", encoding="utf-8")
+            json.dump(cache, file, ensure_ascii=False)
+            file.close()
+            os.replace(self.cacheLocation + ".part", self.cacheLocation)
+        except OSError as error:
+            print("CPMT: Could not write the scrape cache", error)
+
     def parse_pot(self, location):
         if (os.path.exists(location)):
             file = open(location, "r", newline="", encoding="utf8")
@@ -126,87 +287,6 @@ class translation_scraper():
             addEntryToTranslationDict(key, entry)
             file.close()
 
-    def get_svg_layers(self, location):
-        page = zipfile.ZipFile(location, "a")
-        xmlroot = minidom.parseString(page.read("maindoc.xml"))
-        doc = xmlroot.documentElement
-
-        candidates = []
-
-        for member in page.namelist():
-            info = page.getinfo(member)
-            if info.filename.endswith('svg'):
-                candidates.append(info.filename)
-
-        def parseThroughChildNodes(node):
-            for childNode in node.childNodes:
-                if childNode.nodeType != minidom.Node.TEXT_NODE:
-                    if childNode.tagName == "layer" and childNode.getAttribute("nodetype") == "shapelayer":
-                        isTextLayer = False
-                        for t in self.textLayerNameList:
-                            if t in childNode.getAttribute("name"):
-                                isTextLayer = True
-                        if isTextLayer:
-                            filename = childNode.getAttribute("filename")
-                            for c in candidates:
-                                if str(filename + ".shapelayer/content.svg") in c:
-                                    self.get_txt(page.read(c))
-                    if childNode.childNodes:
-                        parseThroughChildNodes(childNode)
-
-        parseThroughChildNodes(doc)
-        
-        # Get page title if the keywords contain acbf_title
-        xmlroot = minidom.parseString(page.read("documentinfo.xml"))
-        dict = {}
-        def parseThroughDocumentInfo(node, dict):
-            for childNode in node.childNodes:
-                if childNode.nodeType != minidom.Node.TEXT_NODE and childNode.nodeType != minidom.Node.CDATA_SECTION_NODE:
-                    if childNode.tagName == "title":
-                        title = ""
-                        for text in childNode.childNodes:
-                            title += text.data
-                        dict["title"] = title
-                    elif childNode.tagName == "keyword":
-                        k = ""
-                        for text in childNode.childNodes:
-                            k += text.data
-                        keywords = k.split(",")
-                        for i in range(len(keywords)):
-                            keywords[i] = str(keywords[i]).strip()
-                        dict["key"] = keywords
-                    if childNode.childNodes:
-                        parseThroughDocumentInfo(childNode, dict)
-                        
-        parseThroughDocumentInfo(xmlroot.documentElement, dict)
-        keywords = dict["key"]
-        if "acbf_title" in keywords:
-            self.pageTitleKeys.append(dict["title"])
-                    
-        page.close()
-
-    def get_txt(self, string):
-        svg = minidom.parseString(string)
-        # parse through string as if svg.
-
-        def parseThroughChildNodes(node):
-            for childNode in node.childNodes:
-                if childNode.nodeType != minidom.Node.TEXT_NODE:
-                    if childNode.tagName == "text":
-                        text = ""
-                        for c in childNode.childNodes:
-                            text += c.toxml()
-                        if text not in self.translationDict.keys():
-                            entry = {}
-                            entry["text"] = text
-                            self.translationDict[text] = entry
-                        if text not in self.translationKeys:
-                            self.translationKeys.append(text)
-                    elif childNode.childNodes:
-                        parseThroughChildNodes(childNode)
-
-        parseThroughChildNodes(svg.documentElement)
-
     def write_pot(self, metaData):
         quote = "\""
         newLine = "\n"
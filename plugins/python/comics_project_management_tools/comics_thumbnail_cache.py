@@ -0,0 +1,159 @@
+"""
+Copyright (c) 2017 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+A cache of page thumbnails on disk, so the previews don't need to be decoded out of the
+kra files every time a project is opened.
+
+Each page has its preview stored at a few sizes, as png files named after the hash of the
+absolute path of the page. Every png has the modification time and size of the page it
+was made from written into it, so a thumbnail of a page that changed since is never used.
+The cache can be used from any thread, only icon() needs the gui thread.
+"""
+
+import os
+import hashlib
+import zipfile
+from PyQt5.QtCore import Qt, QStandardPaths
+from PyQt5.QtGui import QImage, QImageReader, QIcon, QPixmap
+
+stampKey = "CPMT-source"
+
+
+class thumbnail_cache():
+    location = str()
+    sizes = [32, 64, 128, 256]
+
+    def __init__(self, location=None):
+        self.location = location
+        if self.location is None:
+            self.location = os.path.join(QStandardPaths.writableLocation(QStandardPaths.CacheLocation), "comics_project_management_tools", "thumbnails")
+
+    def file_name(self, page, size):
+        pageHash = hashlib.sha1(os.path.abspath(page).encode("utf-8")).hexdigest()
+        return os.path.join(self.location, pageHash + "-" + str(size) + ".png")
+
+    def stamp(self, page):
+        stat = os.stat(page)
+        return str(stat.st_mtime_ns) + ":" + str(stat.st_size)
+
+    """
+    Read the thumbnails of a page from the cache.
+
+    @returns a list of images, one for each size, or None when they aren't cached or are out of date.
+    """
+
+    def read(self, page):
+        try:
+            stamp = self.stamp(page)
+        except OSError:
+            return None
+        images = []
+        for size in self.sizes:
+            fileName = self.file_name(page, size)
+            if os.path.exists(fileName) is False:
+                return None
+            # The stamp is in the header, so stale files aren't decoded.
+            reader = QImageReader(fileName, b"png")
+            if reader.text(stampKey) != stamp:
+                return None
+            image = reader.read()
+            if image.isNull():
+                return None
+            images.append(image)
+        return images
+
+    """
+    Store the preview of a page in the cache at all sizes.
+
+    @returns the list of images, one for each size.
+    """
+
+    def write(self, page, preview, stamp=None):
+        images = []
+        if preview is None or preview.isNull():
+            return images
+        if stamp is None:
+            try:
+                stamp = self.stamp(page)
+            except OSError:
+                return images
+        for size in self.sizes:
+            image = preview
+            if max(preview.width(), preview.height()) > size:
+                image = preview.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            image = QImage(image)
+            image.setText(stampKey, stamp)
+            images.append(image)
+        # Not being able to cache the thumbnails only makes the next time slower.
+        try:
+            os.makedirs(self.location, exist_ok=True)
+            for i in range(len(self.sizes)):
+                fileName = self.file_name(page, self.sizes[i])
+                if images[i].save(fileName + ".part", "PNG"):
+                    os.replace(fileName + ".part", fileName)
+        except OSError as error:
+            print("CPMT: Could not write the thumbnail cache", error)
+        return images
+
+    """
+    Get the thumbnails of a page, from the cache, or otherwise from the preview in the kra file.
+
+    @param archive: the kra file when it's already open.
+    """
+
+    def thumbnails(self, page, archive=None):
+        images = self.read(page)
+        if images is not None:
+            return images
+        # Take the stamp before reading, so a page that's saved meanwhile isn't stamped with the old preview.
+        try:
+            stamp = self.stamp(page)
+        except OSError:
+            return []
+        kra = archive
+        if kra is None:
+            kra = zipfile.ZipFile(page, "r")
+        preview = None
+        if "preview.png" in kra.namelist():
+            preview = QImage.fromData(kra.read("preview.png"))
+        if archive is None:
+            kra.close()
+        return self.write(page, preview, stamp)
+
+    """
+    Forget the thumbnails of a page, for when it changed.
+    """
+
+    def invalidate(self, page):
+        for size in self.sizes:
+            fileName = self.file_name(page, size)
+            if os.path.exists(fileName):
+                os.remove(fileName)
+
+    """
+    Make an icon with all the sizes of the thumbnails, so the pages list can pick the
+    one that fits the zoom level instead of scaling the big one.
+    """
+
+    def icon(self, images=[]):
+        icon = QIcon()
+        for image in images:
+            icon.addPixmap(QPixmap.fromImage(image))
+        return icon
@@ -26,6 +26,9 @@ http://acbf.wikia.com/wiki/ACBF_Specifications
 
 import os
 import re
+import base64
+import mimetypes
+from xml.sax.saxutils import quoteattr
 from PyQt5.QtCore import QDate, Qt, QPointF, QByteArray, QBuffer
 from PyQt5.QtGui import QImage, QColor, QFont, QRawFont
 from PyQt5.QtXml import QDomDocument, QDomElement, QDomText, QDomNodeList
@@ -88,7 +91,9 @@ def write_xml(configDictionary = {}, pageData = [],  pagesLocationList = [], loc
     
     translationFolder = configDictionary.get("translationLocation", "translations")
     fullTranslationPath = os.path.join(projectUrl, translationFolder)
-    poParser = po_parser.po_file_parser(fullTranslationPath, True)
+    # Translations that didn't change since the last export are read from the cache.
+    translationCache = os.path.join(projectUrl, configDictionary.get("exportLocation", str()), "metadata", "translation-cache.json")
+    poParser = po_parser.po_file_parser(fullTranslationPath, True, translationCache)
 
     bookInfo = document.createElement("book-info")
     if "authorList" in configDictionary.keys():
@@ -450,7 +455,7 @@ def write_xml(configDictionary = {}, pageData = [],  pagesLocationList = [], loc
         textLayer = document.createElement("text-layer")
         textLayer.setAttribute("lang", language)
         data = pageData[p]
-        transform = data["transform"]
+        transform = data["transforms"]["CBZ"]
         frameList = []
         listOfTextColors = []
         for v in data["vector"]:
@@ -653,35 +658,64 @@ def createStandAloneACBF(configDictionary, document = QDomDocument(), location =
     if (cover):
         pages.append(cover)
 
-    data = document.createElement("data")
-    root.appendChild(data)
+    # The pages are looked up by their file name, which is what the hrefs point at.
+    imageFiles = {}
+    for p in pagesLocationList:
+        imageFiles.setdefault(os.path.basename(p), p)
 
-    # Convert pages to base64 strings.
+    # Pages that share an image share the binary too.
+    binaries = []
     for i in range(0, len(pages)):
         image = pages[i].firstChildElement("image")
         href = image.attribute("href")
-        for p in pagesLocationList:
-            if href in p:
-                binary = document.createElement("binary")
-                binary.setAttribute("id", href)
-                imageFile = QImage()
-                imageFile.load(p)
-                imageData = QByteArray()
-                buffer = QBuffer(imageData)
-                imageFile.save(buffer, "PNG")
-                # For now always embed as png.
-                contentType = "image/png"
-                binary.setAttribute("content-type", contentType)
-                binary.appendChild(document.createTextNode(str(bytearray(imageData.toBase64()).decode("ascii"))))
-
-                image.setAttribute("href", "#" + href)
-                data.appendChild(binary)
-
+        if href in imageFiles.keys():
+            if href not in binaries:
+                binaries.append(href)
+            image.setAttribute("href", "#" + href)
+
+    # The document is written as usual, but the binaries are written into the
+    # data element one at a time, so only one chunk of a page is in memory at once.
+    text = document.toString(indent=2)
+    end = text.rfind("</ACBF>")
     f = open(location, 'w', newline="", encoding="utf-8")
-    f.write(document.toString(indent=2))
+    f.write(text[:end])
+    f.write("  <data>\n")
+    for href in binaries:
+        write_binary(f, href, imageFiles[href])
+    f.write("  </data>\n")
+    f.write(text[end:])
     f.close()
     return True
 
+"""
+Write a page image into a binary element as base64.
+
+Pages are embedded as they were saved, reading and encoding a chunk at a time.
+Only formats other than the ones ACBF viewers can show are converted to png first.
+"""
+
+def write_binary(f, href, location):
+    contentType = mimetypes.guess_type(location)[0]
+    f.write("    <binary id=" + quoteattr(href) + " content-type=")
+    if contentType in ["image/png", "image/jpeg", "image/gif", "image/webp"]:
+        f.write(quoteattr(contentType) + ">")
+        imageFile = open(location, "rb")
+        # A multiple of 3 bytes, so the chunks can be encoded separately.
+        chunk = imageFile.read(3 * 65536)
+        while len(chunk) > 0:
+            f.write(base64.b64encode(chunk).decode("ascii"))
+            chunk = imageFile.read(3 * 65536)
+        imageFile.close()
+    else:
+        f.write(quoteattr("image/png") + ">")
+        imageFile = QImage()
+        imageFile.load(location)
+        imageData = QByteArray()
+        buffer = QBuffer(imageData)
+        imageFile.save(buffer, "PNG")
+        f.write(str(bytearray(imageData.toBase64()).decode("ascii")))
+    f.write("</binary>\n")
+
 """
 Function to parse svg text to acbf ready text
 """
@@ -155,9 +155,11 @@ def write_xml(configDictionary = {}, pagesLocationList = [],  location = str()):
     covernumber = 0
     if "pages" in configDictionary.keys() and "cover" in configDictionary.keys():
         covernumber = configDictionary["pages"].index(configDictionary["cover"])
+    # Pages that share a file point at the same image in the archive.
+    imageIndex = {}
     for i in range(len(pagesLocationList)):
         page = document.createElement("Page")
-        page.setAttribute("Image", str(i))
+        page.setAttribute("Image", str(imageIndex.setdefault(pagesLocationList[i], len(imageIndex))))
         if i is covernumber:
             page.setAttribute("Type", "FrontCover")
         pages.appendChild(page)
@@ -23,11 +23,13 @@ Create an epub folder, finally, package to a epubzip.
 
 import shutil
 import os
+import io
+import hashlib
 from pathlib import Path
 import zipfile
-from PyQt5.QtXml import QDomDocument, QDomElement, QDomText, QDomNodeList
-from PyQt5.QtCore import Qt, QDateTime, QPointF
-from PyQt5.QtGui import QImage, QPolygonF, QColor
+from PyQt5.QtCore import Qt, QDateTime, QPointF, QByteArray
+from PyQt5.QtGui import QImage, QImageReader, QPolygonF, QColor
+from . import CPMT_xml_writer
 
 def export(configDictionary = {}, projectURL = str(), pagesLocationList = [], pageData = []):
     path = Path(os.path.join(projectURL, configDictionary["exportLocation"]))
@@ -39,7 +41,10 @@ def export(configDictionary = {}, projectURL = str(), pagesLocationList = [], pa
     # stylesPath = oebps / "Styles"
     textPath = oebps / "Text"
 
-    if exportPath.exists() is False:
+    # Either write everything into the EPUB-files folder first, or straight into the epub.
+    direct = configDictionary.get("EPUBdirect", False)
+
+    if exportPath.exists() is False and direct is False:
         exportPath.mkdir()
         metaInf.mkdir()
         oebps.mkdir()
@@ -60,35 +65,18 @@ def export(configDictionary = {}, projectURL = str(), pagesLocationList = [], pa
     url = str(path / str(title + ".epub"))
 
     # Create a zip file.
-    epubArchive = zipfile.ZipFile(url, mode="w", compression=zipfile.ZIP_STORED)
-
-    mimetype = open(str(Path(exportPath / "mimetype")), mode="w")
-    mimetype.write("application/epub+zip")
-    mimetype.close()
-    
-    # Write to zip.
-    epubArchive.write(Path(exportPath / "mimetype"), Path("mimetype"))
-
-    container = QDomDocument()
-    cRoot = container.createElement("container")
-    cRoot.setAttribute("version", "1.0")
-    cRoot.setAttribute("xmlns", "urn:oasis:names:tc:opendocument:xmlns:container")
-    container.appendChild(cRoot)
-    rootFiles = container.createElement("rootfiles")
-    rootfile = container.createElement("rootfile")
-    rootfile.setAttribute("full-path", "OEBPS/content.opf")
-    rootfile.setAttribute("media-type", "application/oebps-package+xml")
-    rootFiles.appendChild(rootfile)
-    cRoot.appendChild(rootFiles)
-    
-    containerFileName = str(Path(metaInf / "container.xml"))
+    epubArchive = epub_package(url, exportPath, direct)
 
-    containerFile = open(containerFileName, 'w', newline="", encoding="utf-8")
-    containerFile.write(container.toString(indent=2))
-    containerFile.close()
-    
-    # Write to zip.
-    epubArchive.write(containerFileName, os.path.relpath(containerFileName, str(exportPath)))
+    epubArchive.add_mimetype()
+
+    containerFileName = str(Path(metaInf / "container.xml"))
+    containerFile = epubArchive.open(containerFileName)
+    container = CPMT_xml_writer.make_writer(containerFile, configDictionary.get("EPUBstreamingXML", True))
+    container.start("container", {"version": "1.0", "xmlns": "urn:oasis:names:tc:opendocument:xmlns:container"})
+    container.start("rootfiles")
+    container.element("rootfile", {"full-path": "OEBPS/content.opf", "media-type": "application/oebps-package+xml"})
+    container.close()
+    epubArchive.close(containerFileName, containerFile)
 
     # copyimages to images
     pagesList = []
@@ -97,12 +85,23 @@ def export(configDictionary = {}, projectURL = str(), pagesLocationList = [], pa
             coverNumber = configDictionary["pages"].index(configDictionary["cover"])
         else:
             coverNumber = 0
-        for p in pagesLocationList:
+        # Identical pages, like repeated blank pages, share a single image.
+        dedupe = configDictionary.get("EPUBdedupe", True)
+        imageForHash = {}
+        for i in range(len(pagesLocationList)):
+            p = pagesLocationList[i]
             if os.path.exists(p):
-                shutil.copy2(p, str(imagePath))
+                pageHash = None
+                if dedupe:
+                    pageHash = page_hash(p, pageData[i] if i < len(pageData) else {})
+                    if pageHash in imageForHash.keys():
+                        pagesList.append(imageForHash[pageHash])
+                        continue
                 filename = str(Path(imagePath / os.path.basename(p)))
+                epubArchive.add_image(p, filename)
                 pagesList.append(filename)
-                epubArchive.write(filename, os.path.relpath(filename, str(exportPath)))
+                if pageHash is not None:
+                    imageForHash[pageHash] = filename
         if len(pagesLocationList) >= coverNumber:
             coverpageurl = pagesList[coverNumber]
     else:
@@ -111,42 +110,28 @@ def export(configDictionary = {}, projectURL = str(), pagesLocationList = [], pa
 
     # for each image, make an xhtml file
     
+    # Write the documents as they go, unless the old way was asked for.
+    streaming = configDictionary.get("EPUBstreamingXML", True)
     htmlFiles = []
     listOfNavItems = {}
     listofSpreads = []
     regions = []
     for i in range(len(pagesList)):
         pageName = "Page" + str(i) + ".xhtml"
-        doc = QDomDocument()
-        html = doc.createElement("html")
-        doc.appendChild(html)
-        html.setAttribute("xmlns", "http://www.w3.org/1999/xhtml")
-        html.setAttribute("xmlns:epub", "http://www.idpf.org/2007/ops")
 
         # The viewport is a prerequisite to get pre-paginated
         # layouts working. We'll make the layout the same size
         # as the image.
-        
-        head = doc.createElement("head")
-        viewport = doc.createElement("meta")
-        viewport.setAttribute("name", "viewport")
-
-        img = QImage()
-        img.load(pagesLocationList[i])
-        w = img.width()
-        h = img.height()
+
+        w, h, img = page_image(pagesLocationList[i], pageData[i] if i < len(pageData) else {})
         
         widthHeight = "width="+str(w)+", height="+str(h)
         
-        viewport.setAttribute("content", widthHeight)
-        head.appendChild(viewport)
-        html.appendChild(head)
-        
         # Here, we process the region navigation data to percentages
         # because we have access here to the width and height of the viewport.
         
         data = pageData[i]
-        transform = data["transform"]
+        transform = data["transforms"]["EPUB"]
         for v in data["vector"]:
             pointsList = []
             dominantColor = QColor(Qt.white)
@@ -157,7 +142,10 @@ def export(configDictionary = {}, projectURL = str(), pagesLocationList = [], pa
                 newPoint = pixelPoint - offset
                 x = max(0, min(w, int(newPoint.x() * transform["scaleWidth"])))
                 y = max(0, min(h, int(newPoint.y() * transform["scaleHeight"])))
-                listOfColors.append(img.pixelColor(QPointF(x, y).toPoint()))
+                # Sample the color from the small version of the page.
+                proxyX = min(img.width() - 1, int(x * img.width() / max(w, 1)))
+                proxyY = min(img.height() - 1, int(y * img.height() / max(h, 1)))
+                listOfColors.append(img.pixelColor(proxyX, proxyY))
                 pointsList.append(QPointF((x/w)*100, (y/h)*100))
             regionType = "panel"
             if "text" in v.keys():
@@ -187,68 +175,152 @@ def export(configDictionary = {}, projectURL = str(), pagesLocationList = [], pa
         if "epub_spread" in data["keys"]:
             listofSpreads.append(str(Path(textPath / pageName)))
 
-        body = doc.createElement("body")
-
-        img = doc.createElement("img")
-        img.setAttribute("src", os.path.relpath(pagesList[i], str(textPath)))
-        body.appendChild(img)
-
-        html.appendChild(body)
-
         filename = str(Path(textPath / pageName))
-        docFile = open(filename, 'w', newline="", encoding="utf-8")
-        docFile.write(doc.toString(indent=2))
-        docFile.close()
-
-        if pagesList[i] == coverpageurl:
+        docFile = epubArchive.open(filename)
+        doc = CPMT_xml_writer.make_writer(docFile, streaming)
+        doc.start("html", {"xmlns": "http://www.w3.org/1999/xhtml", "xmlns:epub": "http://www.idpf.org/2007/ops"})
+        doc.start("head")
+        doc.element("meta", {"name": "viewport", "content": widthHeight})
+        doc.end()
+        doc.start("body")
+        doc.element("img", {"src": os.path.relpath(pagesList[i], str(textPath))})
+        doc.end()
+        doc.close()
+        epubArchive.close(filename, docFile)
+
+        if i == coverNumber:
             coverpagehtml = os.path.relpath(filename, str(oebps))
         htmlFiles.append(filename)
-        
-        # Write to zip.
-        epubArchive.write(filename, os.path.relpath(filename, str(exportPath)))
 
     # metadata
     
-    filename = write_opf_file(oebps, configDictionary, htmlFiles, pagesList, coverpageurl, coverpagehtml, listofSpreads)
-    epubArchive.write(filename, os.path.relpath(filename, str(exportPath)))
+    write_opf_file(epubArchive, oebps, configDictionary, htmlFiles, pagesList, coverpageurl, coverpagehtml, listofSpreads)
     
-    filename = write_region_nav_file(oebps, configDictionary, htmlFiles, regions)
-    epubArchive.write(filename, os.path.relpath(filename, str(exportPath)))
+    write_region_nav_file(epubArchive, oebps, configDictionary, htmlFiles, regions)
     
     # toc
-    filename = write_nav_file(oebps, configDictionary, htmlFiles, listOfNavItems)
-    epubArchive.write(filename, os.path.relpath(filename, str(exportPath)))
+    write_nav_file(epubArchive, oebps, configDictionary, htmlFiles, listOfNavItems)
     
-    filename = write_ncx_file(oebps, configDictionary, htmlFiles, listOfNavItems)
-    epubArchive.write(filename, os.path.relpath(filename, str(exportPath)))
+    write_ncx_file(epubArchive, oebps, configDictionary, htmlFiles, listOfNavItems)
     
-    epubArchive.close()
+    epubArchive.finish()
 
     return True
 
+"""
+The epub archive that is being written.
+
+Due the way EPUB verifies, the mimetype needs to be the first file in the zip, and it may not
+be compressed. Everything else is added as it's made. Normally each file is first written into
+the EPUB-files folder next to the epub and then copied into the zip, but when direct is on, the
+documents are written straight into the zip and the pages are read from where the export put
+them, so nothing is written twice.
+"""
+
+
+class epub_package():
+    archive = None
+    exportPath = None
+    direct = False
+
+    def __init__(self, url, exportPath, direct=False):
+        self.archive = zipfile.ZipFile(url, mode="w", compression=zipfile.ZIP_STORED)
+        self.exportPath = exportPath
+        self.direct = direct
+
+    def archive_name(self, filename):
+        return Path(os.path.relpath(filename, str(self.exportPath))).as_posix()
+
+    def add_mimetype(self):
+        if self.direct is False:
+            mimetype = open(str(Path(self.exportPath / "mimetype")), mode="w")
+            mimetype.write("application/epub+zip")
+            mimetype.close()
+        self.archive.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+
+    """
+    Add a page image. In the EPUB-files folder it's stored as filename.
+    """
+
+    def add_image(self, location, filename):
+        if self.direct:
+            self.archive.write(location, self.archive_name(filename))
+        else:
+            shutil.copy2(location, filename)
+            self.archive.write(filename, self.archive_name(filename))
+
+    """
+    Open a document to write into, close it with close() when it's written.
+    """
+
+    def open(self, filename):
+        if self.direct:
+            return io.TextIOWrapper(self.archive.open(self.archive_name(filename), mode="w"), encoding="utf-8", newline="")
+        return open(filename, 'w', newline="", encoding="utf-8")
+
+    def close(self, filename, file):
+        file.close()
+        if self.direct is False:
+            self.archive.write(filename, self.archive_name(filename))
+
+    def finish(self):
+        self.archive.close()
+
+"""
+Get the size of a page image and a small version of it to sample colors from.
+The exporter normally gives us both, otherwise only the header of the file is read
+for the size, and the image is decoded at a reduced size.
+
+@returns the width, height and the small image.
+"""
+
+
+def page_image(location, data = {}):
+    info = data.get("images", {}).get("EPUB", None)
+    if info is not None:
+        raw = QByteArray.fromBase64(info["proxy"].encode("ascii"))
+        proxy = QImage(bytes(raw), info["proxyWidth"], info["proxyHeight"], info["proxyWidth"] * 3, QImage.Format_RGB888).copy()
+        return info["width"], info["height"], proxy
+    reader = QImageReader(location)
+    size = reader.size()
+    if size.isValid():
+        reader.setScaledSize(size.scaled(256, 256, Qt.KeepAspectRatio))
+    proxy = reader.read()
+    if size.isValid() is False:
+        size = proxy.size()
+    return size.width(), size.height(), proxy
+
+"""
+Get the hash of a page image, from the page data if the exporter already calculated it.
+"""
+
+
+def page_hash(location, data = {}):
+    if "EPUB" in data.get("hashes", {}).keys():
+        return data["hashes"]["EPUB"]
+    fileHash = hashlib.sha1()
+    file = open(location, "rb")
+    fileHash.update(file.read())
+    file.close()
+    return fileHash.hexdigest()
+
 """
 Write OPF metadata file
 """
 
 
-def write_opf_file(path, configDictionary, htmlFiles, pagesList, coverpageurl, coverpagehtml, listofSpreads):
+def write_opf_file(epubArchive, path, configDictionary, htmlFiles, pagesList, coverpageurl, coverpagehtml, listofSpreads):
     
     # marc relators
     # This has several entries removed to reduce it to the most relevant entries.
     marcRelators = {"abr":i18n("Abridger"), "acp":i18n("Art copyist"), "act":i18n("Actor"), "adi":i18n("Art director"), "adp":i18n("Adapter"), "ann":i18n("Annotator"), "ant":i18n("Bibliographic antecedent"), "arc":i18n("Architect"), "ard":i18n("Artistic director"), "art":i18n("Artist"), "asn":i18n("Associated name"), "ato":i18n("Autographer"), "att":i18n("Attributed name"), "aud":i18n("Author of dialog"), "aut":i18n("Author"), "bdd":i18n("Binding designer"), "bjd":i18n("Bookjacket designer"), "bkd":i18n("Book designer"), "bkp":i18n("Book producer"), "blw":i18n("Blurb writer"), "bnd":i18n("Binder"), "bpd":i18n("Bookplate designer"), "bsl":i18n("Bookseller"), "cll":i18n("Calligrapher"), "clr":i18n("Colorist"), "cns":i18n("Censor"), "cov":i18n("Cover designer"), "cph":i18n("Copyright holder"), "cre":i18n("Creator"), "ctb":i18n("Contributor"), "cur":i18n("Curator"), "cwt":i18n("Commentator for written text"), "drm":i18n("Draftsman"), "dsr":i18n("Designer"), "dub":i18n("Dubious author"), "edt":i18n("Editor"), "etr":i18n("Etcher"), "exp":i18n("Expert"), "fnd":i18n("Funder"), "ill":i18n("Illustrator"), "ilu":i18n("Illuminator"), "ins":i18n("Inscriber"), "lse":i18n("Licensee"), "lso":i18n("Licensor"), "ltg":i18n("Lithographer"), "mdc":i18n("Metadata contact"), "oth":i18n("Other"), "own":i18n("Owner"), "pat":i18n("Patron"), "pbd":i18n("Publishing director"), "pbl":i18n("Publisher"), "prt":i18n("Printer"), "sce":i18n("Scenarist"), "scr":i18n("Scribe"), "spn":i18n("Sponsor"), "stl":i18n("Storyteller"), "trc":i18n("Transcriber"), "trl":i18n("Translator"), "tyd":i18n("Type designer"), "tyg":i18n("Typographer"), "wac":i18n("Writer of added commentary"), "wal":i18n("Writer of added lyrics"), "wam":i18n("Writer of accompanying material"), "wat":i18n("Writer of added text"), "win":i18n("Writer of introduction"), "wpr":i18n("Writer of preface"), "wst":i18n("Writer of supplementary textual content")}
     
     # opf file
-    opfFile = QDomDocument()
-    opfRoot = opfFile.createElement("package")
-    opfRoot.setAttribute("version", "3.0")
-    opfRoot.setAttribute("unique-identifier", "BookId")
-    opfRoot.setAttribute("xmlns", "http://www.idpf.org/2007/opf")
-    opfRoot.setAttribute("prefix", "rendition: http://www.idpf.org/vocab/rendition/#")
-    opfFile.appendChild(opfRoot)
-    
-    opfMeta = opfFile.createElement("metadata")
-    opfMeta.setAttribute("xmlns:dc", "http://purl.org/dc/elements/1.1/")
-    opfMeta.setAttribute("xmlns:dcterms", "http://purl.org/dc/terms/")
+    filename = str(Path(path / "content.opf"))
+    docFile = epubArchive.open(filename)
+    opfFile = CPMT_xml_writer.make_writer(docFile, configDictionary.get("EPUBstreamingXML", True))
+    opfFile.start("package", {"version": "3.0", "unique-identifier": "BookId", "xmlns": "http://www.idpf.org/2007/opf", "prefix": "rendition: http://www.idpf.org/vocab/rendition/#"})
+    opfFile.start("metadata", {"xmlns:dc": "http://purl.org/dc/elements/1.1/", "xmlns:dcterms": "http://purl.org/dc/terms/"})
 
     # EPUB metadata requires a title, language and uuid
 
@@ -256,69 +328,35 @@ def write_opf_file(path, configDictionary, htmlFiles, pagesList, coverpageurl, c
     if "language" in configDictionary.keys():
         langString = str(configDictionary["language"]).replace("_", "-")
     
-    bookLang = opfFile.createElement("dc:language")
-    bookLang.appendChild(opfFile.createTextNode(langString))
-    opfMeta.appendChild(bookLang)
+    opfFile.element("dc:language", {}, langString)
 
-    bookTitle = opfFile.createElement("dc:title")
+    titleString = "Comic with no Name"
     if "title" in configDictionary.keys():
-        bookTitle.appendChild(opfFile.createTextNode(str(configDictionary["title"])))
-    else:
-        bookTitle.appendChild(opfFile.createTextNode("Comic with no Name"))
-    opfMeta.appendChild(bookTitle)
+        titleString = str(configDictionary["title"])
     
     # Generate series title and the like here too.
     if "seriesName" in configDictionary.keys():
-        bookTitle.setAttribute("id", "main")
-
-        refine = opfFile.createElement("meta")
-        refine.setAttribute("refines", "#main")
-        refine.setAttribute("property", "title-type")
-        refine.appendChild(opfFile.createTextNode("main"))
-        opfMeta.appendChild(refine)
-
-        refine2 = opfFile.createElement("meta")
-        refine2.setAttribute("refines", "#main")
-        refine2.setAttribute("property", "display-seq")
-        refine2.appendChild(opfFile.createTextNode("1"))
-        opfMeta.appendChild(refine2)
-
-        seriesTitle = opfFile.createElement("dc:title")
-        seriesTitle.appendChild(opfFile.createTextNode(str(configDictionary["seriesName"])))
-        seriesTitle.setAttribute("id", "series")
-        opfMeta.appendChild(seriesTitle)
-
-        refineS = opfFile.createElement("meta")
-        refineS.setAttribute("refines", "#series")
-        refineS.setAttribute("property", "title-type")
-        refineS.appendChild(opfFile.createTextNode("collection"))
-        opfMeta.appendChild(refineS)
-
-        refineS2 = opfFile.createElement("meta")
-        refineS2.setAttribute("refines", "#series")
-        refineS2.setAttribute("property", "display-seq")
-        refineS2.appendChild(opfFile.createTextNode("2"))
-        opfMeta.appendChild(refineS2)
+        opfFile.element("dc:title", {"id": "main"}, titleString)
+        opfFile.element("meta", {"refines": "#main", "property": "title-type"}, "main")
+        opfFile.element("meta", {"refines": "#main", "property": "display-seq"}, "1")
+
+        opfFile.element("dc:title", {"id": "series"}, str(configDictionary["seriesName"]))
+        opfFile.element("meta", {"refines": "#series", "property": "title-type"}, "collection")
+        opfFile.element("meta", {"refines": "#series", "property": "display-seq"}, "2")
 
         if "seriesNumber" in configDictionary.keys():
-            refineS3 = opfFile.createElement("meta")
-            refineS3.setAttribute("refines", "#series")
-            refineS3.setAttribute("property", "group-position")
-            refineS3.appendChild(opfFile.createTextNode(str(configDictionary["seriesNumber"])))
-            opfMeta.appendChild(refineS3)
+            opfFile.element("meta", {"refines": "#series", "property": "group-position"}, str(configDictionary["seriesNumber"]))
+    else:
+        opfFile.element("dc:title", {}, titleString)
 
     uuid = str(configDictionary["uuid"])
     uuid = uuid.strip("{")
     uuid = uuid.strip("}")
 
     # Append the id, and assign it as the bookID.
-    uniqueID = opfFile.createElement("dc:identifier")
-    uniqueID.appendChild(opfFile.createTextNode("urn:uuid:"+uuid))
-    uniqueID.setAttribute("id", "BookId")
-    opfMeta.appendChild(uniqueID)
+    opfFile.element("dc:identifier", {"id": "BookId"}, "urn:uuid:"+uuid)
 
     if "authorList" in configDictionary.keys():
-        authorEntry = 0
         for authorE in range(len(configDictionary["authorList"])):
             authorDict = configDictionary["authorList"][authorE]
             authorType = "dc:creator"
@@ -326,7 +364,6 @@ def write_opf_file(path, configDictionary, htmlFiles, pagesList, coverpageurl, c
                 # This determines if someone was just a contributor, but might need a more thorough version.
                 if str(authorDict["role"]).lower() in ["editor", "assistant editor", "proofreader", "beta", "patron", "funder"]:
                     authorType = "dc:contributor"
-            author = opfFile.createElement(authorType)
             authorName = []
             if "last-name" in authorDict.keys():
                 authorName.append(authorDict["last-name"])
@@ -336,76 +373,49 @@ def write_opf_file(path, configDictionary, htmlFiles, pagesList, coverpageurl, c
                 authorName.append(authorDict["initials"])
             if "nickname" in authorDict.keys():
                 authorName.append("(" + authorDict["nickname"] + ")")
-            author.appendChild(opfFile.createTextNode(", ".join(authorName)))
-            author.setAttribute("id", "cre" + str(authorE))
-            opfMeta.appendChild(author)
+            opfFile.element(authorType, {"id": "cre" + str(authorE)}, ", ".join(authorName))
             if "role" in authorDict.keys():
-                role = opfFile.createElement("meta")
-                role.setAttribute("refines", "#cre" + str(authorE))
-                role.setAttribute("scheme", "marc:relators")
-                role.setAttribute("property", "role")
                 roleString = str(authorDict["role"])
                 if roleString in marcRelators.values() or roleString in marcRelators.keys():
                     i = list(marcRelators.values()).index(roleString)
                     roleString = list(marcRelators.keys())[i]
                 else:
                     roleString = "oth"
-                role.appendChild(opfFile.createTextNode(roleString))
-                opfMeta.appendChild(role)
-            refine = opfFile.createElement("meta")
-            refine.setAttribute("refines", "#cre"+str(authorE))
-            refine.setAttribute("property", "display-seq")
-            refine.appendChild(opfFile.createTextNode(str(authorE+1)))
-            opfMeta.appendChild(refine)
+                opfFile.element("meta", {"refines": "#cre" + str(authorE), "scheme": "marc:relators", "property": "role"}, roleString)
+            opfFile.element("meta", {"refines": "#cre"+str(authorE), "property": "display-seq"}, str(authorE+1))
 
     if "publishingDate" in configDictionary.keys():
-        date = opfFile.createElement("dc:date")
-        date.appendChild(opfFile.createTextNode(configDictionary["publishingDate"]))
-        opfMeta.appendChild(date)
+        opfFile.element("dc:date", {}, configDictionary["publishingDate"])
     
     #Creation date
-    modified = opfFile.createElement("meta")
-    modified.setAttribute("property", "dcterms:modified")
-    modified.appendChild(opfFile.createTextNode(QDateTime.currentDateTimeUtc().toString(Qt.ISODate)))
-    opfMeta.appendChild(modified)
+    opfFile.element("meta", {"property": "dcterms:modified"}, QDateTime.currentDateTimeUtc().toString(Qt.ISODate))
     
     if "source" in configDictionary.keys():
         if len(configDictionary["source"])>0:
-            source = opfFile.createElement("dc:source")
-            source.appendChild(opfFile.createTextNode(configDictionary["source"]))
-            opfMeta.appendChild(source)
+            opfFile.element("dc:source", {}, configDictionary["source"])
     
-    description = opfFile.createElement("dc:description")
     if "summary" in configDictionary.keys():
-        description.appendChild(opfFile.createTextNode(configDictionary["summary"]))
+        opfFile.element("dc:description", {}, configDictionary["summary"])
     else:
-        description.appendChild(opfFile.createTextNode("There was no summary upon generation of this file."))
-    opfMeta.appendChild(description)
+        opfFile.element("dc:description", {}, "There was no summary upon generation of this file.")
 
     # Type can be dictionary or index, or one of those edupub thingies. Not necessary for comics.
-    # typeE = opfFile.createElement("dc:type")
-    # opfMeta.appendChild(typeE)
+    # opfFile.element("dc:type")
     
     if "publisherName" in configDictionary.keys():
-        publisher = opfFile.createElement("dc:publisher")
-        publisher.appendChild(opfFile.createTextNode(configDictionary["publisherName"]))
-        opfMeta.appendChild(publisher)
+        opfFile.element("dc:publisher", {}, configDictionary["publisherName"])
     
     
     if "isbn-number" in configDictionary.keys():
         isbnnumber = configDictionary["isbn-number"]
 
         if len(isbnnumber)>0:
-            publishISBN = opfFile.createElement("dc:identifier")
-            publishISBN.appendChild(opfFile.createTextNode(str("urn:isbn:") + isbnnumber))
-            opfMeta.appendChild(publishISBN)
+            opfFile.element("dc:identifier", {}, str("urn:isbn:") + isbnnumber)
 
     if "license" in configDictionary.keys():
 
         if len(configDictionary["license"])>0:
-            rights = opfFile.createElement("dc:rights")
-            rights.appendChild(opfFile.createTextNode(configDictionary["license"]))
-            opfMeta.appendChild(rights)
+            opfFile.element("dc:rights", {}, configDictionary["license"])
     
     """
     Not handled
@@ -426,117 +436,77 @@ def write_opf_file(path, configDictionary, htmlFiles, pagesList, coverpageurl, c
         if isinstance(configDictionary["genre"], dict):
             genreListConf = configDictionary["genre"].keys()
         for g in genreListConf:
-            subject = opfFile.createElement("dc:subject")
-            subject.appendChild(opfFile.createTextNode(g))
-            opfMeta.appendChild(subject)
+            opfFile.element("dc:subject", {}, g)
     if "characters" in configDictionary.keys():
         for name in configDictionary["characters"]:
-            char = opfFile.createElement("dc:subject")
-            char.appendChild(opfFile.createTextNode(name))
-            opfMeta.appendChild(char)
+            opfFile.element("dc:subject", {}, name)
     if "format" in configDictionary.keys():
         for formatF in configDictionary["format"]:
-            f = opfFile.createElement("dc:subject")
-            f.appendChild(opfFile.createTextNode(formatF))
-            opfMeta.appendChild(f)
+            opfFile.element("dc:subject", {}, formatF)
     if "otherKeywords" in configDictionary.keys():
         for key in configDictionary["otherKeywords"]:
-            word = opfFile.createElement("dc:subject")
-            word.appendChild(opfFile.createTextNode(key))
-            opfMeta.appendChild(word)
+            opfFile.element("dc:subject", {}, key)
 
     # Pre-pagination and layout
     # Comic are always prepaginated.
     
-    elLayout = opfFile.createElement("meta")
-    elLayout.setAttribute("property", "rendition:layout")
-    elLayout.appendChild(opfFile.createTextNode("pre-paginated"))
-    opfMeta.appendChild(elLayout)
+    opfFile.element("meta", {"property": "rendition:layout"}, "pre-paginated")
     
     # We should figure out if the pages are portrait or not...
-    elOrientation = opfFile.createElement("meta")
-    elOrientation.setAttribute("property", "rendition:orientation")
-    elOrientation.appendChild(opfFile.createTextNode("portrait"))
-    opfMeta.appendChild(elOrientation)
+    opfFile.element("meta", {"property": "rendition:orientation"}, "portrait")
     
-    elSpread = opfFile.createElement("meta")
-    elSpread.setAttribute("property", "rendition:spread")
-    elSpread.appendChild(opfFile.createTextNode("landscape"))
-    opfMeta.appendChild(elSpread)
+    opfFile.element("meta", {"property": "rendition:spread"}, "landscape")
     
-    opfRoot.appendChild(opfMeta)
+    opfFile.end()
     
     # Manifest
 
-    opfManifest = opfFile.createElement("manifest")
-    toc = opfFile.createElement("item")
-    toc.setAttribute("id", "ncx")
-    toc.setAttribute("href", "toc.ncx")
-    toc.setAttribute("media-type", "application/x-dtbncx+xml")
-    opfManifest.appendChild(toc)
-    
-    region = opfFile.createElement("item")
-    region.setAttribute("id", "regions")
-    region.setAttribute("href", "region-nav.xhtml")
-    region.setAttribute("media-type", "application/xhtml+xml")
-    region.setAttribute("properties", "data-nav") # Set the propernavmap to use this later)
-    opfManifest.appendChild(region)
-    
-    nav = opfFile.createElement("item")
-    nav.setAttribute("id", "nav")
-    nav.setAttribute("href", "nav.xhtml")
-    nav.setAttribute("media-type", "application/xhtml+xml")
-    nav.setAttribute("properties", "nav") # Set the propernavmap to use this later)
-    opfManifest.appendChild(nav)
+    opfFile.start("manifest")
+    opfFile.element("item", {"id": "ncx", "href": "toc.ncx", "media-type": "application/x-dtbncx+xml"})
+    
+    # Set the propernavmap to use this later
+    opfFile.element("item", {"id": "regions", "href": "region-nav.xhtml", "media-type": "application/xhtml+xml", "properties": "data-nav"})
+    
+    opfFile.element("item", {"id": "nav", "href": "nav.xhtml", "media-type": "application/xhtml+xml", "properties": "nav"})
     
     ids = 0
-    for p in pagesList:
-        item = opfFile.createElement("item")
-        item.setAttribute("id", "img"+str(ids))
+    # Shared images are only listed once.
+    for p in list(dict.fromkeys(pagesList)):
+        item = {"id": "img"+str(ids), "href": os.path.relpath(p, str(path)), "media-type": "image/png"}
         ids +=1
-        item.setAttribute("href", os.path.relpath(p, str(path)))
-        item.setAttribute("media-type", "image/png")
         if os.path.basename(p) == os.path.basename(coverpageurl):
-            item.setAttribute("properties", "cover-image")
-        opfManifest.appendChild(item)
+            item["properties"] = "cover-image"
+        opfFile.element("item", item)
 
 
     ids = 0
     for p in htmlFiles:
-        item = opfFile.createElement("item")
-        item.setAttribute("id", "p"+str(ids))
+        opfFile.element("item", {"id": "p"+str(ids), "href": os.path.relpath(p, str(path)), "media-type": "application/xhtml+xml"})
         ids +=1
-        item.setAttribute("href", os.path.relpath(p, str(path)))
-        item.setAttribute("media-type", "application/xhtml+xml")
-        opfManifest.appendChild(item)
     
-
-    opfRoot.appendChild(opfManifest)
+    opfFile.end()
     
     # Spine
 
-    opfSpine = opfFile.createElement("spine")
     # this sets the table of contents to use the ncx file
-    opfSpine.setAttribute("toc", "ncx")
+    spine = {"toc": "ncx"}
     # Reading Direction:
 
     spreadRight = True
     direction = 0
     if "readingDirection" in configDictionary.keys():
-        if configDictionary["readingDirection"] is "rightToLeft":
-            opfSpine.setAttribute("page-progression-direction", "rtl")
+        if configDictionary["readingDirection"] == "rightToLeft":
+            spine["page-progression-direction"] = "rtl"
             spreadRight = False
             direction = 1
         else:
-            opfSpine.setAttribute("page-progression-direction", "ltr")
+            spine["page-progression-direction"] = "ltr"
+    opfFile.start("spine", spine)
 
     # Here we'd need to switch between the two and if spread keywrod use neither but combine with spread-none
     
     ids = 0
     for p in htmlFiles:
-        item = opfFile.createElement("itemref")
-        item.setAttribute("idref", "p"+str(ids))
-        ids +=1
         props = []
         if p in listofSpreads:
             # Put this one in the center.
@@ -556,73 +526,58 @@ def write_opf_file(path, configDictionary, htmlFiles, pagesList, coverpageurl, c
             else:
                 props.append("page-spread-left")
                 spreadRight = True
-        item.setAttribute("properties", " ".join(props))
-        opfSpine.appendChild(item)
-    opfRoot.appendChild(opfSpine)
+        opfFile.element("itemref", {"idref": "p"+str(ids), "properties": " ".join(props)})
+        ids +=1
+    opfFile.end()
 
     # Guide
     
-    opfGuide = opfFile.createElement("guide")
+    opfFile.start("guide")
     if coverpagehtml is not None and coverpagehtml.isspace() is False and len(coverpagehtml) > 0:
-        item = opfFile.createElement("reference")
-        item.setAttribute("type", "cover")
-        item.setAttribute("title", "Cover")
-        item.setAttribute("href", coverpagehtml)
-        opfGuide.appendChild(item)
-    opfRoot.appendChild(opfGuide)
-
-    docFile = open(str(Path(path / "content.opf")), 'w', newline="", encoding="utf-8")
-    docFile.write(opfFile.toString(indent=2))
-    docFile.close()
-    return str(Path(path / "content.opf"))
+        opfFile.element("reference", {"type": "cover", "title": "Cover", "href": coverpagehtml})
+    opfFile.end()
+
+    opfFile.close()
+    epubArchive.close(filename, docFile)
+    return filename
 
 """
 Write a region navmap file.
 """
 
-def write_region_nav_file(path, configDictionary, htmlFiles, regions = []):
-    navDoc = QDomDocument()
-    navRoot = navDoc.createElement("html")
-    navRoot.setAttribute("xmlns", "http://www.w3.org/1999/xhtml")
-    navRoot.setAttribute("xmlns:epub", "http://www.idpf.org/2007/ops")
-    navDoc.appendChild(navRoot)
-    
-    head = navDoc.createElement("head")
-    title = navDoc.createElement("title")
-    title.appendChild(navDoc.createTextNode("Region Navigation"))
-    head.appendChild(title)
-    navRoot.appendChild(head)
+def write_region_nav_file(epubArchive, path, configDictionary, htmlFiles, regions = []):
+    filename = str(Path(path / "region-nav.xhtml"))
+    navFile = epubArchive.open(filename)
+    navDoc = CPMT_xml_writer.make_writer(navFile, configDictionary.get("EPUBstreamingXML", True))
+    navDoc.start("html", {"xmlns": "http://www.w3.org/1999/xhtml", "xmlns:epub": "http://www.idpf.org/2007/ops"})
     
-    body = navDoc.createElement("body")
-    navRoot.appendChild(body)
+    navDoc.start("head")
+    navDoc.element("title", {}, "Region Navigation")
+    navDoc.end()
     
-    nav = navDoc.createElement("nav")
-    nav.setAttribute("epub:type", "region-based")
-    nav.setAttribute("prefix", "ahl: http://idpf.org/epub/vocab/ahl")
-    body.appendChild(nav)
+    navDoc.start("body")
+    navDoc.start("nav", {"epub:type": "region-based", "prefix": "ahl: http://idpf.org/epub/vocab/ahl"})
     
     # Let's write the panels and balloons down now.
     
-    olPanels = navDoc.createElement("ol")
+    textRegions = {}
+    for region in regions:
+        if region["type"] == "text":
+            textRegions.setdefault(region["page"], []).append(region)
+
+    navDoc.start("ol")
     for region in regions:
         if region["type"] == "panel":
             pageName = os.path.relpath(region["page"], str(path))
-            print("accessing panel")
-            li = navDoc.createElement("li")
-            li.setAttribute("epub:type", "panel")
+            navDoc.start("li", {"epub:type": "panel"})
             
-            anchor = navDoc.createElement("a")
             bounds = region["points"]
-            anchor.setAttribute("href", pageName+"#xywh=percent:"+str(bounds.x())+","+str(bounds.y())+","+str(bounds.width())+","+str(bounds.height()))
+            navDoc.start("a", {"href": pageName+"#xywh=percent:"+str(bounds.x())+","+str(bounds.y())+","+str(bounds.width())+","+str(bounds.height())})
             
             if len(region["primaryColor"])>0:
-                primaryC = navDoc.createElement("meta")
-                primaryC.setAttribute("property","ahl:primary-color")
-                primaryC.setAttribute("content", region["primaryColor"])
-                anchor.appendChild(primaryC)
+                navDoc.element("meta", {"property": "ahl:primary-color", "content": region["primaryColor"]})
             
-            li.appendChild(anchor)
-            olBalloons = navDoc.createElement("ol")
+            navDoc.end()
             
             """
             The region nav spec specifies that we should have text-areas/balloons as a refinement on
@@ -631,27 +586,21 @@ def write_region_nav_file(path, configDictionary, htmlFiles, regions = []):
             checking whether the center point is inside the panel because some comics have balloons
             that overlap the gutters.
             """
-            for balloon in regions:
-                if balloon["type"] == "text" and balloon["page"] == region["page"] and bounds.contains(balloon["points"].center()):
-                    liBalloon = navDoc.createElement("li")
-                    liBalloon.setAttribute("epub:type", "text-area")
-
-                    anchorBalloon = navDoc.createElement("a")
+            balloons = [balloon for balloon in textRegions.get(region["page"], []) if bounds.contains(balloon["points"].center())]
+            if len(balloons) > 0:
+                navDoc.start("ol")
+                for balloon in balloons:
                     BBounds = balloon["points"]
-                    anchorBalloon.setAttribute("href", pageName+"#xywh=percent:"+str(BBounds.x())+","+str(BBounds.y())+","+str(BBounds.width())+","+str(BBounds.height()))
-
-                    liBalloon.appendChild(anchorBalloon)
-                    olBalloons.appendChild(liBalloon)
+                    navDoc.start("li", {"epub:type": "text-area"})
+                    navDoc.element("a", {"href": pageName+"#xywh=percent:"+str(BBounds.x())+","+str(BBounds.y())+","+str(BBounds.width())+","+str(BBounds.height())})
+                    navDoc.end()
+                navDoc.end()
+            navDoc.end()
+    navDoc.end()
 
-            if olBalloons.hasChildNodes():
-                li.appendChild(olBalloons)
-            olPanels.appendChild(li)
-    nav.appendChild(olPanels)
-
-    navFile = open(str(Path(path / "region-nav.xhtml")), 'w', newline="", encoding="utf-8")
-    navFile.write(navDoc.toString(indent=2))
-    navFile.close()
-    return str(Path(path / "region-nav.xhtml"))
+    navDoc.close()
+    epubArchive.close(filename, navFile)
+    return filename
 
 """
 Write XHTML nav file.
@@ -664,68 +613,46 @@ This function will both create a table of contents, using the
 "acbf_title" feature, as well as a regular pageslist.
 """
 
-def write_nav_file(path, configDictionary, htmlFiles, listOfNavItems):
-    navDoc = QDomDocument()
-    navRoot = navDoc.createElement("html")
-    navRoot.setAttribute("xmlns", "http://www.w3.org/1999/xhtml")
-    navRoot.setAttribute("xmlns:epub", "http://www.idpf.org/2007/ops")
-    navDoc.appendChild(navRoot)
+def write_nav_file(epubArchive, path, configDictionary, htmlFiles, listOfNavItems):
+    filename = str(Path(path / "nav.xhtml"))
+    navFile = epubArchive.open(filename)
+    navDoc = CPMT_xml_writer.make_writer(navFile, configDictionary.get("EPUBstreamingXML", True))
+    navDoc.start("html", {"xmlns": "http://www.w3.org/1999/xhtml", "xmlns:epub": "http://www.idpf.org/2007/ops"})
     
-    head = navDoc.createElement("head")
-    title = navDoc.createElement("title")
-    title.appendChild(navDoc.createTextNode("Table of Contents"))
-    head.appendChild(title)
-    navRoot.appendChild(head)
+    navDoc.start("head")
+    navDoc.element("title", {}, "Table of Contents")
+    navDoc.end()
     
-    body = navDoc.createElement("body")
-    navRoot.appendChild(body)
+    navDoc.start("body")
     
     # The Table of Contents
     
-    toc = navDoc.createElement("nav")
-    toc.setAttribute("epub:type", "toc")
-    oltoc = navDoc.createElement("ol")
-    li = navDoc.createElement("li")
-    anchor = navDoc.createElement("a")
-    anchor.setAttribute("href", os.path.relpath(htmlFiles[0], str(path)))
-    anchor.appendChild(navDoc.createTextNode("Start"))
-    li.appendChild(anchor)
-    oltoc.appendChild(li)
+    navDoc.start("nav", {"epub:type": "toc"})
+    navDoc.start("ol")
+    navDoc.start("li")
+    navDoc.element("a", {"href": os.path.relpath(htmlFiles[0], str(path))}, "Start")
+    navDoc.end()
     for fileName in listOfNavItems.keys():
-        li = navDoc.createElement("li")
-        anchor = navDoc.createElement("a")
-        anchor.setAttribute("href", os.path.relpath(fileName, str(path)))
-        anchor.appendChild(navDoc.createTextNode(listOfNavItems[fileName]))
-        li.appendChild(anchor)
-        oltoc.appendChild(li)
-    
-    toc.appendChild(oltoc)
-    body.appendChild(toc)
+        navDoc.start("li")
+        navDoc.element("a", {"href": os.path.relpath(fileName, str(path))}, listOfNavItems[fileName])
+        navDoc.end()
+    navDoc.end()
+    navDoc.end()
     
     # The Pages List.
     
-    pageslist = navDoc.createElement("nav")
-    pageslist.setAttribute("epub:type", "page-list")
-    olpages = navDoc.createElement("ol")
-    
-    entry = 1
+    navDoc.start("nav", {"epub:type": "page-list"})
+    navDoc.start("ol")
     for i in range(len(htmlFiles)):
-        li = navDoc.createElement("li")
-        anchor = navDoc.createElement("a")
-        anchor.setAttribute("href", os.path.relpath(htmlFiles[1], str(path)))
-        anchor.appendChild(navDoc.createTextNode(str(i)))
-        li.appendChild(anchor)
-        olpages.appendChild(li)
-    pageslist.appendChild(olpages)
-    
-    body.appendChild(pageslist)
-    
-    
+        navDoc.start("li")
+        navDoc.element("a", {"href": os.path.relpath(htmlFiles[i], str(path))}, str(i))
+        navDoc.end()
+    navDoc.end()
+    navDoc.end()
 
-    navFile = open(str(Path(path / "nav.xhtml")), 'w', newline="", encoding="utf-8")
-    navFile.write(navDoc.toString(indent=2))
-    navFile.close()
-    return str(Path(path / "nav.xhtml"))
+    navDoc.close()
+    epubArchive.close(filename, navFile)
+    return filename
 
 """
 Write a NCX file.
@@ -734,14 +661,13 @@ This is the same as the navigation document above, but then
 for 2.0 backward compatibility.
 """
 
-def write_ncx_file(path, configDictionary, htmlFiles, listOfNavItems):
-    tocDoc = QDomDocument()
-    ncx = tocDoc.createElement("ncx")
-    ncx.setAttribute("version", "2005-1")
-    ncx.setAttribute("xmlns", "http://www.daisy.org/z3986/2005/ncx/")
-    tocDoc.appendChild(ncx)
+def write_ncx_file(epubArchive, path, configDictionary, htmlFiles, listOfNavItems):
+    filename = str(Path(path / "toc.ncx"))
+    docFile = epubArchive.open(filename)
+    tocDoc = CPMT_xml_writer.make_writer(docFile, configDictionary.get("EPUBstreamingXML", True))
+    tocDoc.start("ncx", {"version": "2005-1", "xmlns": "http://www.daisy.org/z3986/2005/ncx/"})
 
-    tocHead = tocDoc.createElement("head")
+    tocDoc.start("head")
     
     # NCX also has some meta values that are in the head.
     # They are shared with the opf metadata document.
@@ -749,92 +675,56 @@ def write_ncx_file(path, configDictionary, htmlFiles, listOfNavItems):
     uuid = str(configDictionary["uuid"])
     uuid = uuid.strip("{")
     uuid = uuid.strip("}")
-    metaID = tocDoc.createElement("meta")
-    metaID.setAttribute("content", uuid)
-    metaID.setAttribute("name", "dtb:uid")
-    tocHead.appendChild(metaID)
-    metaDepth = tocDoc.createElement("meta")
-    metaDepth.setAttribute("content", str(1))
-    metaDepth.setAttribute("name", "dtb:depth")
-    tocHead.appendChild(metaDepth)
-    metaTotal = tocDoc.createElement("meta")
-    metaTotal.setAttribute("content", str(len(htmlFiles)))
-    metaTotal.setAttribute("name", "dtb:totalPageCount")
-    tocHead.appendChild(metaTotal)
-    metaMax = tocDoc.createElement("meta")
-    metaMax.setAttribute("content", str(len(htmlFiles)))
-    metaMax.setAttribute("name", "dtb:maxPageNumber")
-    tocHead.appendChild(metaDepth)
-    ncx.appendChild(tocHead)
-
-    docTitle = tocDoc.createElement("docTitle")
-    text = tocDoc.createElement("text")
+    tocDoc.element("meta", {"content": uuid, "name": "dtb:uid"})
+    tocDoc.element("meta", {"content": str(1), "name": "dtb:depth"})
+    tocDoc.element("meta", {"content": str(len(htmlFiles)), "name": "dtb:totalPageCount"})
+    tocDoc.element("meta", {"content": str(len(htmlFiles)), "name": "dtb:maxPageNumber"})
+    tocDoc.end()
+
+    tocDoc.start("docTitle")
     if "title" in configDictionary.keys():
-        text.appendChild(tocDoc.createTextNode(str(configDictionary["title"])))
+        tocDoc.element("text", {}, str(configDictionary["title"]))
     else:
-        text.appendChild(tocDoc.createTextNode("Comic with no Name"))
-    docTitle.appendChild(text)
-    ncx.appendChild(docTitle)
+        tocDoc.element("text", {}, "Comic with no Name")
+    tocDoc.end()
     
     # The navmap is a table of contents.
 
-    navmap = tocDoc.createElement("navMap")
-    navPoint = tocDoc.createElement("navPoint")
-    navPoint.setAttribute("id", "navPoint-1")
-    navPoint.setAttribute("playOrder", "1")
-    navLabel = tocDoc.createElement("navLabel")
-    navLabelText = tocDoc.createElement("text")
-    navLabelText.appendChild(tocDoc.createTextNode("Start"))
-    navLabel.appendChild(navLabelText)
-    navContent = tocDoc.createElement("content")
-    navContent.setAttribute("src", os.path.relpath(htmlFiles[0], str(path)))
-    navPoint.appendChild(navLabel)
-    navPoint.appendChild(navContent)
-    navmap.appendChild(navPoint)
+    tocDoc.start("navMap")
+    tocDoc.start("navPoint", {"id": "navPoint-1", "playOrder": "1"})
+    tocDoc.start("navLabel")
+    tocDoc.element("text", {}, "Start")
+    tocDoc.end()
+    tocDoc.element("content", {"src": os.path.relpath(htmlFiles[0], str(path))})
+    tocDoc.end()
     entry = 1
     for fileName in listOfNavItems.keys():
         entry +=1
-        navPointT = tocDoc.createElement("navPoint")
-        navPointT.setAttribute("id", "navPoint-"+str(entry))
-        navPointT.setAttribute("playOrder", str(entry))
-        navLabelT = tocDoc.createElement("navLabel")
-        navLabelTText = tocDoc.createElement("text")
-        navLabelTText.appendChild(tocDoc.createTextNode(listOfNavItems[fileName]))
-        navLabelT.appendChild(navLabelTText)
-        navContentT = tocDoc.createElement("content")
-        navContentT.setAttribute("src", os.path.relpath(fileName, str(path)))
-        navPointT.appendChild(navLabelT)
-        navPointT.appendChild(navContentT)
-        navmap.appendChild(navPointT)
-    ncx.appendChild(navmap)
+        tocDoc.start("navPoint", {"id": "navPoint-"+str(entry), "playOrder": str(entry)})
+        tocDoc.start("navLabel")
+        tocDoc.element("text", {}, listOfNavItems[fileName])
+        tocDoc.end()
+        tocDoc.element("content", {"src": os.path.relpath(fileName, str(path))})
+        tocDoc.end()
+    tocDoc.end()
     
     # The pages list on the other hand just lists all pages.
     
-    pagesList = tocDoc.createElement("pageList")
-    navLabelPages = tocDoc.createElement("navLabel")
-    navLabelPagesText = tocDoc.createElement("text")
-    navLabelPagesText.appendChild(tocDoc.createTextNode("Pages"))
-    navLabelPages.appendChild(navLabelPagesText)
-    pagesList.appendChild(navLabelPages)
+    tocDoc.start("pageList")
+    tocDoc.start("navLabel")
+    tocDoc.element("text", {}, "Pages")
+    tocDoc.end()
     for i in range(len(htmlFiles)):
-        pageTarget = tocDoc.createElement("pageTarget")
-        pageTarget.setAttribute("type", "normal")
-        pageTarget.setAttribute("id", "page-"+str(i))
-        pageTarget.setAttribute("value", str(i))
-        navLabelPagesTarget = tocDoc.createElement("navLabel")
-        navLabelPagesTargetText = tocDoc.createElement("text")
-        navLabelPagesTargetText.appendChild(tocDoc.createTextNode(str(i+1)))
-        navLabelPagesTarget.appendChild(navLabelPagesTargetText)
-        pageTarget.appendChild(navLabelPagesTarget)
-        pageTargetContent = tocDoc.createElement("content")
-        pageTargetContent.setAttribute("src", os.path.relpath(htmlFiles[i], str(path)))
-        pageTarget.appendChild(pageTargetContent)
-        pagesList.appendChild(pageTarget)
-    ncx.appendChild(pagesList)
+        tocDoc.start("pageTarget", {"type": "normal", "id": "page-"+str(i), "value": str(i)})
+        tocDoc.start("navLabel")
+        tocDoc.element("text", {}, str(i+1))
+        tocDoc.end()
+        tocDoc.element("content", {"src": os.path.relpath(htmlFiles[i], str(path))})
+        tocDoc.end()
+    tocDoc.end()
 
     # Save the document.
 
-    docFile = open(str(Path(path / "toc.ncx")), 'w', newline="", encoding="utf-8")
-    docFile.write(tocDoc.toString(indent=2))
-    docFile.close()
-    return str(Path(path / "toc.ncx"))
+    tocDoc.close()
+    epubArchive.close(filename, docFile)
+    return filename
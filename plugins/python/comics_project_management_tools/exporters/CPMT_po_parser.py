@@ -19,101 +19,164 @@ along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
 
 """
 A thing that parses through POT files.
+
+Each po file is read once, line by line, into a dictionary of key to translations per
+language. The keys are normalised when the file is read, so looking them up is cheap.
+When given a cache location, the parsed files are kept in a json file there, and files
+that have the same modification time and size as last time aren't parsed again.
 """
 
 import sys
 import os
 import re
+import json
+
+tagRegExp = re.compile(r"\<.*?\>")
+spaceRegExp = re.compile(r"\s+")
+escapeRegExp = re.compile(r"\\([\"\'#])")
+# Bump this when the parsed entries change, so old caches are ignored.
+cacheVersion = 1
+
+"""
+Get the string inside the quotes of a po line, without the escapes for quotes and #.
+"""
+
+
+def unquote(string):
+    string = string.rstrip("\r\n")
+    if string.startswith("\""):
+        string = string[1:]
+    if string.endswith("\""):
+        string = string[:-1]
+    return escapeRegExp.sub("\\1", string)
+
 
 class po_file_parser():
     translationDict = {}
     translationList = []
     key_xml = False
+    cacheLocation = None
 
-    def __init__(self, translationLocation, key_xml = False):
+    def __init__(self, translationLocation, key_xml = False, cacheLocation = None):
+        self.translationDict = {}
+        self.translationList = []
+        self.normalisedKeys = {}
         self.key_xml = key_xml
+        self.cacheLocation = cacheLocation
+        cache = self.read_cache()
+        newCache = {}
         if os.path.exists(translationLocation):
             for entry in os.scandir(translationLocation):
                 if entry.name.endswith('.po') and entry.is_file():
-                    self.parse_pot(os.path.join(translationLocation, entry.name))
+                    location = os.path.join(translationLocation, entry.name)
+                    stat = entry.stat()
+                    catalog = cache.get(location, {})
+                    if catalog.get("mtime", None) != stat.st_mtime_ns or catalog.get("size", None) != stat.st_size:
+                        lang, entries = self.parse_pot(location)
+                        catalog = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "lang": lang, "entries": entries}
+                    self.add_catalog(catalog["lang"], catalog["entries"])
+                    newCache[location] = catalog
+        if newCache != cache:
+            self.write_cache(newCache)
+
+    """
+    Normalise a key the way the keys in the dictionary are.
+    """
+
+    def normalise(self, text):
+        if self.key_xml:
+            text = tagRegExp.sub(" ", text)
+            text = spaceRegExp.sub(" ", text).strip()
+        return text
+
+    """
+    Parse a po file.
+
+    @returns the language of the file, and a list of [key, entry] pairs.
+    """
 
     def parse_pot(self, location):
-        if (os.path.exists(location)):
-            file = open(location, "r", encoding="utf8")
-            lang = "en"
-            for line in file:
-                if line.startswith("\"Language: "):
-                    lang = line[len("\"Language: "):]
-                    lang = lang.replace('\\n\"\n', "")
+        lang = "en"
+        entries = []
+        if os.path.exists(location) is False:
+            return lang, entries
+        file = open(location, "r", encoding="utf8")
+        multiLine = ""
+        key = None
+        entry = {}
+
+        def addEntry(key, entry):
+            if len(entry.keys())>0:
+                if key is None:
+                    key = ""
+                if self.key_xml:
+                    key += self.normalise(entry.get("text", ""))
+                else:
+                    key += entry.get("text", "")
+                if len(key)>0:
+                    entries.append([key, entry])
+
+        for line in file:
+            if line.isspace() or len(line)<1:
+                addEntry(key, entry)
+                entry = {}
+                key = None
+                multiLine = ""
+            elif line.startswith("msgid "):
+                entry["text"] = unquote(line[len("msgid "):])
+                multiLine = "text"
+            elif line.startswith("msgstr "):
+                entry["trans"] = unquote(line[len("msgstr "):])
+                multiLine = "trans"
+            elif line.startswith("# "):
+                #Translator comment
+                entry["translComment"] = entry.get("translComment", "") + line.replace("# ", "")
+            elif line.startswith("#. "):
+                entry["extract"] = line.replace("#. ", "")
+            elif line.startswith("msgctxt "):
+                key = unquote(line[len("msgctxt "):]) + " "
+            elif line.startswith("\"") and len(multiLine)>0:
+                string = unquote(line)
+                entry[multiLine] += string
+                # The header entry says which language the file is.
+                if string.startswith("Language: ") and entry.get("text", None) == "":
+                    lang = string[len("Language: "):].replace("\\n", "").strip()
+        # ensure that the final entry gets added.
+        addEntry(key, entry)
+        file.close()
+        return lang, entries
+
+    def add_catalog(self, lang, entries):
+        for key, entry in entries:
+            self.translationDict.setdefault(key, {})[lang] = entry
+        if lang not in self.translationList:
+            self.translationList.append(lang)
+
+    def read_cache(self):
+        if self.cacheLocation is None or os.path.exists(self.cacheLocation) is False:
+            return {}
+        try:
+            file = open(self.cacheLocation, "r", newline="", encoding="utf-8")
+            cache = json.load(file)
             file.close()
-            file = open(location, "r", encoding="utf8")
-            multiLine = ""
-            key = None
-            entry = {}
-            
-            def addEntryToTranslationDict(key, entry, lang):
-                if len(entry.keys())>0:
-                    if key is None:
-                        key = ""
-                    if self.key_xml:
-                        text = entry.get("text", "")
-                        text = re.sub("\<.*?\>", " ", text)
-                        key += str(re.sub("\s+", " ", text)).strip()
-                    else:
-                        key += entry.get("text", None)
-                    if key is not None:
-                        if len(key)>0:
-                            dummyDict = {}
-                            dummyDict = self.translationDict.get(key, dummyDict)
-                            dummyDict[lang] = entry
-                            self.translationDict[key] = dummyDict
-            
-            for line in file:
-                if line.isspace() or len(line)<1:
-                    addEntryToTranslationDict(key, entry, lang)
-                    entry = {}
-                    key = None
-                    multiLine = ""
-                if line.startswith("msgid "):
-                    string = line[len("msgid \""):]
-                    string = string[:-len("\"\n")]
-                    string = string.replace("\\\"", "\"")
-                    string = string.replace("\\\'", "\'")
-                    string = string.replace("\\#", "#")
-                    entry["text"] = string
-                    multiLine = "text"
-                if line.startswith("msgstr "):
-                    string = line[len("msgstr \""):]
-                    string = string[:-len("\"\n")]
-                    string = string.replace("\\\"", "\"")
-                    string = string.replace("\\\'", "\'")
-                    string = string.replace("\\#", "#")
-                    entry["trans"] = string
-                    multiLine = "trans"
-                if line.startswith("# "):
-                    #Translator comment
-                    if "translComment" in entry.keys():
-                        entry["translComment"] += line.replace("# ", "")
-                    else:
-                        entry["translComment"] = line.replace("# ", "")
-                if line.startswith("#. "):
-                    entry["extract"] = line.replace("#. ", "")
-                if line.startswith("msgctxt "):
-                    key = line[len("msgctxt \""):]
-                    key = key[:-len("\"\n")]
-                    key += " "
-                if line.startswith("\"") and len(multiLine)>0:
-                    string = line[len("\""):]
-                    string = string[:-len("\"\n")]
-                    string = string.replace("\\\"", "\"")
-                    string = string.replace("\\\'", "\'")
-                    string = string.replace("\\#", "#")
-                    entry[multiLine] += string
-            # ensure that the final entry gets added.
-            addEntryToTranslationDict(key, entry, lang)
-            if lang not in self.translationList:
-                self.translationList.append(lang)
+        except (OSError, ValueError):
+            return {}
+        if cache.get("version", 0) != cacheVersion or cache.get("key_xml", None) != self.key_xml:
+            return {}
+        return cache.get("files", {})
+
+    def write_cache(self, files):
+        if self.cacheLocation is None:
+            return
+        cache = {"version": cacheVersion, "key_xml": self.key_xml, "files": files}
+        try:
+            os.makedirs(os.path.dirname(self.cacheLocation), exist_ok=True)
+            file = open(self.cacheLocation + ".part", "w", newline="", encoding="utf-8")
+            json.dump(cache, file, ensure_ascii=False)
             file.close()
+            os.replace(self.cacheLocation + ".part", self.cacheLocation)
+        except OSError as error:
+            print("CPMT: Could not write the translation cache", error)
 
     def get_translation_list(self):
         return self.translationList
@@ -121,12 +184,11 @@ class po_file_parser():
     def get_entry_for_key(self, key, lang):
         entry = {}
         entry["trans"] = " "
-        if self.key_xml:
-            key = re.sub("\<.*?\>", " ", key)
-            key = re.sub("\s+", " ", key)
-            key = key.strip()
+        # The same keys are looked up for every language, so remember how they normalise.
+        if key not in self.normalisedKeys.keys():
+            self.normalisedKeys[key] = self.normalise(key)
+        key = self.normalisedKeys[key]
         if key in self.translationDict.keys():
-            translations = {}
             translations = self.translationDict[key]
             if lang not in translations.keys():
                 print("language missing")
@@ -0,0 +1,119 @@
+"""
+Copyright (c) 2018 Wolthera van Hövell tot Westerflier <griffinvalley@gmail.com>
+
+This file is part of the Comics Project Management Tools(CPMT).
+
+CPMT is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+CPMT is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with the CPMT.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Writers for xml documents that are written from start to end, like the epub documents.
+
+The stream writer writes every element to the file as soon as it's started, so even a book
+with thousands of pages never has its whole document in memory. The dom writer builds a
+QDomDocument instead and writes it when closed, for when the streaming one can't be used.
+Both take the same calls and write the same document, indented by two spaces.
+"""
+
+from xml.sax.saxutils import XMLGenerator
+from PyQt5.QtXml import QDomDocument
+
+"""
+Make the writer for a file.
+
+@param file: an open text file, or anything else with a write function.
+@param streaming: whether to use the stream writer, or the dom writer.
+"""
+
+
+def make_writer(file, streaming=True):
+    if streaming:
+        return stream_writer(file)
+    return dom_writer(file)
+
+
+class stream_writer():
+
+    def __init__(self, file):
+        self.file = file
+        self.generator = XMLGenerator(file, encoding="utf-8", short_empty_elements=True)
+        self.generator.startDocument()
+        # For each open element, whether it has child elements, and whether it has text.
+        self.stack = []
+
+    def start(self, name, attributes={}):
+        if len(self.stack) > 0:
+            self.stack[-1][1] = True
+            if self.stack[-1][2] is False:
+                self.generator.ignorableWhitespace("\n" + "  " * len(self.stack))
+        self.generator.startElement(name, dict((key, str(attributes[key])) for key in attributes.keys()))
+        self.stack.append([name, False, False])
+
+    def text(self, text):
+        self.stack[-1][2] = True
+        self.generator.characters(str(text))
+
+    def end(self):
+        name, hasChildren, hasText = self.stack.pop()
+        if hasChildren and hasText is False:
+            self.generator.ignorableWhitespace("\n" + "  " * len(self.stack))
+        self.generator.endElement(name)
+
+    """
+    Write an element with only text, or nothing at all, in it.
+    """
+
+    def element(self, name, attributes={}, text=None):
+        self.start(name, attributes)
+        if text is not None:
+            self.text(text)
+        self.end()
+
+    def close(self):
+        while len(self.stack) > 0:
+            self.end()
+        self.generator.ignorableWhitespace("\n")
+        self.generator.endDocument()
+
+
+class dom_writer():
+
+    def __init__(self, file):
+        self.file = file
+        self.document = QDomDocument()
+        self.document.appendChild(self.document.createProcessingInstruction("xml", "version=\"1.0\" encoding=\"utf-8\""))
+        self.stack = [self.document]
+
+    def start(self, name, attributes={}):
+        element = self.document.createElement(name)
+        for key in attributes.keys():
+            element.setAttribute(key, str(attributes[key]))
+        self.stack[-1].appendChild(element)
+        self.stack.append(element)
+
+    def text(self, text):
+        self.stack[-1].appendChild(self.document.createTextNode(str(text)))
+
+    def end(self):
+        self.stack.pop()
+
+    def element(self, name, attributes={}, text=None):
+        self.start(name, attributes)
+        if text is not None:
+            self.text(text)
+        self.end()
+
+    def close(self):
+        self.stack = [self.document]
+        self.file.write(self.document.toString(indent=2))